@@ -11,9 +11,92 @@ DB_CONFIG = {
     "dbname": os.getenv("DB_NAME")
 }
 
+# Pool de connexions partagé par tous les services (voir app/database.py)
+DB_POOL_CONFIG = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+}
+
+# Ingestion parallèle (dossiers / backfills mensuels)
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", str(os.cpu_count() or 1)))
+# Connexions DB de l'ensemble des workers : chaque worker en ouvre jusqu'à
+# INGEST_WORKER_CONNECTIONS (ingestion_service), ce qui borne leur nombre
+INGEST_MAX_DB_CONNECTIONS = int(os.getenv("INGEST_MAX_DB_CONNECTIONS", "12"))
+# Taille des segments validés par checkpoint (reprise après arrêt) ; 0 = une seule transaction
+INGEST_CHECKPOINT_BYTES = int(os.getenv("INGEST_CHECKPOINT_BYTES", str(32 * 1024 * 1024)))
+
+# Jobs d'ingestion en arrière-plan (API)
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", "2"))
+INGEST_JOB_QUEUE_SIZE = int(os.getenv("INGEST_JOB_QUEUE_SIZE", "100"))  # jobs en attente max
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "200"))        # jobs conservés pour consultation
+# État des jobs persisté (table ingest_jobs) : progression enregistrée toutes les
+# INGEST_JOB_HEARTBEAT_S secondes ; sans battement depuis INGEST_JOB_STALE_S, un job
+# en file ou en cours est considéré interrompu (processus arrêté ou redémarré)
+INGEST_JOB_HEARTBEAT_S = float(os.getenv("INGEST_JOB_HEARTBEAT_S", "10"))
+INGEST_JOB_STALE_S = int(os.getenv("INGEST_JOB_STALE_S", "60"))
+
+# Tâches planifiées avec plusieurs workers uvicorn :
+#   "leader" → un seul processus les exécute, élu par verrou consultatif PostgreSQL
+#   "always" → chaque processus (déploiement à un seul worker)
+#   "off"    → aucune dans ce processus
+SCHEDULER_MODE = os.getenv("SCHEDULER_MODE", "leader")
+SCHEDULER_LOCK_NAME = os.getenv("SCHEDULER_LOCK_NAME", "incoming-api:scheduler")
+SCHEDULER_ELECTION_INTERVAL_S = float(os.getenv("SCHEDULER_ELECTION_INTERVAL_S", "15"))
+
+# Nouvelles tentatives différées (fichier verrouillé, connexion coupée) :
+# délai exponentiel borné, jitter (fraction du délai retirée au hasard)
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "8"))
+RETRY_BASE_DELAY_S = int(os.getenv("RETRY_BASE_DELAY_S", "120"))
+RETRY_MAX_DELAY_S = int(os.getenv("RETRY_MAX_DELAY_S", "3600"))
+RETRY_JITTER = float(os.getenv("RETRY_JITTER", "0.3"))
+
+# Partitionnement mensuel de la table d'appels : clé, et mois créés à l'avance
+PARTITION_KEY = os.getenv("PARTITION_KEY", "datetime_appel")
+PARTITION_AHEAD_MONTHS = int(os.getenv("PARTITION_AHEAD_MONTHS", "2"))
+
+# Colonne de regroupement des tables de rollup (statistiques jour / semaine)
+STATS_GROUP_COLUMN = os.getenv("STATS_GROUP_COLUMN", "groupe")
+
+# Format du COPY d'ingestion : "csv" ou "binary" (COPY binaire PostgreSQL)
+COPY_FORMAT = os.getenv("COPY_FORMAT", "csv")
+
+# Cache disque des exports (LRU borné en taille)
+EXPORT_CACHE_ENABLED = os.getenv("EXPORT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", "./export_cache")
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+# Export Parquet partitionné (nécessite pyarrow)
+EXPORT_PARQUET_DIR = os.getenv("EXPORT_PARQUET_DIR", "./export_parquet")
+EXPORT_PARQUET_BATCH_SIZE = int(os.getenv("EXPORT_PARQUET_BATCH_SIZE", "50000"))
+
+# Lecture /query (NDJSON paginé par clé) : taille de page et lots du curseur serveur
+QUERY_DEFAULT_LIMIT = int(os.getenv("QUERY_DEFAULT_LIMIT", "1000"))
+QUERY_MAX_LIMIT = int(os.getenv("QUERY_MAX_LIMIT", "50000"))
+QUERY_FETCH_SIZE = int(os.getenv("QUERY_FETCH_SIZE", "2000"))
+
 TABLE_NAME = os.getenv("TABLE_NAME", "call_logs")
 VIEW_NAME = os.getenv("VIEW_NAME", "v_incoming_groupe_suivi")
 
+# Quarantaine des enregistrements rejetés : table, taille des lots COPY, et
+# longueur conservée de chaque enregistrement brut
+REJECTS_TABLE = os.getenv("REJECTS_TABLE", f"{TABLE_NAME}_rejects")
+REJECTS_BATCH_ROWS = int(os.getenv("REJECTS_BATCH_ROWS", "1000"))
+REJECTS_MAX_RECORD_BYTES = int(os.getenv("REJECTS_MAX_RECORD_BYTES", "8192"))
+
+# Moteur de parsing CSV :
+#   "c" / "pyarrow" → tokeniseur streaming qui retire COMMENTAIRE au niveau octets
+#   "python"        → ancien chemin (usecols / découpage ligne à ligne), pour comparaison
+CSV_ENGINE = os.getenv("CSV_ENGINE", "c")
+
+# Détection d'encodage : échantillon borné, encodages candidats (ordre de repli
+# en cours de lecture) et profils mémorisés par source
+ENCODING_SAMPLE_SIZE = int(os.getenv("ENCODING_SAMPLE_SIZE", "20000"))
+ENCODING_FALLBACKS = [e.strip() for e in os.getenv("ENCODING_FALLBACKS", "utf-8,cp1252,latin1").split(",") if e.strip()]
+ENCODING_PROFILES_PATH = os.getenv("ENCODING_PROFILES_PATH", "./encoding_profiles.json")
+
 SFTP_CONFIG = {
     "host": "41.188.35.93",
     "port": 2111,
@@ -22,3 +105,18 @@ SFTP_CONFIG = {
     "remote_dir": "/home/connecteo/files/Received/"
 }
 
+# Sessions SFTP réutilisées (keepalive, contrôle de santé après inactivité) et
+# lectures en pipeline : fenêtre préchargée, taille des requêtes READ, requêtes en vol
+SFTP_POOL_SIZE = int(os.getenv("SFTP_POOL_SIZE", "2"))
+SFTP_KEEPALIVE_S = int(os.getenv("SFTP_KEEPALIVE_S", "30"))
+SFTP_IDLE_TIMEOUT_S = int(os.getenv("SFTP_IDLE_TIMEOUT_S", "600"))
+SFTP_WINDOW_SIZE = int(os.getenv("SFTP_WINDOW_SIZE", str(8 * 1024 * 1024)))
+SFTP_MAX_PACKET_SIZE = int(os.getenv("SFTP_MAX_PACKET_SIZE", "32768"))
+SFTP_PREFETCH_WINDOW = int(os.getenv("SFTP_PREFETCH_WINDOW", str(8 * 1024 * 1024)))
+SFTP_REQUEST_SIZE = int(os.getenv("SFTP_REQUEST_SIZE", "32768"))
+SFTP_MAX_REQUESTS = int(os.getenv("SFTP_MAX_REQUESTS", "64"))
+
+# Surveillance du dossier SFTP : fichiers concernés et cache local (taille, mtime)
+SFTP_WATCH_PATTERN = os.getenv("SFTP_WATCH_PATTERN", "*_VocalCom_Incoming.csv")
+SFTP_WATCH_CACHE_PATH = os.getenv("SFTP_WATCH_CACHE_PATH", "./sftp_watch_cache.json")
+
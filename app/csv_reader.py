@@ -1,33 +1,46 @@
 # csv_reader.py
+import logging
 import pandas as pd
-from charset_normalizer.api import from_path
+from app.config import CSV_ENGINE, ENCODING_SAMPLE_SIZE, ENCODING_FALLBACKS
+from app.utils.csv_tokenizer import read_stripped_csv
+from app.utils.encoding import Utf8Transcoder, encoding_profiles, profile_source
+from app.utils.rejects import TOO_MANY_FIELDS
+from app.schema import CALL_LOGS
+from app.utils.stream_io import iter_blocks
+from app.utils import metrics
+
+logger = logging.getLogger("AUTO")
+
 
 class CSVReader:
-    def __init__(self, filepath, chunksize=50000, include_comment=False, encoding=None):
+    def __init__(self, filepath, chunksize=50000, include_comment=False, encoding=None, engine=None, source=None,
+                 rejects=None):
         self.filepath = filepath
         self.chunksize = chunksize
         self.include_comment = include_comment
+        self.engine = engine or CSV_ENGINE
+        self.rejects = rejects  # RejectSink : quarantaine des lignes écartées
+        # Profil d'encodage : par défaut, le motif du nom de fichier (pas son dossier)
+        self.source = source or profile_source(filepath)
         self.encoding = encoding or self._detect_encoding()
         self.used_encoding = None  # encodage réellement utilisé
 
     def _detect_encoding(self):
         """
-        Détecte automatiquement l’encodage du fichier en lisant un échantillon.
+        Détecte l’encodage sur un échantillon borné (ENCODING_SAMPLE_SIZE),
+        en réutilisant l'encodage habituel de la source s'il convient.
         """
-        result = from_path(self.filepath).best()
-        # result = charset_normalizer.from_path(self.filepath).best()
-        if result:
-            print(f"[INFO] Encodage détecté automatiquement : {result.encoding} (confiance {result.chaos})")
-            return result.encoding
-        else:
-            print("[WARN] Impossible de détecter l’encodage, fallback en utf-8")
-            return "utf-8"
+        with open(self.filepath, "rb") as f:
+            sample = f.read(ENCODING_SAMPLE_SIZE)
+        encoding = encoding_profiles.resolve(self.source, sample)
+        logger.info(f"[ENCODING] Encodage retenu pour {self.source} : {encoding}")
+        return encoding
 
     def _try_read(self, **kwargs):
         """
         Lecture avec l’encodage détecté. Si ça casse, fallback latin1/cp1252.
         """
-        encodings_to_try = [self.encoding, "utf-8", "latin1", "cp1252"]
+        encodings_to_try = [self.encoding] + ENCODING_FALLBACKS
         last_error = None
 
         for enc in encodings_to_try:
@@ -35,16 +48,71 @@ class CSVReader:
                 df = pd.read_csv(self.filepath, encoding=enc, **kwargs)
                 if self.used_encoding is None:
                     self.used_encoding = enc
-                    print(f"[INFO] Fichier lu avec encodage : {enc}")
+                    logger.info(f"[CSV] Fichier lu avec encodage : {enc}")
                 return df
             except UnicodeDecodeError as e:
-                print(f"[WARN] Échec lecture avec encodage {enc}")
+                logger.warning(f"[CSV] Échec lecture avec encodage {enc}")
                 last_error = e
                 continue
 
         raise last_error
 
+    def _on_bad_line(self, fields):
+        """Ligne refusée par le moteur python (champs en trop) : quarantaine, puis ignorée."""
+        metrics.count("bad_lines")
+        if self.rejects is not None:
+            self.rejects.add(None, TOO_MANY_FIELDS, ",".join(fields))
+        else:
+            logger.warning(f"[CSV] Ligne ignorée : {','.join(fields)}")
+        return None
+
+    @staticmethod
+    def read_blocks(blocks, encoding, chunksize=50000, include_comment=False, engine=None,
+                    rejects=None, line_offset=0):
+        """
+        Lecture d'un CSV fourni sous forme de blocs bytes (fichier, upload...)
+        via le tokeniseur streaming (moteur C ou pyarrow) : COMMENTAIRE est
+        retiré avant le parsing, champs multi-lignes compris. Le flux est
+        transcodé en UTF-8 avec bascule d'encodage en cours de lecture si une
+        séquence invalide apparaît (passer un Utf8Transcoder permet de suivre
+        les bascules). Les enregistrements mal formés partent dans `rejects`.
+        Les chunks sortent aux noms et types du schéma CALL_LOGS.
+        """
+        engine = engine or CSV_ENGINE
+        if not isinstance(blocks, Utf8Transcoder):
+            blocks = Utf8Transcoder(blocks, encoding)
+        return read_stripped_csv(
+            iter(blocks),
+            "utf-8",
+            engine="c" if engine == "python" else engine,  # pas de chemin legacy en streaming
+            chunksize=chunksize,
+            column=None if include_comment else "COMMENTAIRE",
+            rejects=rejects,
+            line_offset=line_offset,
+            schema=CALL_LOGS,
+            sep=",",
+            quotechar='"',
+            doublequote=True,
+            escapechar="\\",
+            keep_default_na=False,
+            na_values=["", "NA", "NULL"],
+            on_bad_lines="warn",
+        )
+
+    def _get_chunks_tokenized(self):
+        with open(self.filepath, "rb") as f:
+            transcoder = Utf8Transcoder(iter_blocks(f), self.encoding)
+            yield from CSVReader.read_blocks(
+                transcoder, self.encoding, self.chunksize, self.include_comment, self.engine, self.rejects
+            )
+        self.used_encoding = transcoder.encoding
+        if transcoder.switches:
+            encoding_profiles.remember(self.source, transcoder.encoding)
+
     def get_chunks(self):
+        if self.engine != "python":
+            return self._get_chunks_tokenized()
+
         # Détecter colonnes si on veut exclure COMMENTAIRE
         usecols = None
         if not self.include_comment:
@@ -60,7 +128,7 @@ class CSVReader:
             dtype=str,
             keep_default_na=False,
             na_values=["", "NA", "NULL"],
-            on_bad_lines="warn",
+            on_bad_lines=self._on_bad_line,
             usecols=usecols,
             chunksize=self.chunksize
         )
@@ -0,0 +1,196 @@
+# database.py
+import logging
+import os
+import threading
+from sqlalchemy import create_engine, text
+from app.config import DB_CONFIG, DB_POOL_CONFIG, REJECTS_TABLE
+from app.utils.rollup import MEASURES
+
+logger = logging.getLogger(__name__)
+
+_engines = {}          # url → (pid, engine)
+_schema_ready = set()  # urls dont le schéma technique a été créé
+_lock = threading.Lock()
+
+
+def _url(db_config: dict) -> str:
+    return (
+        f"postgresql+psycopg2://{db_config['user']}:{db_config['password']}"
+        f"@{db_config['host']}:{db_config['port']}/{db_config['dbname']}"
+    )
+
+
+def get_engine(db_config: dict = DB_CONFIG):
+    """
+    Retourne l'engine SQLAlchemy partagé du processus pour cette base.
+    Le pool vit aussi longtemps que l'application ; après un fork (pool de
+    processus), un nouvel engine est créé sans toucher aux connexions du parent.
+    """
+    url = _url(db_config)
+    pid = os.getpid()
+    entry = _engines.get(url)
+    if entry is not None and entry[0] == pid:
+        return entry[1]
+
+    with _lock:
+        entry = _engines.get(url)
+        if entry is not None and entry[0] == pid:
+            return entry[1]
+        if entry is not None:
+            # Engine hérité du processus parent : ne pas fermer ses sockets
+            entry[1].dispose(close=False)
+            _schema_ready.discard(url)
+
+        engine = create_engine(url, **DB_POOL_CONFIG)
+        _engines[url] = (pid, engine)
+        logger.info(f"[DB] Pool de connexions créé ({DB_POOL_CONFIG})")
+        return engine
+
+
+def configure_pool(**options):
+    """
+    Ajuste la configuration du pool avant la création de l'engine
+    (ex. une seule connexion par worker d'ingestion parallèle).
+    """
+    DB_POOL_CONFIG.update(options)
+
+
+def init_schema(db_config: dict = DB_CONFIG):
+    """Crée les tables techniques (une seule fois par processus)."""
+    url = _url(db_config)
+    if url in _schema_ready:
+        return
+
+    with get_engine(db_config).begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS imported_files (
+                id SERIAL PRIMARY KEY,
+                file_name TEXT UNIQUE,
+                imported_at TIMESTAMP DEFAULT now()
+            )
+        """))
+        # Plage de dates couverte par chaque import (invalidation du cache d'export)
+        conn.execute(text("""
+            ALTER TABLE imported_files
+                ADD COLUMN IF NOT EXISTS min_date DATE,
+                ADD COLUMN IF NOT EXISTS max_date DATE
+        """))
+        # Empreinte du contenu importé (doublons renommés, fichiers qui grossissent)
+        conn.execute(text("""
+            ALTER TABLE imported_files
+                ADD COLUMN IF NOT EXISTS content_hash TEXT,
+                ADD COLUMN IF NOT EXISTS byte_length BIGINT,
+                ADD COLUMN IF NOT EXISTS row_count BIGINT
+        """))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS imported_files_byte_length_idx ON imported_files (byte_length)"
+        ))
+        # Reprise des imports interrompus : offset validé avec les données
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS import_checkpoints (
+                file_name TEXT PRIMARY KEY,
+                byte_offset BIGINT NOT NULL,
+                prefix_hash TEXT NOT NULL,
+                row_count BIGINT NOT NULL,
+                min_date DATE,
+                max_date DATE,
+                updated_at TIMESTAMP DEFAULT now()
+            )
+        """))
+        # Nouvelles tentatives différées : l'état survit aux redémarrages
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS ingest_retries (
+                task_key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                state TEXT NOT NULL,
+                next_attempt_at TIMESTAMP,
+                last_error TEXT,
+                updated_at TIMESTAMP DEFAULT now()
+            )
+        """))
+        # Jobs d'ingestion en arrière-plan : consultables depuis n'importe quel worker
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS ingest_jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                state TEXT NOT NULL,
+                owner TEXT,
+                submitted_at DOUBLE PRECISION NOT NULL,
+                started_at DOUBLE PRECISION,
+                finished_at DOUBLE PRECISION,
+                rows_processed BIGINT NOT NULL DEFAULT 0,
+                files_done INTEGER NOT NULL DEFAULT 0,
+                current_file TEXT,
+                errors TEXT NOT NULL DEFAULT '[]',
+                result TEXT,
+                heartbeat_at TIMESTAMP DEFAULT now()
+            )
+        """))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ingest_jobs_submitted_idx ON ingest_jobs (submitted_at)"
+        ))
+        # Agrégats jour / semaine ISO par groupe, tenus à jour à l'ingestion
+        measures = ", ".join(f"{m}_sum BIGINT NOT NULL DEFAULT 0" for m in MEASURES)
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS call_stats_daily (
+                jour DATE NOT NULL,
+                groupe TEXT NOT NULL,
+                calls BIGINT NOT NULL DEFAULT 0,
+                {measures},
+                updated_at TIMESTAMP DEFAULT now(),
+                PRIMARY KEY (jour, groupe)
+            )
+        """))
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS call_stats_weekly (
+                iso_year INTEGER NOT NULL,
+                iso_week INTEGER NOT NULL,
+                groupe TEXT NOT NULL,
+                calls BIGINT NOT NULL DEFAULT 0,
+                {measures},
+                updated_at TIMESTAMP DEFAULT now(),
+                PRIMARY KEY (iso_year, iso_week, groupe)
+            )
+        """))
+        # Quarantaine : enregistrements écartés à l'ingestion, avec leur origine
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {REJECTS_TABLE} (
+                id BIGSERIAL PRIMARY KEY,
+                file_name TEXT NOT NULL,
+                line_number BIGINT,
+                reason TEXT NOT NULL,
+                raw_record TEXT,
+                rejected_at TIMESTAMP DEFAULT now()
+            )
+        """))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {REJECTS_TABLE}_file_idx ON {REJECTS_TABLE} (file_name, line_number)"
+        ))
+    _schema_ready.add(url)
+    logger.info("[DB] Schéma technique vérifié")
+
+
+def pool_stats(db_config: dict = DB_CONFIG) -> dict:
+    """Statistiques du pool partagé."""
+    pool = get_engine(db_config).pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": DB_POOL_CONFIG["max_overflow"],
+        "status": pool.status(),
+    }
+
+
+def dispose_engines():
+    """Ferme tous les pools du processus (arrêt de l'application)."""
+    with _lock:
+        for pid, engine in _engines.values():
+            if pid == os.getpid():
+                engine.dispose()
+        _engines.clear()
+        _schema_ready.clear()
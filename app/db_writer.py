@@ -1,30 +1,326 @@
 # db_writer.py
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from io import StringIO
+from itertools import chain
+import logging
 import pandas as pd
+from app.config import COPY_FORMAT, PARTITION_KEY
+from app.database import get_engine, init_schema
+from app.utils.pg_copy import BinaryCopyEncoder, UnsupportedCopyType, iter_csv_copy
+from app.utils.rollup import RollupAccumulator
+from app.partitions import partition_manager
+from app.schema import CALL_LOGS
+from app.utils.stream_io import IterStream
+from app.utils import progress, metrics
+
+logger = logging.getLogger(__name__)
+
+# Taille des lectures faites par psycopg2 sur le flux COPY
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Lignes sans date de partition gardées en mémoire pour être copiées en fin d'import
+UNDATED_BUFFER_ROWS = 100_000
+
+
+class ImportSession:
+    """
+    Session d'import d'un fichier : une seule connexion, une seule
+    transaction. Les chunks passent par un COPY alimenté au fil de l'eau
+    (relancé quand un mois sans partition apparaît), et la ligne imported_files est écrite dans la même transaction :
+    un fichier est importé entièrement ou pas du tout. Pour les gros fichiers,
+    `checkpoint` valide des étapes intermédiaires reprenables après un arrêt.
+    Les tables de rollup (statistiques jour / semaine) sont mises à jour à
+    chaque validation, avec les lignes correspondantes.
+    """
+
+    def __init__(self, writer: "DBWriter", file_name: str, copy_format: str = None):
+        self.writer = writer
+        self.file_name = file_name
+        self.copy_format = copy_format or COPY_FORMAT
+        self.rows = 0
+        self.min_date = None  # plage de date_appel importée
+        self.max_date = None
+        self.content_hash = None  # empreinte du contenu (voir set_fingerprint)
+        self.byte_length = None
+        self.append = False       # complète un import existant du même fichier
+        self.rollup = RollupAccumulator()
+        self._months = set()         # mois dont les partitions ont été préparées
+        self._uses_default = False   # la transaction en cours a écrit dans la partition DEFAULT
+        self._undated = []           # lignes sans date mises de côté (voir _hold_undated)
+        self._undated_rows = 0
+        self.conn = writer.engine.raw_connection()
+        self.cur = self.conn.cursor()
+        self._done = False
+
+    def _count_rows(self, chunks):
+        for df in chunks:
+            self.rows += len(df)
+            if "date_appel" in df.columns:
+                self._track_dates(df["date_appel"])
+            self.rollup.add(df)
+            progress.report(len(df), self.file_name)
+            yield df
+
+    def _track_dates(self, dates: pd.Series):
+        low, high = dates.min(), dates.max()
+        if pd.isna(low):
+            return
+        low, high = low.date(), high.date()
+        self.min_date = low if self.min_date is None else min(self.min_date, low)
+        self.max_date = high if self.max_date is None else max(self.max_date, high)
+
+    def _binary_encoder(self, columns):
+        try:
+            types = self.writer.column_types(self.cur)
+            return BinaryCopyEncoder({c: types[c] for c in columns})
+        except (UnsupportedCopyType, KeyError) as e:
+            logger.warning(f"[DB] COPY binaire impossible ({e}), repli sur le format CSV")
+            return None
+
+    def _key_range(self, df: pd.DataFrame):
+        """Plage (date min, date max) de PARTITION_KEY du chunk, None sans date ou sans partitionnement."""
+        if PARTITION_KEY not in df.columns or not partition_manager.is_partitioned():
+            return None
+        keys = df[PARTITION_KEY]
+        low, high = keys.min(), keys.max()
+        if pd.isna(low):
+            return None
+        return low.date(), high.date()
+
+    def _has_new_months(self, df: pd.DataFrame) -> bool:
+        span = self._key_range(df)
+        return span is not None and not set(partition_manager.months(*span)) <= self._months
+
+    def _ensure_partitions(self, df: pd.DataFrame):
+        """
+        Crée les partitions des mois du chunk (hors COPY, dans une transaction
+        séparée). Si la transaction d'import a déjà écrit dans la partition
+        DEFAULT, l'attachement attendrait sa fin : les lignes y vont et sont
+        reprises après la validation.
+        """
+        span = self._key_range(df)
+        if span is None:
+            return
+        if not self._uses_default:
+            partition_manager.ensure_range(*span)
+            if partition_manager.missing(*span):
+                self._uses_default = True
+        self._months.update(partition_manager.months(*span))
+
+    def _hold_undated(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Met de côté les lignes sans PARTITION_KEY (destinées à la partition
+        DEFAULT, verrouillée jusqu'à la fin de la transaction dès la première
+        écriture) : copiées en dernier, elles ne bloquent pas la création des
+        partitions des chunks suivants. Au-delà de UNDATED_BUFFER_ROWS, elles
+        sont copiées directement.
+        """
+        if PARTITION_KEY not in df.columns or self._uses_default or not partition_manager.is_partitioned():
+            return df
+        undated = df[PARTITION_KEY].isna()
+        if not undated.any():
+            return df
+        self._undated_rows += int(undated.sum())
+        if self._undated_rows > UNDATED_BUFFER_ROWS:
+            self._uses_default = True
+            df, self._undated = pd.concat([*self._undated, df]), []
+            return df
+        self._undated.append(df[undated])
+        return df[~undated]
+
+    def _until_new_months(self, first: pd.DataFrame, chunks, boundary: list):
+        """
+        `first` puis les chunks du flux jusqu'au premier portant un mois pas
+        encore préparé, mis de côté dans `boundary`.
+        """
+        df = first
+        while True:
+            df = self._hold_undated(df)
+            if len(df):
+                yield df
+            df = next(chunks, None)
+            if df is None:
+                return
+            if self._has_new_months(df):
+                boundary.append(df)
+                return
+
+    def copy_chunks(self, chunks) -> int:
+        """
+        Envoie les chunks dans un COPY ... FROM STDIN. Les chunks sont
+        consommés à la demande par psycopg2 : un seul chunk en mémoire.
+        Les partitions ne pouvant être créées pendant un COPY, un chunk
+        portant un mois nouveau clôt le COPY en cours : ses partitions sont
+        créées puis un nouveau COPY reprend, dans la même transaction.
+        Retourne le nombre de lignes copiées par cet appel.
+        """
+        before = self.rows
+        chunks = iter(chunks)
+        pending = next(chunks, None)
+        while pending is not None:
+            self._ensure_partitions(pending)
+            boundary = []
+            self._copy(self._until_new_months(pending, chunks, boundary))
+            pending = boundary[0] if boundary else None
+        if self._undated:
+            undated, self._undated = pd.concat(self._undated), []
+            self._uses_default = True
+            self._copy(iter([undated]))
+        return self.rows - before
+
+    def _copy(self, chunks) -> int:
+        """Un COPY ... FROM STDIN alimenté par `chunks`."""
+        first = next(chunks, None)
+        if first is None:
+            return 0
+        before = self.rows
+        # Colonnes copiées : celles du schéma présentes dans les chunks, dans l'ordre du schéma
+        columns = CALL_LOGS.copy_columns(first.columns)
+        chunks = chain([first], chunks)
+        if columns != list(first.columns):
+            chunks = (df[columns] for df in chunks)
+        chunks = self._count_rows(chunks)
+        cols = ",".join(columns)
+
+        encoder = self._binary_encoder(columns) if self.copy_format == "binary" else None
+        if encoder is not None:
+            sql = f"COPY {self.writer.table_name} ({cols}) FROM STDIN WITH (FORMAT binary)"
+            payload = encoder.iter_copy(chunks)
+        else:
+            sql = f"COPY {self.writer.table_name} ({cols}) FROM STDIN WITH CSV"
+            payload = iter_csv_copy(chunks)
+        payload = metrics.timed("encode", payload, nbytes=len)
+
+        # psycopg2 transforme toute exception levée pendant la lecture du flux
+        # en QueryCanceled : on relève l'erreur d'origine (ex. PermissionError SFTP)
+        source_errors = []
+
+        def guarded(payload):
+            try:
+                yield from payload
+            except Exception as e:
+                source_errors.append(e)
+                raise
+
+        # Étape "copy" : temps d'envoi et d'écriture côté serveur, hors production des chunks
+        with metrics.stage("copy") as copy:
+            try:
+                self.cur.copy_expert(sql, IterStream(guarded(payload), binary=True), size=COPY_BUFFER_SIZE)
+            except Exception:
+                if source_errors:
+                    raise source_errors[0]
+                raise
+            finally:
+                copy.rows = self.rows - before
+        return self.rows - before
+
+    def set_fingerprint(self, content_hash: str, byte_length: int, append: bool = False):
+        """
+        Empreinte du fichier complet à enregistrer au commit. `append` : seuls
+        les octets ajoutés depuis le dernier import ont été copiés.
+        """
+        self.content_hash = content_hash
+        self.byte_length = byte_length
+        self.append = append
+
+    def resume(self, checkpoint):
+        """Reprend les compteurs d'un import interrompu (ligne import_checkpoints)."""
+        self.rows = checkpoint.row_count
+        self.min_date, self.max_date = checkpoint.min_date, checkpoint.max_date
+
+    def checkpoint(self, byte_offset: int, prefix_hash: str):
+        """
+        Valide les données copiées jusqu'ici avec l'offset source atteint :
+        après un arrêt, l'import reprend à `byte_offset` au lieu du début.
+        """
+        self.cur.execute(
+            """
+            INSERT INTO import_checkpoints (file_name, byte_offset, prefix_hash, row_count, min_date, max_date)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (file_name) DO UPDATE SET
+                byte_offset = EXCLUDED.byte_offset, prefix_hash = EXCLUDED.prefix_hash,
+                row_count = EXCLUDED.row_count, min_date = EXCLUDED.min_date,
+                max_date = EXCLUDED.max_date, updated_at = now()
+            """,
+            (self.file_name, byte_offset, prefix_hash, self.rows, self.min_date, self.max_date)
+        )
+        self.rollup.flush(self.cur)
+        self.conn.commit()
+        self._undated_rows = 0
+        if self._uses_default:
+            # Verrou de la partition DEFAULT libéré : mois restés sans partition créés maintenant
+            self._uses_default = False
+            partition_manager.ensure_range(self.min_date, self.max_date)
+        logger.info(f"[DB] Checkpoint {self.file_name} : octet {byte_offset}, {self.rows} lignes")
+
+    def commit(self):
+        """Consigne le fichier dans imported_files et valide la transaction."""
+        self.cur.execute("DELETE FROM import_checkpoints WHERE file_name = %s", (self.file_name,))
+        if self.append:
+            # Nouvel id : les consommateurs du watermark (cache d'export,
+            # export Parquet) voient l'ajout comme un nouvel import
+            self.cur.execute(
+                """
+                UPDATE imported_files SET
+                    id = nextval(pg_get_serial_sequence('imported_files', 'id')),
+                    content_hash = %s, byte_length = %s,
+                    row_count = COALESCE(row_count, 0) + %s,
+                    min_date = LEAST(min_date, %s), max_date = GREATEST(max_date, %s),
+                    imported_at = now()
+                WHERE file_name = %s
+                """,
+                (self.content_hash, self.byte_length, self.rows, self.min_date, self.max_date, self.file_name)
+            )
+        else:
+            self.cur.execute(
+                """
+                INSERT INTO imported_files (file_name, min_date, max_date, content_hash, byte_length, row_count)
+                VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT DO NOTHING
+                """,
+                (self.file_name, self.min_date, self.max_date, self.content_hash, self.byte_length, self.rows)
+            )
+        self.rollup.flush(self.cur)
+        self.conn.commit()
+        self._done = True
+        # Lignes tombées dans la partition DEFAULT : reprises si leur mois manque encore
+        partition_manager.ensure_range(self.min_date, self.max_date)
+        logger.info(f"[DB] Import de {self.file_name} validé ({self.rows} lignes)")
+
+    def rollback(self):
+        self.conn.rollback()
+        self._done = True
+
+    def close(self):
+        try:
+            if not self._done:
+                self.conn.rollback()
+            self.cur.close()
+        finally:
+            self.conn.close()  # rendue au pool
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and not self._done:
+            logger.warning(f"[DB] Import de {self.file_name} annulé : {exc}")
+            self.rollback()
+        self.close()
+        return False
 
 class DBWriter:
     def __init__(self, db_config: dict, table_name: str, view_name: str ):
         self.db_config = db_config
         self.table_name = table_name
-        self.engine = create_engine(
-            f"postgresql+psycopg2://{db_config['user']}:{db_config['password']}"
-            f"@{db_config['host']}:{db_config['port']}/{db_config['dbname']}"
-        )
+        # Engine partagé : pas de nouveau pool ni de handshake par appel
+        self.engine = get_engine(db_config)
         self._ensure_log_table()
         self.view_name = view_name
+        self._column_types = None
 
     def _ensure_log_table(self):
-        """Crée la table de log si elle n’existe pas"""
-        with self.engine.connect() as conn:
-            conn.execute(text("""
-                CREATE TABLE IF NOT EXISTS imported_files (
-                    id SERIAL PRIMARY KEY,
-                    file_name TEXT UNIQUE,
-                    imported_at TIMESTAMP DEFAULT now()
-                )
-            """))
-            conn.commit()
+        """Crée la table de log si elle n’existe pas (déjà fait au démarrage en principe)"""
+        init_schema(self.db_config)
 
     def already_imported(self, file_name: str) -> bool:
         """Vérifie si le fichier a déjà été importé"""
@@ -35,34 +331,126 @@ class DBWriter:
             ).fetchone()
             return result is not None
 
-    def log_import(self, file_name: str):
+    def log_import(self, file_name: str, content_hash: str = None, byte_length: int = None, row_count: int = None):
         """Consigne qu’un fichier a été importé"""
         with self.engine.connect() as conn:
             conn.execute(
-                text("INSERT INTO imported_files (file_name) VALUES (:f) ON CONFLICT DO NOTHING"),
+                text("""
+                    INSERT INTO imported_files (file_name, content_hash, byte_length, row_count)
+                    VALUES (:f, :h, :l, :r) ON CONFLICT DO NOTHING
+                """),
+                {"f": file_name, "h": content_hash, "l": byte_length, "r": row_count}
+            )
+            conn.commit()
+
+    def find_checkpoint(self, file_name: str):
+        """Dernier checkpoint d'un import interrompu, ou None."""
+        with self.engine.connect() as conn:
+            return conn.execute(
+                text("""
+                    SELECT byte_offset, prefix_hash, row_count, min_date, max_date
+                    FROM import_checkpoints WHERE file_name = :f
+                """),
                 {"f": file_name}
+            ).fetchone()
+
+    def update_fingerprint(self, file_name: str, content_hash: str, byte_length: int):
+        """Met à jour l'empreinte d'un import sans nouvelle donnée (contenu déjà chargé)."""
+        with self.engine.connect() as conn:
+            conn.execute(
+                text("UPDATE imported_files SET content_hash = :h, byte_length = :l WHERE file_name = :f"),
+                {"f": file_name, "h": content_hash, "l": byte_length}
             )
             conn.commit()
 
+    def find_import(self, file_name: str):
+        """Ligne imported_files du fichier (empreinte comprise), ou None."""
+        with self.engine.connect() as conn:
+            return conn.execute(
+                text("""
+                    SELECT file_name, content_hash, byte_length, row_count
+                    FROM imported_files WHERE file_name = :f
+                """),
+                {"f": file_name}
+            ).fetchone()
+
+    def imported_sizes(self, file_names: list) -> dict:
+        """Taille enregistrée de chaque fichier déjà importé parmi `file_names` (une requête)."""
+        if not file_names:
+            return {}
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text("SELECT file_name, byte_length FROM imported_files WHERE file_name = ANY(:f)"),
+                {"f": list(file_names)}
+            ).fetchall()
+        return {r.file_name: r.byte_length for r in rows}
+
+    def has_size(self, byte_length: int) -> bool:
+        """Un import de cette taille existe-t-il ? (évite de hasher pour rien)"""
+        with self.engine.connect() as conn:
+            return conn.execute(
+                text("SELECT 1 FROM imported_files WHERE byte_length = :l LIMIT 1"),
+                {"l": byte_length}
+            ).fetchone() is not None
+
+    def find_by_content(self, content_hash: str, byte_length: int):
+        """Nom du fichier déjà importé avec ce contenu exact, ou None."""
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                text("""
+                    SELECT file_name FROM imported_files
+                    WHERE byte_length = :l AND content_hash = :h
+                    ORDER BY id LIMIT 1
+                """),
+                {"l": byte_length, "h": content_hash}
+            ).fetchone()
+            return row.file_name if row else None
+
+    def column_types(self, cur) -> dict:
+        """Types PostgreSQL des colonnes de la table cible (mis en cache)."""
+        if self._column_types is None:
+            schema, _, table = self.table_name.rpartition(".")
+            cur.execute(
+                """
+                SELECT column_name, data_type FROM information_schema.columns
+                WHERE table_name = %s AND table_schema = COALESCE(%s, current_schema())
+                """,
+                (table, schema or None)
+            )
+            self._column_types = dict(cur.fetchall())
+        return self._column_types
+
+    def session(self, file_name: str, copy_format: str = None) -> ImportSession:
+        """Ouvre une session d'import transactionnelle pour un fichier."""
+        return ImportSession(self, file_name, copy_format)
+
     def copy_dataframe(self, df: pd.DataFrame):
         """Insère un DataFrame en bulk via COPY"""
-        conn = self.engine.raw_connection()
-        cur = conn.cursor()
+        conn = self.engine.raw_connection()  # connexion empruntée au pool
+        try:
+            cur = conn.cursor()
 
-        buffer = StringIO()
-        df.to_csv(buffer, index=False, header=False)
-        buffer.seek(0)
+            columns = CALL_LOGS.copy_columns(df.columns)
+            buffer = StringIO()
+            df.to_csv(buffer, index=False, header=False, columns=columns)
+            buffer.seek(0)
 
-        cols = ",".join(df.columns)
-        sql = f"COPY {self.table_name} ({cols}) FROM STDIN WITH CSV"
-        cur.copy_expert(sql, buffer)
+            cols = ",".join(columns)
+            sql = f"COPY {self.table_name} ({cols}) FROM STDIN WITH CSV"
+            with metrics.stage("copy", rows=len(df)):
+                cur.copy_expert(sql, buffer)
 
-        conn.commit()
-        cur.close()
-        conn.close()
+            rollup = RollupAccumulator()
+            rollup.add(df)
+            rollup.flush(cur)
+            conn.commit()
+            cur.close()
+        finally:
+            conn.close()  # rendue au pool, pas fermée
 
     def close(self):
-        self.engine.dispose()
+        """L'engine est partagé par toute l'application : rien à libérer ici."""
+        pass
         
     def get_engine(self):
         return self.engine
@@ -1,41 +1,31 @@
-from datetime import datetime, date, timedelta
 from app.services.ingestion_service import IngestionService
+from app.services.retry_service import retry_service
 from app.config import SFTP_CONFIG
 import logging
 
 logger = logging.getLogger(__name__)
 
-def auto_ingest_yesterday():
+
+def auto_ingest_new_files():
     """
-    Télécharge et ingère automatiquement le fichier du jour J-1 depuis le SFTP.
-    Si une erreur survient, replanifie la tâche dans 20 minutes.
+    Liste le dossier SFTP et ingère tous les fichiers nouveaux ou modifiés
+    (y compris ceux des jours manqués), sur une seule connexion.
+    Chaque fichier en échec transitoire a sa propre nouvelle tentative ;
+    si c'est le passage entier qui échoue (listing impossible), il est
+    replanifié par le RetryService (délai exponentiel, nombre d'essais borné).
     """
-    yesterday = (date.today() - timedelta(days=1)).strftime("%Y-%m-%d")
-    file_name = f"{yesterday}_VocalCom_Incoming.csv"
-    remote_path = f"{SFTP_CONFIG['remote_dir']}{file_name}"
-
-    logger.info(f"remote_path: {remote_path}")
-    logger.info(f"[AUTO] Ingestion automatique du fichier : {remote_path}")
+    remote_dir = SFTP_CONFIG["remote_dir"]
+    logger.info(f"[AUTO] Recherche de nouveaux fichiers dans : {remote_dir}")
 
     try:
-        result = IngestionService.process_sftp_file(remote_path)
+        result = IngestionService.process_sftp_dir(remote_dir)
         logger.info(f"[AUTO] Résultat ingestion : {result}")
         return result
 
     except Exception as e:
         logger.error(f"[AUTO] Erreur lors de l'ingestion automatique: {e}", exc_info=True)
+        retry = retry_service.schedule("sftp_scan", "sftp_scan", {}, str(e))
+        return {"status": "error", "message": str(e), "retry": retry}
 
-        # 🔁 Replanifier dans 20 minutes
-        try:
-            from app.main import job_scheduler  # le scheduler global
-            next_run_time = datetime.now() + timedelta(minutes=20)
-
-            job_scheduler.add_job(
-                auto_ingest_yesterday,
-                "date",
-                run_date=next_run_time
-            )
-            logger.warning(f"[AUTO] Nouvelle tentative planifiée à {next_run_time.strftime('%Y-%m-%d %H:%M:%S')}")
 
-        except Exception as inner_e:
-            logger.error(f"Impossible de replanifier la tâche: {inner_e}")
+retry_service.register("sftp_scan", auto_ingest_new_files)
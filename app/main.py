@@ -1,10 +1,17 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from app.routers import ingest, export, scheduler as scheduler_router  # 👈 on renomme ici
+from app.routers import ingest, export, stats, query, scheduler as scheduler_router  # 👈 on renomme ici
 
 from apscheduler.schedulers.background import BackgroundScheduler
-from app.jobs.sftp_ingest_job import auto_ingest_yesterday
+from app.jobs.sftp_ingest_job import auto_ingest_new_files
+from app.database import init_schema, pool_stats, dispose_engines
+from app.services.job_service import job_manager
+from app.utils.sftp_pool import sftp_pool
+from app.services.leader_service import SchedulerLeader
+from app.partitions import partition_manager
+from app.utils.metrics import registry as metrics_registry
 import logging
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
 
 logging.basicConfig(
@@ -13,16 +20,43 @@ logging.basicConfig(
 )
 
 
-app = FastAPI(title="Incoming API", version="1.0")
+logger = logging.getLogger(__name__)
 
-# 🚀 Scheduler (tâche quotidienne à 1h00)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 🚀 Pool de connexions partagé + schéma technique créé une seule fois
+    try:
+        init_schema()
+    except Exception as e:
+        logger.error(f"[DB] Initialisation du schéma impossible au démarrage : {e}")
+    # 🗓️ Partitions mensuelles prêtes à l'avance (sans effet sur une table non partitionnée)
+    try:
+        partition_manager.ensure_ahead()
+    except Exception as e:
+        logger.error(f"[PARTITION] Préparation des partitions impossible : {e}")
+    # 🗓️ Tâches planifiées dans un seul processus (élection) ; le leader réarme les nouvelles tentatives
+    scheduler_leader.start()
+    yield
+    scheduler_leader.stop()
+    job_manager.shutdown(wait=False)
+    sftp_pool.close()
+    dispose_engines()
+
+
+app = FastAPI(title="Incoming API", version="1.0", lifespan=lifespan)
+
+# 🚀 Scheduler (tâche quotidienne à 1h00), démarré au lancement par le SchedulerLeader
 job_scheduler = BackgroundScheduler()   # 👈 nouveau nom
-job_scheduler.add_job(auto_ingest_yesterday, "cron", hour=7, minute=42)
-job_scheduler.start()
+job_scheduler.add_job(auto_ingest_new_files, "cron", hour=7, minute=42, id="auto_ingest")
+job_scheduler.add_job(partition_manager.ensure_ahead, "cron", hour=0, minute=30, id="partitions")
+scheduler_leader = SchedulerLeader(job_scheduler)
 
 # 🚀 Inclusion des routers FastAPI
 app.include_router(ingest.router, prefix="/ingest", tags=["Ingestion"])
 app.include_router(export.router, prefix="/export", tags=["Export"])
+app.include_router(stats.router, prefix="/stats", tags=["Stats"])
+app.include_router(query.router, prefix="/query", tags=["Query"])
 app.include_router(scheduler_router.router, prefix="/scheduler", tags=["Scheduler"])  # 👈 corrigé
 
 templates = Jinja2Templates(directory="templates")
@@ -30,3 +64,28 @@ templates = Jinja2Templates(directory="templates")
 @app.get("/", response_class=HTMLResponse)
 def root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
+
+@app.get("/db/pool")
+def db_pool():
+    """Statistiques du pool de connexions partagé."""
+    return pool_stats()
+
+@app.get("/db/partitions")
+def db_partitions():
+    """Partitions de la table d'appels (bornes, lignes estimées, taille)."""
+    return {"partitioned": partition_manager.is_partitioned(), "partitions": partition_manager.list()}
+
+@app.get("/scheduler/leader")
+def scheduler_leader_status():
+    """Mode du scheduler et leadership de ce processus (worker uvicorn)."""
+    return scheduler_leader.status()
+
+@app.get("/sftp/pool")
+def sftp_pool_stats():
+    """Sessions SFTP inactives conservées, créées et réutilisées."""
+    return sftp_pool.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Métriques d'ingestion par étape, au format texte Prometheus."""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,57 @@
+"""
+Opérations d'administration ponctuelles, hors API (longues ou
+structurelles, elles ne doivent pas être déclenchables par un appel HTTP).
+
+    python -m app.manage partitions-migrate --yes [--keep-legacy]
+    python -m app.manage keyset-index
+"""
+import argparse
+import json
+import logging
+
+from app.partitions import partition_manager
+from app.services.query_service import QueryService
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+
+def partitions_migrate(args):
+    if not args.yes:
+        raise SystemExit(
+            "Réécriture complète de la table d'appels (verrou exclusif pendant toute la copie) : "
+            "à lancer hors ingestion, confirmer avec --yes"
+        )
+    return partition_manager.migrate(keep_legacy=args.keep_legacy)
+
+
+def keyset_index(args):
+    return QueryService.create_keyset_index()
+
+
+COMMANDS = {
+    "partitions-migrate": (partitions_migrate, "convertit la table d'appels en table partitionnée par mois"),
+    "keyset-index": (keyset_index, "crée l'index (datetime_appel, id) de /query sans bloquer l'ingestion"),
+}
+
+ARGUMENTS = {
+    "partitions-migrate": [
+        (("--yes",), {"action": "store_true", "help": "confirme la réécriture de la table"}),
+        (("--keep-legacy",), {"action": "store_true", "help": "conserve l'ancienne table (<table>_legacy)"}),
+    ],
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.manage", description="Administration d'incoming-api")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        command = commands.add_parser(name, help=help_text)
+        for flags, options in ARGUMENTS.get(name, []):
+            command.add_argument(*flags, **options)
+    args = parser.parse_args(argv)
+    result = COMMANDS[args.command][0](args)
+    print(json.dumps(result, indent=2, default=str, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
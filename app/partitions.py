@@ -0,0 +1,245 @@
+# partitions.py
+import logging
+import threading
+from datetime import date, timedelta
+from sqlalchemy import text
+from app.config import TABLE_NAME, PARTITION_KEY, PARTITION_AHEAD_MONTHS
+from app.database import get_engine
+
+logger = logging.getLogger(__name__)
+
+
+def _month_start(day) -> date:
+    return date(day.year, day.month, 1)
+
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _months(low, high) -> list:
+    months, month, last = [], _month_start(low), _month_start(high)
+    while month <= last:
+        months.append(month)
+        month = _next_month(month)
+    return months
+
+
+class PartitionManager:
+    """
+    Partitionnement mensuel (RANGE sur PARTITION_KEY) de la table d'appels.
+    Les partitions sont créées à la demande avant chaque COPY d'ingestion,
+    dans une transaction courte séparée (un CREATE PARTITION ne peut pas
+    s'exécuter pendant le COPY). Une ligne sans partition, ou sans date,
+    tombe dans la partition DEFAULT ; à la création du mois correspondant,
+    ses lignes sont déplacées avant l'attachement. Sur une table non
+    partitionnée, toutes les opérations sont sans effet.
+    """
+
+    def __init__(self, table: str = TABLE_NAME, key: str = PARTITION_KEY):
+        self.table = table
+        self.key = key
+        self._lock = threading.Lock()
+        self._partitioned = None
+        self._known = None  # premiers jours des mois déjà partitionnés
+
+    @property
+    def default_partition(self) -> str:
+        return f"{self.table}_default"
+
+    def partition_name(self, month: date) -> str:
+        return f"{self.table}_{month:%Y%m}"
+
+    def is_partitioned(self) -> bool:
+        if self._partitioned is None:
+            with get_engine().connect() as conn:
+                self._partitioned = conn.execute(
+                    text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t)"),
+                    {"t": self.table}
+                ).fetchone() is not None
+        return self._partitioned
+
+    def _load_known(self) -> set:
+        with get_engine().connect() as conn:
+            rows = conn.execute(
+                text("""
+                    SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = to_regclass(:t)
+                """),
+                {"t": self.table}
+            ).fetchall()
+        known = set()
+        prefix = f"{self.table}_"
+        for (name,) in rows:
+            suffix = name[len(prefix):]
+            if name.startswith(prefix) and len(suffix) == 6 and suffix.isdigit():
+                known.add(date(int(suffix[:4]), int(suffix[4:]), 1))
+        return known
+
+    def months(self, low, high) -> list:
+        """Premiers jours des mois couverts par [low, high]."""
+        return _months(low, high)
+
+    def missing(self, low, high) -> list:
+        """Mois de [low, high] encore sans partition (vide sur une table non partitionnée)."""
+        if low is None or high is None or not self.is_partitioned():
+            return []
+        with self._lock:
+            if self._known is None:
+                self._known = self._load_known()
+            return [m for m in _months(low, high) if m not in self._known]
+
+    def ensure_range(self, low, high) -> list:
+        """Crée les partitions mensuelles manquantes couvrant [low, high]."""
+        if low is None or high is None or not self.is_partitioned():
+            return []
+        with self._lock:
+            if self._known is None:
+                self._known = self._load_known()
+            missing = [m for m in _months(low, high) if m not in self._known]
+            created = []
+            for month in missing:
+                try:
+                    self._create(month)
+                except Exception as e:
+                    # Les lignes iront dans la partition DEFAULT, déplacées au prochain passage
+                    logger.warning(f"[PARTITION] Création de {self.partition_name(month)} impossible : {e}")
+                    self._known = None
+                    break
+                self._known.add(month)
+                created.append(self.partition_name(month))
+        return created
+
+    def ensure_ahead(self, months: int = PARTITION_AHEAD_MONTHS) -> list:
+        """Partitions du mois précédent jusqu'à `months` mois à l'avance."""
+        this_month = _month_start(date.today())
+        low, high = _month_start(this_month - timedelta(days=1)), this_month
+        for _ in range(months):
+            high = _next_month(high)
+        return self.ensure_range(low, high)
+
+    def _create(self, month: date):
+        name, start, end = self.partition_name(month), month, _next_month(month)
+        with get_engine().begin() as conn:
+            # Ne jamais bloquer une ingestion : en cas d'attente, repli sur la partition DEFAULT
+            conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+            conn.execute(text(f"CREATE TABLE {name} (LIKE {self.table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+            moved = conn.execute(text(f"""
+                WITH moved AS (
+                    DELETE FROM {self.default_partition}
+                    WHERE {self.key} >= :start AND {self.key} < :end
+                    RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved
+            """), {"start": start, "end": end}).rowcount
+            conn.execute(text(
+                f"ALTER TABLE {self.table} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"
+            ))
+        logger.info(f"[PARTITION] {name} créée ({moved} ligne(s) reprise(s) de la partition par défaut)")
+
+    def list(self) -> list:
+        with get_engine().connect() as conn:
+            rows = conn.execute(
+                text("""
+                    SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bounds,
+                           c.reltuples::bigint AS estimated_rows,
+                           pg_total_relation_size(c.oid) AS bytes
+                    FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = to_regclass(:t)
+                    ORDER BY c.relname
+                """),
+                {"t": self.table}
+            ).mappings().fetchall()
+        return [dict(r) for r in rows]
+
+    def migrate(self, keep_legacy: bool = False) -> dict:
+        """
+        Convertit la table existante en table partitionnée par mois, en une
+        seule transaction : renommage, création de la table partitionnée
+        (mêmes colonnes et valeurs par défaut), partitions couvrant
+        l'historique, copie des lignes, séquences rattachées et vues
+        dépendantes recréées. Une contrainte unique ou clé primaire doit
+        inclure la clé de partition : l'ancienne clé primaire devient un
+        simple index.
+        """
+        if self.is_partitioned():
+            return {"status": "already_partitioned", "table": self.table}
+
+        legacy = f"{self.table}_legacy"
+        with get_engine().begin() as conn:
+            views = conn.execute(
+                text("""
+                    SELECT DISTINCT v.oid::regclass::text AS name, pg_get_viewdef(v.oid) AS definition
+                    FROM pg_depend d
+                    JOIN pg_rewrite r ON r.oid = d.objid
+                    JOIN pg_class v ON v.oid = r.ev_class
+                    WHERE d.refobjid = to_regclass(:t) AND v.relkind = 'v' AND v.oid <> d.refobjid
+                """),
+                {"t": self.table}
+            ).fetchall()
+            key_columns = conn.execute(
+                text("""
+                    SELECT a.attname FROM pg_index i
+                    JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+                    WHERE i.indrelid = to_regclass(:t) AND i.indisprimary
+                """),
+                {"t": self.table}
+            ).scalars().all()
+            low, high = conn.execute(text(f"SELECT min({self.key}), max({self.key}) FROM {self.table}")).fetchone()
+
+            for view in views:
+                conn.execute(text(f"DROP VIEW {view.name}"))
+            conn.execute(text(f"ALTER TABLE {self.table} RENAME TO {legacy}"))
+            conn.execute(text(f"""
+                CREATE TABLE {self.table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING STORAGE)
+                PARTITION BY RANGE ({self.key})
+            """))
+            conn.execute(text(f"CREATE TABLE {self.default_partition} PARTITION OF {self.table} DEFAULT"))
+            months = _months(low, high) if low is not None else []
+            for month in months:
+                conn.execute(text(
+                    f"CREATE TABLE {self.partition_name(month)} PARTITION OF {self.table} "
+                    f"FOR VALUES FROM ('{month}') TO ('{_next_month(month)}')"
+                ))
+
+            conn.execute(text(f"CREATE INDEX ON {self.table} ({self.key})"))
+            if key_columns:
+                conn.execute(text(f"CREATE INDEX ON {self.table} ({', '.join(key_columns)})"))
+            rows = conn.execute(text(f"INSERT INTO {self.table} SELECT * FROM {legacy}")).rowcount
+
+            # Séquences (serial / identity) : rattachées à la nouvelle table et recalées
+            columns = conn.execute(
+                text("SELECT column_name, is_identity FROM information_schema.columns WHERE table_name = :t"),
+                {"t": legacy}
+            ).fetchall()
+            for column, is_identity in columns:
+                seq = conn.execute(
+                    text("SELECT pg_get_serial_sequence(:t, :c)"), {"t": legacy, "c": column}
+                ).scalar()
+                if seq and is_identity != "YES":
+                    conn.execute(text(f"ALTER SEQUENCE {seq} OWNED BY {self.table}.{column}"))
+                new_seq = conn.execute(
+                    text("SELECT pg_get_serial_sequence(:t, :c)"), {"t": self.table, "c": column}
+                ).scalar()
+                if new_seq:
+                    conn.execute(text(
+                        f"SELECT setval('{new_seq}', COALESCE((SELECT max({column}) FROM {self.table}), 0) + 1, false)"
+                    ))
+
+            for view in views:
+                conn.execute(text(f"CREATE VIEW {view.name} AS {view.definition}"))
+            if not keep_legacy:
+                conn.execute(text(f"DROP TABLE {legacy}"))
+
+        with self._lock:
+            self._partitioned, self._known = True, set(months)
+        logger.info(f"[PARTITION] {self.table} partitionnée : {len(months)} partition(s) mensuelle(s), {rows} ligne(s)")
+        self.ensure_ahead()
+        return {
+            "status": "migrated", "table": self.table, "rows": rows,
+            "partitions": [self.partition_name(m) for m in months],
+            "views_recreated": [v.name for v in views], "legacy_kept": keep_legacy,
+        }
+
+
+partition_manager = PartitionManager()
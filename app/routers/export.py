@@ -1,31 +1,57 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from datetime import date
 from app.services.export_service import ExportService
+from app.services.parquet_export_service import ParquetExportService
 
 router = APIRouter()
 
+
+def _csv_response(stream, file_name: str, gzip: bool):
+    """Réponse HTTP streamée : les premiers octets partent dès que le COPY démarre."""
+    if gzip:
+        file_name += ".gz"
+    return StreamingResponse(
+        stream,
+        media_type="application/gzip" if gzip else "text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'},
+    )
+
 @router.get("/daily")
-def export_daily(day: date):
-    path = ExportService.export_csv_by_date(day, day, f"export_{day}.csv")
-    return {"status": "ok", "file": path}
+def export_daily(day: date, gzip: bool = False):
+    stream = ExportService.stream_csv_by_date(day, day, gzip=gzip)
+    return _csv_response(stream, f"export_{day}.csv", gzip)
 
 @router.get("/rangeofdate")
-def export_range(start: date, end: date):
-    path = ExportService.export_csv_by_date(start, end, f"export_{start}_{end}.csv")
-    return {"status": "ok", "file": path}
+def export_range(start: date, end: date, gzip: bool = False):
+    stream = ExportService.stream_csv_by_date(start, end, gzip=gzip)
+    return _csv_response(stream, f"export_{start}_{end}.csv", gzip)
 
 @router.get("/weekly")
-def export_daily(week: str):
-    path = ExportService.export_csv_by_week(week, week, f"export_{week}.csv")
-    return {"status": "ok", "file": path}
+def export_weekly(week: str, gzip: bool = False):
+    try:
+        stream = ExportService.stream_csv_by_week(week, week, gzip=gzip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _csv_response(stream, f"export_{week}.csv", gzip)
 
 @router.get("/rangeofweek")
-def export_range(start: str, end: str):
-    path = ExportService.export_csv_by_week(start, end, f"export_{start}_{end}.csv")
-    return {"status": "ok", "file": path}
+def export_week_range(start: str, end: str, gzip: bool = False):
+    try:
+        stream = ExportService.stream_csv_by_week(start, end, gzip=gzip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _csv_response(stream, f"export_{start}_{end}.csv", gzip)
 
 @router.get("/alldata")
-def export_all(output_dir: str = "D:/Utilisateurs/soava.rakotomanana/OneDrive - Axian Group/Documents/Flashprod"):
-    path = ExportService.export_all_to_csv(output_dir)
-    return {"status": "ok", "file": path}
+def export_all(gzip: bool = False):
+    stream = ExportService.stream_all_csv(gzip=gzip)
+    return _csv_response(stream, "incoming_all_data.csv", gzip)
 
+@router.post("/parquet")
+def export_parquet(partition_by: str = "date", full: bool = False):
+    """Export Parquet partitionné (jour ou semaine ISO), incrémental par défaut."""
+    try:
+        return ParquetExportService.export_parquet(partition_by=partition_by, full=full)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,37 +1,175 @@
-from fastapi import APIRouter, UploadFile, File, status
-import shutil, tempfile
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+import asyncio
 from app.services.ingestion_service import IngestionService
+from app.services.job_service import job_manager, JobQueueFull
+from app.services.retry_service import retry_service
+from app.config import SFTP_WATCH_PATTERN
+from app.utils.stream_io import BlockChannel, iter_blocks
+from app.utils.rejects import RejectSink
 
 router = APIRouter()
 
+
+def _submit(response: Response, kind: str, func, *args, params: dict = None, cleanup=None, **kwargs):
+    """Soumet l'ingestion au pool de jobs et répond 202 avec l'identifiant."""
+    try:
+        job = job_manager.submit(kind, func, *args, params=params, cleanup=cleanup, **kwargs)
+    except JobQueueFull as e:
+        if cleanup is not None:
+            cleanup()
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+    response.status_code = status.HTTP_202_ACCEPTED
+    return {"job_id": job.id, "state": job.state, "status_url": f"/ingest/jobs/{job.id}"}
+
+
+def _stream_consumer(file_name: str, channel: BlockChannel, include_comment: bool = False):
+    """Ingestion des blocs d'un canal ; le canal est fermé dès que l'ingestion s'arrête."""
+    def consume():
+        try:
+            return IngestionService.process_stream(file_name, channel, include_comment)
+        finally:
+            channel.close()  # débloque la réception si l'ingestion s'arrête avant la fin
+    return consume
+
+
+def _feed_channel(channel: BlockChannel, file_obj):
+    """Transmet un fichier reçu au canal, bloc par bloc, jusqu'à la fin ou l'abandon du consommateur."""
+    try:
+        for block in iter_blocks(file_obj, IngestionService.STREAM_BLOCK_SIZE):
+            if not channel.put(block):
+                return
+        channel.finish()
+    except Exception as e:
+        channel.finish(e)
+        raise
+
 @router.post("/file", status_code = status.HTTP_201_CREATED)
-async def ingest_file(file: UploadFile = File(...)):
-    tmp_dir = tempfile.mkdtemp()
-    tmp_path = f"{tmp_dir}/{file.filename}"
-    with open(tmp_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    return IngestionService.process_csv(tmp_path)
+async def ingest_file(response: Response, file: UploadFile = File(...), background: bool = True):
+    """
+    Ingestion d'un CSV envoyé en upload, lu directement dans le fichier
+    reçu (ni copie temporaire, ni relecture). Par défaut l'import tourne en
+    arrière-plan (202 + job_id) : le fichier reçu n'étant valable que le
+    temps de la requête, le job le lit au travers d'un canal borné et la
+    réponse part dès qu'il en a reçu le dernier bloc (le job termine
+    ensuite nettoyage, COPY et validation). `background=false` attend le
+    résultat. Les opérations bloquantes ne s'exécutent jamais dans la
+    boucle asyncio.
+    """
+    if not background:
+        return await run_in_threadpool(
+            IngestionService.process_stream, file.filename, iter_blocks(file.file, IngestionService.STREAM_BLOCK_SIZE)
+        )
+
+    channel = BlockChannel()
+    accepted = _submit(response, "file", _stream_consumer(file.filename, channel),
+                       params={"file": file.filename}, cleanup=channel.close)
+    await run_in_threadpool(_feed_channel, channel, file.file)
+    return accepted
+
+@router.post("/upload", status_code=status.HTTP_201_CREATED)
+async def ingest_upload(request: Request, file_name: str, include_comment: bool = False):
+    """
+    Ingestion d'un CSV envoyé brut dans le corps de la requête
+    (ex. `curl --data-binary @fichier.csv "/ingest/upload?file_name=fichier.csv"`).
+    Le corps est parsé, nettoyé et copié en base au fil de la réception :
+    ni fichier temporaire, ni relecture.
+    """
+    channel = BlockChannel()
+    consumer = asyncio.ensure_future(run_in_threadpool(_stream_consumer(file_name, channel, include_comment)))
+    try:
+        pending, size = [], 0
+        async for chunk in request.stream():
+            pending.append(chunk)
+            size += len(chunk)
+            if size < IngestionService.STREAM_BLOCK_SIZE:
+                continue
+            block, pending, size = b"".join(pending), [], 0
+            if not channel.try_put(block) and not await run_in_threadpool(channel.put, block):
+                break
+        if pending:
+            await run_in_threadpool(channel.put, b"".join(pending))
+        await run_in_threadpool(channel.finish)
+    except Exception as e:
+        # Client déconnecté en cours d'envoi : la transaction est annulée
+        await run_in_threadpool(channel.finish, e)
+        await asyncio.gather(consumer, return_exceptions=True)
+        raise
+    return await consumer
 
 @router.post("/path", status_code=status.HTTP_201_CREATED)
-def ingest_path(path: str):
+def ingest_path(response: Response, path: str, parallel: bool = False, workers: int = None,
+                background: bool = True):
     """
     Permet d'envoyer soit un fichier CSV, soit un dossier contenant plusieurs CSV.
+    `parallel=true` traite les fichiers d'un dossier en parallèle (`workers` processus max).
+    `background=false` attend la fin de l'import au lieu de renvoyer un job_id.
     """
-    return IngestionService.process_path(path)
+    if background:
+        return _submit(response, "path", IngestionService.process_path, path,
+                       params={"path": path, "parallel": parallel, "workers": workers},
+                       parallel=parallel, max_workers=workers)
+    return IngestionService.process_path(path, parallel=parallel, max_workers=workers)
 
 @router.post("/sftp", status_code=status.HTTP_201_CREATED)
-def ingest_from_sftp(remote_path: str = "/home/connecteo/files/Received/"):
+def ingest_from_sftp(response: Response, remote_path: str = "/home/connecteo/files/Received/",
+                     stream: bool = True, background: bool = True):
     """
     Ingestion directe depuis un fichier CSV sur un serveur SFTP.
+    `stream=false` force l'ancien mode (fichier entièrement chargé en mémoire).
+    `background=false` attend la fin de l'import au lieu de renvoyer un job_id.
     Exemple d'appel :
       POST /ingest/sftp?remote_path=/remote/path/mon_fichier.csv
     """
-    return IngestionService.process_sftp_file(remote_path)
+    if background:
+        return _submit(response, "sftp", IngestionService.process_sftp_file, remote_path,
+                       params={"remote_path": remote_path, "stream": stream}, stream=stream)
+    return IngestionService.process_sftp_file(remote_path, stream=stream)
+
+@router.post("/sftp/scan", status_code=status.HTTP_201_CREATED)
+def ingest_sftp_dir(response: Response, remote_dir: str = None, pattern: str = SFTP_WATCH_PATTERN,
+                    stream: bool = True, background: bool = True):
+    """
+    Liste un dossier SFTP (par défaut `remote_dir` de la config) et ingère
+    tous les fichiers nouveaux ou modifiés correspondant à `pattern`.
+    `background=false` attend la fin de l'import au lieu de renvoyer un job_id.
+    """
+    if background:
+        return _submit(response, "sftp_scan", IngestionService.process_sftp_dir, remote_dir,
+                       params={"remote_dir": remote_dir, "pattern": pattern, "stream": stream},
+                       stream=stream, pattern=pattern)
+    return IngestionService.process_sftp_dir(remote_dir, stream=stream, pattern=pattern)
 
 @router.post("/sftp/auto", status_code=status.HTTP_201_CREATED)
-def ingest_yesterday():
+def ingest_yesterday(response: Response, background: bool = True):
     """
-    Ingestion manuelle du fichier d'hier depuis le SFTP
+    Lancement manuel du passage automatique : tous les fichiers SFTP nouveaux
+    ou modifiés, jours manqués compris.
     """
-    from app.jobs.sftp_ingest_job import auto_ingest_yesterday
-    return auto_ingest_yesterday()
+    from app.jobs.sftp_ingest_job import auto_ingest_new_files
+    if background:
+        return _submit(response, "sftp_auto", auto_ingest_new_files)
+    return auto_ingest_new_files()
+
+@router.get("/jobs")
+def list_jobs(state: str = None):
+    """Jobs d'ingestion récents de tous les workers (les plus récents d'abord), filtrables par état."""
+    return job_manager.list(state)
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """État, lignes traitées, débit et erreurs d'un job d'ingestion."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job inconnu")
+    return job
+
+@router.get("/retries")
+def list_retries(state: str = None):
+    """Nouvelles tentatives d'ingestion (pending, running, succeeded, failed)."""
+    return retry_service.list(state)
+
+@router.get("/rejects")
+def list_rejects(file_name: str = None, limit: int = 100):
+    """Enregistrements mis en quarantaine à l'import (les plus récents d'abord)."""
+    return RejectSink.list(file_name, min(max(limit, 1), 1000))
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from datetime import date
+from typing import List
+from app.config import QUERY_DEFAULT_LIMIT
+from app.services.query_service import QueryService
+
+router = APIRouter()
+
+@router.get("")
+def query_calls(start: date = None, end: date = None, groupe: List[str] = Query(None),
+                numero: List[str] = Query(None), columns: str = None, cursor: str = None,
+                order: str = "desc", limit: int = QUERY_DEFAULT_LIMIT):
+    """
+    Appels de la vue en NDJSON, du plus récent au plus ancien (`order=asc`
+    pour l'inverse). Filtres : plage de dates, groupe(s), numéro(s)
+    d'appelant ; `columns` : projection séparée par des virgules. La
+    dernière ligne donne `next_cursor`, à repasser en `cursor` pour la
+    page suivante.
+    """
+    try:
+        stream = QueryService.stream_ndjson(
+            limit=limit, start=start, end=end, groupes=groupe, numeros=numero,
+            columns=columns.split(",") if columns else None, cursor=cursor, order=order,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(stream, media_type="application/x-ndjson")
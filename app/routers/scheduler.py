@@ -11,5 +11,5 @@ def run_daily():
     return SchedulerService.run_daily(CSV_DIR)
 
 @router.post("/monthly")
-def run_monthly():
-    return SchedulerService.run_monthly(SEPTEMBER_DIR)
+def run_monthly(parallel: bool = False, workers: int = None):
+    return SchedulerService.run_monthly(SEPTEMBER_DIR, parallel=parallel, max_workers=workers)
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, HTTPException
+from datetime import date
+from app.services.stats_service import StatsService
+
+router = APIRouter()
+
+@router.get("/daily")
+def stats_daily(start: date, end: date = None, groupe: str = None):
+    """Appels, durées cumulées et moyennes par jour et par groupe."""
+    return StatsService.daily(start, end or start, groupe)
+
+@router.get("/weekly")
+def stats_weekly(start: str, end: str = None, groupe: str = None):
+    """Mêmes agrégats par semaine ISO (`start`/`end` au format 2024-W37)."""
+    try:
+        return StatsService.weekly(start, end or start, groupe)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/groups")
+def stats_groups():
+    return StatsService.groups()
+
+@router.post("/rebuild")
+def stats_rebuild():
+    """Recalcule les rollups depuis la table (ex. données antérieures aux rollups)."""
+    return StatsService.rebuild()
@@ -0,0 +1,227 @@
+# app/schema.py
+import logging
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from app.config import TABLE_NAME
+
+logger = logging.getLogger(__name__)
+
+# Texte : chaînes Arrow (un buffer contigu par colonne) plutôt qu'objets Python
+STRING_DTYPE = pd.StringDtype("pyarrow")
+INT_DTYPE = pd.Int64Dtype()
+
+# type déclaré → (type PostgreSQL, dtype pandas final)
+KINDS = {
+    "text": ("text", STRING_DTYPE),
+    "integer": ("integer", INT_DTYPE),
+    "bigint": ("bigint", INT_DTYPE),
+    "date": ("date", "datetime64[ns]"),
+    "timestamp": ("timestamp without time zone", "datetime64[ns]"),
+}
+
+# Entier écrit simplement (au-delà de 18 chiffres, risque de dépassement int64)
+_PLAIN_INT = r"^-?[0-9]{1,18}$"
+
+
+@lru_cache(maxsize=256)
+def sanitize_name(name: str) -> str:
+    """En-tête de fichier → nom de colonne SQL ("Duree Appel" → "duree_appel")."""
+    name = name.strip().lower().replace(" ", "_").replace("-", "_")
+    return re.sub("[^0-9a-z_]", "", name)
+
+
+def _arrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError as e:
+        raise RuntimeError("Le schéma de colonnes nécessite le paquet pyarrow") from e
+    return pa, pc
+
+
+def _int_mapper(pa):
+    return {pa.int64(): INT_DTYPE}.get
+
+
+def arrow_to_int(values):
+    """
+    Chaînes Arrow → entiers int64, avec la tolérance de
+    `pd.to_numeric(errors="coerce")` : espaces ignorés, "12.0" ou "1e3"
+    acceptés, valeur invalide ou non entière → null. Le cas courant
+    (entiers simples) est entièrement calculé par Arrow ; seules les
+    valeurs atypiques passent par pandas.
+    """
+    pa, pc = _arrow()
+    values = pc.utf8_trim_whitespace(values)
+    values = pc.if_else(pc.equal(values, ""), pa.scalar(None, values.type), values)
+    try:
+        return pc.cast(values, pa.int64())
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        pass
+
+    plain = pc.fill_null(pc.match_substring_regex(values, _PLAIN_INT), False)
+    ints = pc.cast(pc.if_else(plain, values, pa.scalar(None, values.type)), pa.int64())
+    others = pc.and_(pc.invert(plain), pc.is_valid(values))
+    positions = np.flatnonzero(others.to_numpy(zero_copy_only=False))
+    if not len(positions):
+        return ints
+
+    numeric = pd.to_numeric(pd.Series(pc.take(values, pa.array(positions)).to_pylist()), errors="coerce")
+    numeric = numeric.where((numeric % 1 == 0) & (numeric.abs() < 2 ** 63))
+    result = ints.to_pandas(types_mapper=_int_mapper(pa))
+    result.iloc[positions] = numeric.astype(INT_DTYPE).to_numpy()
+    return pa.array(result, type=pa.int64(), from_pandas=True)
+
+
+def to_int(series: pd.Series) -> pd.Series:
+    """Série texte → Int64 (voir `arrow_to_int`) ; une série déjà entière est rendue telle quelle."""
+    if series.dtype == INT_DTYPE:
+        return series
+    pa, _ = _arrow()
+    if not isinstance(series.dtype, pd.StringDtype):
+        series = series.astype(STRING_DTYPE)
+    ints = arrow_to_int(pa.array(series, from_pandas=True)).to_pandas(types_mapper=_int_mapper(pa))
+    return ints.set_axis(series.index).rename(series.name)
+
+
+class Column:
+    """
+    Colonne de la table d'appels : nom cible (en-tête du fichier passé par
+    `sanitize_name`, comme au nettoyage), type et nullabilité. Une colonne
+    `derived` est calculée au nettoyage ; une colonne `generated` est
+    remplie par la base (jamais copiée).
+    """
+
+    def __init__(self, name: str, kind: str, nullable: bool = True, derived: bool = False,
+                 generated: bool = False):
+        if kind not in KINDS:
+            raise ValueError(f"Type de colonne inconnu : {kind}")
+        self.name = name
+        self.kind = kind
+        self.nullable = nullable
+        self.derived = derived
+        self.generated = generated
+
+    @property
+    def pg_type(self) -> str:
+        return KINDS[self.kind][0]
+
+    @property
+    def dtype(self):
+        return KINDS[self.kind][1]
+
+    @property
+    def is_int(self) -> bool:
+        return self.dtype == INT_DTYPE
+
+    def __repr__(self):
+        return f"Column({self.name!r}, {self.kind!r})"
+
+
+class TableSchema:
+    """
+    Registre des colonnes d'une table : sert au parsing (noms cibles et
+    types dès la lecture, texte en chaînes Arrow), au nettoyage (colonnes
+    numériques) et aux listes de colonnes du COPY.
+    """
+
+    def __init__(self, table: str, columns: list):
+        self.table = table
+        self.columns = list(columns)
+        self._by_name = {c.name: c for c in self.columns}
+        self._unknown_logged = set()
+
+    def __getitem__(self, name: str) -> Column:
+        return self._by_name[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def get(self, name: str) -> Column:
+        return self._by_name.get(name)
+
+    @property
+    def names(self) -> list:
+        return [c.name for c in self.columns]
+
+    @property
+    def int_columns(self) -> list:
+        return [c.name for c in self.columns if c.is_int and not c.generated]
+
+    def target_names(self, headers) -> list:
+        """Noms cibles des en-têtes d'un fichier (renommage fait une fois, à la lecture)."""
+        return [sanitize_name(h) for h in headers]
+
+    def read_dtypes(self, names) -> dict:
+        """dtype de lecture par colonne (noms cibles) : tout en chaînes Arrow, converties ensuite."""
+        return {name: STRING_DTYPE for name in names}
+
+    def convert(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Colonnes entières d'un chunk fraîchement parsé converties en Int64 (sur place)."""
+        for name in df.columns:
+            column = self._by_name.get(name)
+            if column is not None and column.is_int:
+                df[name] = to_int(df[name])
+        return df
+
+    def convert_table(self, table):
+        """Même conversion sur une table Arrow, avant passage en pandas."""
+        for i, name in enumerate(table.column_names):
+            column = self._by_name.get(name)
+            if column is not None and column.is_int:
+                table = table.set_column(i, name, arrow_to_int(table.column(i)))
+        return table
+
+    def to_pandas(self, table) -> pd.DataFrame:
+        """Table Arrow → DataFrame aux types finaux (chaînes Arrow, Int64)."""
+        pa, _ = _arrow()
+        mapping = {pa.string(): STRING_DTYPE, pa.large_string(): STRING_DTYPE, pa.int64(): INT_DTYPE}
+        return self.convert_table(table).to_pandas(types_mapper=mapping.get)
+
+    def copy_columns(self, columns) -> list:
+        """
+        Colonnes d'un chunk à copier : celles du schéma dans son ordre, puis
+        les colonnes non déclarées, copiées telles quelles (texte) comme
+        avant le schéma — si la table ne les a pas, le COPY échoue au lieu
+        de perdre les données. Les colonnes non déclarées sont signalées une fois.
+        """
+        present = set(columns)
+        unknown = [c for c in columns if c not in self._by_name]
+        for name in unknown:
+            if name not in self._unknown_logged:
+                self._unknown_logged.add(name)
+                logger.warning(f"[SCHEMA] Colonne '{name}' non déclarée dans le schéma de {self.table}, copiée en texte")
+        return [c.name for c in self.columns if c.name in present and not c.generated] + unknown
+
+    def pg_types(self, names=None) -> dict:
+        """Types PostgreSQL déclarés (encodage COPY binaire sans base) ; texte pour une colonne non déclarée."""
+        names = self.names if names is None else names
+        return {
+            n: self._by_name[n].pg_type if n in self._by_name else "text"
+            for n in names if n not in self._by_name or not self._by_name[n].generated
+        }
+
+
+# Table d'appels VocalCom : colonnes du fichier *_VocalCom_Incoming.csv (noms assainis,
+# ceux qu'attend DataCleaner) puis colonnes calculées au nettoyage
+CALL_LOGS = TableSchema(TABLE_NAME, [
+    Column("id", "bigint", nullable=False, generated=True),
+    Column("date_appel", "date"),
+    Column("heure_appel", "text"),
+    Column("numero_telephone", "text"),
+    Column("numero_court", "integer"),
+    Column("duree_appel", "integer"),
+    Column("duree_prise_en_charge", "integer"),
+    Column("duree_post_travail_agent", "integer"),
+    Column("indice", "integer"),
+    Column("raccrochage", "integer"),
+    Column("groupe", "text"),
+    Column("commentaire", "text"),  # importée seulement avec include_comment
+    Column("semaine", "integer", derived=True),
+    Column("datetime_appel", "timestamp", derived=True),
+    Column("numero_telephone_clean", "text", derived=True),
+])
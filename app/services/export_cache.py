@@ -0,0 +1,193 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from sqlalchemy import text
+from app.config import EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_BYTES, EXPORT_CACHE_ENABLED
+from app.database import get_engine
+from app.utils.range_filters import iso_week_range
+
+logger = logging.getLogger(__name__)
+
+READ_BLOCK_SIZE = 256 * 1024
+
+
+def _weeks_between(low: date, high: date) -> set:
+    """Numéros de semaine ISO couverts par une plage de dates."""
+    weeks = set()
+    day = low
+    while day <= high and len(weeks) < 53:
+        weeks.add(day.isocalendar()[1])
+        day += timedelta(days=1)
+    return weeks
+
+
+class ExportCache:
+    """
+    Cache disque des exports, un fichier par (vue, type de plage, bornes,
+    format). Chaque entrée mémorise le dernier imported_files.id connu lors
+    de sa génération ; à la lecture, seuls les imports plus récents dont la
+    plage de dates recoupe celle de l'entrée l'invalident. L'éviction est
+    LRU (date de dernier accès = mtime du fichier) et bornée en octets.
+    Le cache est partagé entre processus : écritures atomiques par rename.
+    """
+
+    def __init__(self, directory: str = EXPORT_CACHE_DIR, max_bytes: int = EXPORT_CACHE_MAX_BYTES,
+                 enabled: bool = EXPORT_CACHE_ENABLED):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+
+    # -------------------------------------------------------------------------
+    def _key(self, view: str, kind: str, start, end, fmt: str) -> str:
+        raw = f"{view}|{kind}|{start}|{end}|{fmt}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _paths(self, key: str):
+        base = os.path.join(self.directory, key)
+        return base + ".data", base + ".json"
+
+    @staticmethod
+    def _watermark(conn) -> int:
+        return conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM imported_files")).scalar()
+
+    @staticmethod
+    def _touches(meta: dict, min_date, max_date) -> bool:
+        """Un import couvrant [min_date, max_date] modifie-t-il cette entrée ?"""
+        if meta["kind"] == "all":
+            return True
+        if min_date is None:
+            return False  # aucune ligne datée : n'apparaît dans aucune plage
+        if meta["kind"] == "date":
+            return min_date <= date.fromisoformat(meta["end"]) and max_date >= date.fromisoformat(meta["start"])
+        # Semaines : même comparaison que la requête d'export
+        bounds = iso_week_range(meta["start"], meta["end"])
+        if bounds is not None:
+            return min_date <= bounds[1] and max_date >= bounds[0]
+        weeks = _weeks_between(min_date, max_date)
+        return any(int(meta["start"]) <= w <= int(meta["end"]) for w in weeks)
+
+    def _is_fresh(self, meta: dict, meta_path: str) -> bool:
+        with get_engine().connect() as conn:
+            rows = conn.execute(
+                text("SELECT id, min_date, max_date FROM imported_files WHERE id > :wm ORDER BY id"),
+                {"wm": meta["watermark"]}
+            ).fetchall()
+
+        if any(self._touches(meta, r.min_date, r.max_date) for r in rows):
+            return False
+
+        if rows:
+            # Imports sans impact : on avance le watermark pour ne plus les relire
+            meta["watermark"] = rows[-1].id
+            self._write_meta(meta_path, meta)
+        return True
+
+    def _write_meta(self, meta_path: str, meta: dict):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, meta_path)
+
+    def _remove(self, key: str):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        """Supprime les entrées les moins récemment lues au-delà de max_bytes."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".data"):
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name[:-5]))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(key)
+            total -= size
+            logger.info(f"[CACHE] Éviction de l'entrée {key} ({size} octets)")
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _read(data_path: str):
+        # Ouvert immédiatement : une éviction concurrente n'interrompt pas la lecture
+        f = open(data_path, "rb")
+
+        def blocks():
+            with f:
+                while True:
+                    block = f.read(READ_BLOCK_SIZE)
+                    if not block:
+                        break
+                    yield block
+
+        return blocks()
+
+    def _fill(self, key: str, meta: dict, producer):
+        """Relaie le flux produit tout en l'écrivant dans le cache."""
+        data_path, meta_path = self._paths(key)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        completed = False
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for block in producer():
+                    f.write(block)
+                    yield block
+            completed = True
+        finally:
+            if completed:
+                os.replace(tmp, data_path)
+                self._write_meta(meta_path, meta)
+                self._evict()
+            else:
+                os.remove(tmp)
+
+    def stream(self, view: str, kind: str, start, end, fmt: str, producer):
+        """
+        Retourne un générateur d'octets pour l'export demandé : depuis le
+        cache si l'entrée est à jour, sinon depuis `producer()` (avec mise
+        en cache au passage). `kind` : "date", "week" ou "all".
+        """
+        if not self.enabled:
+            return producer()
+
+        os.makedirs(self.directory, exist_ok=True)
+        key = self._key(view, kind, start, end, fmt)
+        data_path, meta_path = self._paths(key)
+
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if os.path.exists(data_path) and self._is_fresh(meta, meta_path):
+                blocks = self._read(data_path)
+                os.utime(data_path)  # accès récent pour l'éviction LRU
+                logger.info(f"[CACHE] Export servi depuis le cache ({kind} {start} → {end}, {fmt})")
+                return blocks
+            self._remove(key)
+            logger.info(f"[CACHE] Entrée invalidée par un nouvel import ({kind} {start} → {end})")
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+
+        # Watermark pris AVANT l'export : un import concurrent sera revérifié
+        with get_engine().connect() as conn:
+            watermark = self._watermark(conn)
+        meta = {
+            "view": view, "kind": kind, "start": str(start), "end": str(end),
+            "format": fmt, "watermark": watermark, "created_at": time.time(),
+        }
+        return self._fill(key, meta, producer)
+
+
+export_cache = ExportCache()
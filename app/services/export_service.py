@@ -1,51 +1,53 @@
-import pandas as pd
-from app.db_writer import DBWriter
-from app.config import DB_CONFIG, TABLE_NAME, VIEW_NAME
+from app.database import get_engine
+from app.config import VIEW_NAME
+from app.utils.pg_copy import iter_copy_out
+from app.services.export_cache import export_cache
+from app.utils.range_filters import date_range_filter, week_range_filter
 from datetime import date
-import os
 
 class ExportService:
     @staticmethod
-    def export_csv_by_date(start_date: date, end_date: date, output_path="export.csv"):
-        db_writer = DBWriter(DB_CONFIG, TABLE_NAME, VIEW_NAME)
-        engine = db_writer.get_engine()
-
-        query = f"""
-            SELECT * FROM public.{VIEW_NAME}
-            WHERE date_appel::date BETWEEN '{start_date}' AND '{end_date}'
+    def _copy_sql(query: str, params: dict = None) -> str:
         """
-        df = pd.read_sql(query, engine)
-        df.to_csv(output_path, index=False, encoding="utf-8")
-        return os.path.abspath(output_path)
-    
-    @staticmethod
-    def export_csv_by_week(start_week: str, end_week: str, output_path="export.csv"):
-        db_writer = DBWriter(DB_CONFIG, TABLE_NAME, VIEW_NAME)
-        engine = db_writer.get_engine()
-
-        query = f"""
-            SELECT * FROM public.{VIEW_NAME}
-            WHERE semaine::text BETWEEN '{start_week}' AND '{end_week}'
+        COPY n'accepte pas de paramètres liés : la requête est rendue avec
+        l'échappement de psycopg2 (mogrify) avant d'être enveloppée.
         """
-        df = pd.read_sql(query, engine)
-        df.to_csv(output_path, index=False, encoding="utf-8")
-        return os.path.abspath(output_path)
-    
-    @staticmethod
-    def export_all_to_csv(output_dir="./directory"):
-        db_writer = DBWriter(DB_CONFIG, TABLE_NAME, VIEW_NAME)
-        engine = db_writer.get_engine()
+        conn = get_engine().raw_connection()
+        try:
+            cur = conn.cursor()
+            rendered = cur.mogrify(query, params).decode("utf-8") if params else query
+            cur.close()
+        finally:
+            conn.close()
+        return f"COPY ({rendered}) TO STDOUT WITH (FORMAT csv, HEADER true, ENCODING 'UTF8')"
 
-        # Si c’est un dossier → crée le fichier à l’intérieur
-        if os.path.isdir(output_dir):
-            output_path = os.path.join(output_dir, "incoming_all_data.csv")
-        else:
-            output_path = output_dir  # si un chemin complet a été passé
+    @staticmethod
+    def stream_csv_by_date(start_date: date, end_date: date, gzip: bool = False):
+        """Générateur d'octets CSV (COPY TO STDOUT) pour une plage de dates."""
+        condition, params = date_range_filter(start_date, end_date)
+        query = f"SELECT * FROM public.{VIEW_NAME} WHERE {condition}"
+        sql = ExportService._copy_sql(query, params)
+        return export_cache.stream(
+            VIEW_NAME, "date", start_date, end_date, "csv.gz" if gzip else "csv",
+            lambda: iter_copy_out(get_engine(), sql, gzip=gzip)
+        )
 
-        query = f"""
-            SELECT * FROM public.{VIEW_NAME}
-        """
-        df = pd.read_sql(query, engine)
-        df.to_csv(output_path, index=False, encoding="utf-8")
-        return os.path.abspath(output_path)
+    @staticmethod
+    def stream_csv_by_week(start_week: str, end_week: str, gzip: bool = False):
+        """Générateur d'octets CSV (COPY TO STDOUT) pour une plage de semaines."""
+        condition, params = week_range_filter(start_week, end_week)
+        query = f"SELECT * FROM public.{VIEW_NAME} WHERE {condition}"
+        sql = ExportService._copy_sql(query, params)
+        return export_cache.stream(
+            VIEW_NAME, "week", start_week, end_week, "csv.gz" if gzip else "csv",
+            lambda: iter_copy_out(get_engine(), sql, gzip=gzip)
+        )
 
+    @staticmethod
+    def stream_all_csv(gzip: bool = False):
+        """Générateur d'octets CSV (COPY TO STDOUT) pour toute la vue."""
+        sql = ExportService._copy_sql(f"SELECT * FROM public.{VIEW_NAME}")
+        return export_cache.stream(
+            VIEW_NAME, "all", None, None, "csv.gz" if gzip else "csv",
+            lambda: iter_copy_out(get_engine(), sql, gzip=gzip)
+        )
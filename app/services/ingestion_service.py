@@ -1,79 +1,447 @@
 import errno
+from fnmatch import fnmatch
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from io import StringIO
+import multiprocessing
+from itertools import chain
 import os
+import posixpath
 import logging
-from time import time
+from time import perf_counter
 import pandas as pd
-from sqlalchemy import create_engine
 from app.csv_reader import CSVReader
 from app.data_cleaner import DataCleaner
-from app.db_writer import DBWriter
-from app.config import DB_CONFIG, TABLE_NAME, VIEW_NAME, SFTP_CONFIG
+from app.db_writer import DBWriter, ImportSession
+from app.database import get_engine, configure_pool
+from app.config import (
+    DB_CONFIG, TABLE_NAME, VIEW_NAME, SFTP_CONFIG, CSV_ENGINE,
+    INGEST_MAX_WORKERS, INGEST_MAX_DB_CONNECTIONS, ENCODING_SAMPLE_SIZE, INGEST_CHECKPOINT_BYTES,
+    SFTP_WATCH_PATTERN,
+)
 from app.utils.sftp_client import SFTPClient  # 🔹 nouvelle classe
-from app.utils.sftp_csv_reader import SFTPCSVReader
+from app.utils.sftp_watch import remote_file_cache
+from app.utils.sftp_pool import sftp_pool
+from app.services.retry_service import retry_service
+from paramiko.ssh_exception import SSHException
+from app.utils.csv_tokenizer import read_stripped_csv, iter_record_segments
+from app.utils.stream_io import IterStream, iter_decoded_lines
+from app.utils.encoding import Utf8Transcoder, encoding_profiles, profile_source
+from app.utils.fingerprint import ContentDigest, read_range
+from app.utils.rejects import RejectSink
+from app.utils.advisory_locks import advisory_lock
+from app.schema import CALL_LOGS
+from app.utils import progress, metrics
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
 
 logger = logging.getLogger("AUTO")
 
+
+# Pool d'un worker d'ingestion : une connexion d'import, celle du verrou du fichier
+# (qui porte aussi la quarantaine des rejets) et une connexion courte (partitions,
+# dédoublonnage)
+INGEST_WORKER_POOL = {"pool_size": 1, "max_overflow": 2}
+INGEST_WORKER_CONNECTIONS = INGEST_WORKER_POOL["pool_size"] + INGEST_WORKER_POOL["max_overflow"]
+
+
+def _init_ingest_worker():
+    """Initialisation d'un worker : pool borné à INGEST_WORKER_CONNECTIONS connexions."""
+    configure_pool(**INGEST_WORKER_POOL)
+
+
+def _process_csv_isolated(path: str, include_comment=False):
+    """
+    Traite un fichier sans jamais lever d'exception : une erreur sur un
+    fichier n'interrompt pas le traitement des autres.
+    """
+    start = perf_counter()
+    try:
+        result = IngestionService.process_csv(path, include_comment)
+    except Exception as e:
+        logger.error(f"[INGESTION] Échec sur {path} : {e}", exc_info=True)
+        result = {"status": "error", "file": os.path.basename(path), "message": str(e)}
+    result["duration_s"] = round(perf_counter() - start, 3)
+    return result
+
 class IngestionService:
     CHUNK_SIZE = 5000
-    BAD_LINES_PATH = "bad_lines.csv"
+    STREAM_BLOCK_SIZE = 1024 * 1024  # taille des lectures SFTP en mode streaming
+    ENCODING_SAMPLE_SIZE = ENCODING_SAMPLE_SIZE  # échantillon utilisé pour la détection d'encodage
+    SFTP_ENCODING_SOURCE = f"sftp:{SFTP_CONFIG['host']}"
+    # Erreurs transitoires (hors fichier verrouillé) : nouvelle tentative différée
+    TRANSIENT_ERRORS = (ConnectionError, EOFError, TimeoutError, SSHException)
+    # Issues définitives d'un import (le fichier n'est plus à reprendre) ;
+    # "in_progress" (import en cours dans un autre processus) n'en fait pas partie
+    DONE_STATUSES = ("success", "skipped", "duplicate")
     
     @staticmethod
+    def _plan_import(writer: DBWriter, file_name: str, size: int, open_source):
+        """
+        Décide du traitement d'un fichier d'après les empreintes enregistrées :
+          - même nom, taille inchangée (ou plus petite) → déjà importé ;
+          - même nom, fichier plus long dont le début correspond exactement à
+            l'import précédent → seuls les octets ajoutés seront ingérés ;
+          - autre nom, même taille et même sha256 qu'un import → doublon.
+        Le hash complet n'est calculé à l'avance que si un import de même
+        taille existe. L'empreinte retournée couvre [0, offset) et se
+        complète pendant l'ingestion.
+        Retourne (résultat final ou None, ContentDigest, offset de reprise).
+        """
+        digest = ContentDigest()
+        previous = writer.find_import(file_name)
+        if previous is not None:
+            if previous.byte_length is None or size <= previous.byte_length:
+                if previous.byte_length is not None and size < previous.byte_length:
+                    logger.warning(f"[DEDUP] {file_name} est plus court que lors de son import, ignoré")
+                return {"status": "skipped", "file": file_name}, None, 0
+
+            with open_source() as f:
+                for block in read_range(f, 0, previous.byte_length):
+                    digest.update(block)
+            if digest.hexdigest() != previous.content_hash or digest.last_byte != b"\n":
+                logger.error(f"[DEDUP] {file_name} a été modifié depuis son import : ajout impossible")
+                return {
+                    "status": "error", "file": file_name,
+                    "message": "Contenu modifié depuis le dernier import (seuls les ajouts en fin de fichier sont gérés)"
+                }, None, 0
+            if writer.has_size(size):
+                # Version complète peut-être déjà importée sous un autre nom
+                probe = digest.copy()
+                with open_source() as f:
+                    for block in read_range(f, previous.byte_length):
+                        probe.update(block)
+                original = writer.find_by_content(probe.hexdigest(), probe.length)
+                if original is not None:
+                    logger.info(f"[DEDUP] {file_name} est désormais identique à {original}, ajout ignoré")
+                    writer.update_fingerprint(file_name, probe.hexdigest(), probe.length)
+                    return {"status": "duplicate", "file": file_name, "duplicate_of": original}, None, 0
+
+            logger.info(f"[DEDUP] {file_name} a grossi de {size - previous.byte_length} octets : ingestion de l'ajout")
+            return None, digest, previous.byte_length
+
+        if writer.has_size(size):
+            probe = ContentDigest()
+            with open_source() as f:
+                for block in read_range(f):
+                    probe.update(block)
+            original = writer.find_by_content(probe.hexdigest(), probe.length)
+            if original is not None:
+                logger.info(f"[DEDUP] {file_name} est identique à {original}, ignoré")
+                writer.log_import(file_name, probe.hexdigest(), probe.length, 0)
+                return {"status": "duplicate", "file": file_name, "duplicate_of": original}, None, 0
+        return None, digest, 0
+
+    @staticmethod
+    def _source_blocks(file_like, digest: ContentDigest, start: int = 0, block_size: int = 1024 * 1024,
+                       read_stage: str = "read"):
+        """
+        Blocs à ingérer d'un seul tenant à partir de `start` (chemins sans
+        checkpoint) ; en reprise, l'en-tête du fichier est remis devant les
+        octets ajoutés. Les blocs alimentent l'empreinte.
+        """
+        blocks = digest.wrap(metrics.timed(read_stage, read_range(file_like, start, block_size=block_size), nbytes=len))
+        if start:
+            blocks = chain([digest.header], blocks)
+        return blocks
+
+    @staticmethod
+    def _ingest_resumable(writer: DBWriter, session: ImportSession, file_name: str, open_source,
+                          digest: ContentDigest, start: int, encoding: str, copy_segment,
+                          block_size: int = 1024 * 1024, read_stage: str = "read", rejects: RejectSink = None):
+        """
+        Ingère les octets [start, fin) par segments alignés sur les
+        enregistrements (INGEST_CHECKPOINT_BYTES). Chaque segment sauf le
+        dernier est validé avec un checkpoint (offset, hash du préfixe,
+        lignes) dans la même transaction que ses données ; le dernier l'est
+        par `session.commit()`. Un fichier plus petit qu'un segment reste donc
+        importé en une seule transaction.
+        Si un checkpoint existe, la lecture reprend à son offset une fois le
+        préfixe vérifié. `copy_segment(blocks, encoding, line_offset)` copie un
+        segment (`line_offset` : lignes du fichier qui le précèdent, en-tête
+        non compris) et retourne l'encodage final. Retourne (offset de départ
+        effectif, encodage).
+        `read_stage` : étape de mesure des lectures ("read" local, "download" SFTP).
+        Les rejets de `rejects` déjà enregistrés pour les lignes relues sont remplacés.
+        """
+        checkpoint = writer.find_checkpoint(file_name)
+        if checkpoint is not None and checkpoint.byte_offset > start:
+            with open_source() as f:
+                blocks = read_range(f, start, checkpoint.byte_offset, block_size)
+                for block in metrics.timed(read_stage, blocks, nbytes=len):
+                    digest.update(block)
+            if digest.hexdigest() != checkpoint.prefix_hash:
+                raise ValueError(
+                    f"{file_name} ne correspond plus au checkpoint (octet {checkpoint.byte_offset}) : reprise impossible"
+                )
+            session.resume(checkpoint)
+            start = checkpoint.byte_offset
+            logger.info(f"[INGESTION] Reprise de {file_name} à l'octet {start} ({checkpoint.row_count} lignes déjà validées)")
+        if rejects is not None:
+            rejects.reset_from(digest.lines + 1 if start else 0)
+
+        segment_size = INGEST_CHECKPOINT_BYTES or float("inf")
+        with open_source() as f:
+            blocks = metrics.timed(read_stage, read_range(f, start, block_size=block_size), nbytes=len)
+            segments = iter_record_segments(blocks, segment_size)
+            segment = next(segments, None)
+            if segment is None and start == 0:
+                raise ValueError("Fichier CSV vide ou illisible")
+            while segment is not None:
+                following = next(segments, None)
+                first = digest.length == 0
+                line_offset = max(digest.lines - 1, 0)
+                digest.update(segment)
+                encoding = copy_segment([segment] if first else [digest.header, segment], encoding, line_offset)
+                if following is not None:
+                    with metrics.stage("commit"):
+                        session.checkpoint(digest.length, digest.hexdigest())
+                segment = following
+        return start, encoding
+
+    @staticmethod
+    def _take_sample(blocks, size: int):
+        """Accumule au moins `size` octets en tête de flux ; retourne (échantillon, suite)."""
+        blocks = iter(blocks)
+        sample = b""
+        for block in blocks:
+            sample += block
+            if len(sample) >= size:
+                break
+        return sample, blocks
+
+    @staticmethod
+    def _clean_chunks(chunks):
+        """Chunks parsés puis nettoyés, avec mesure des deux étapes."""
+        chunks = metrics.timed("parse", chunks, rows=len)
+        return metrics.timed("clean", (DataCleaner.clean(chunk) for chunk in chunks), rows=len)
+
+    @staticmethod
+    def _copy_blocks(session: ImportSession, blocks, encoding: str, source: str,
+                     include_comment=False, chunksize=50000, rejects: RejectSink = None, line_offset: int = 0):
+        """Tokenise, nettoie et copie un flux de blocs ; retourne (lignes, encodage final)."""
+        transcoder = Utf8Transcoder(blocks, encoding)
+        chunks = CSVReader.read_blocks(
+            transcoder, encoding, chunksize, include_comment, rejects=rejects, line_offset=line_offset
+        )
+        total_rows = session.copy_chunks(IngestionService._clean_chunks(chunks))
+        if transcoder.switches:
+            encoding_profiles.remember(source, transcoder.encoding)
+        return total_rows, transcoder.encoding
+
+    @staticmethod
+    @metrics.instrumented("csv")
     def process_csv(path: str, include_comment=False):
         file_name = os.path.basename(path)
-        writer = DBWriter(DB_CONFIG, TABLE_NAME, VIEW_NAME)
+        with advisory_lock(f"ingest:{file_name}") as lock_conn:
+            if lock_conn is None:
+                return IngestionService._in_progress(file_name)
+            writer = DBWriter(DB_CONFIG, TABLE_NAME, VIEW_NAME)
+            open_source = lambda: open(path, "rb")
 
-        if writer.already_imported(file_name):
-            writer.close()
-            return {"status": "skipped", "file": file_name}
+            with metrics.stage("dedup"):
+                result, digest, start = IngestionService._plan_import(
+                    writer, file_name, os.path.getsize(path), open_source
+                )
+            if result is not None:
+                writer.close()
+                return result
 
-        reader = CSVReader(path, chunksize=50000, include_comment=include_comment)
+            rejects = RejectSink(file_name, conn=lock_conn)
+            reader = CSVReader(path, chunksize=50000, include_comment=include_comment, rejects=rejects)
+            resumed_from = start
 
-        total_rows = 0
-        for i, chunk in enumerate(reader.get_chunks()):
-            clean_df = DataCleaner.clean(chunk)
-            writer.copy_dataframe(clean_df)
-            total_rows += len(clean_df)
+            # Un seul COPY par segment ; une seule transaction sous INGEST_CHECKPOINT_BYTES
+            with rejects, writer.session(file_name) as session:
+                if reader.engine == "python" and not start:
+                    # Ancien chemin (comparaison), sans reprise : l'empreinte est calculée à part
+                    rejects.reset_from(0)
+                    with open_source() as f:
+                        for _ in IngestionService._source_blocks(f, digest):
+                            pass
+                    session.copy_chunks(IngestionService._clean_chunks(reader.get_chunks()))
+                else:
+                    copy_segment = lambda blocks, encoding, line_offset: IngestionService._copy_blocks(
+                        session, blocks, encoding, reader.source, include_comment, reader.chunksize,
+                        rejects, line_offset
+                    )[1]
+                    resumed_from, _ = IngestionService._ingest_resumable(
+                        writer, session, file_name, open_source, digest, start, reader.encoding, copy_segment,
+                        rejects=rejects
+                    )
+                session.set_fingerprint(digest.hexdigest(), digest.length, append=start > 0)
+                with metrics.stage("commit"):
+                    session.commit()
 
-        writer.log_import(file_name)
-        writer.close()
-        return {"status": "success", "file": file_name, "rows": total_rows}
+            writer.close()
+            result = {"status": "success", "file": file_name, "rows": session.rows, "rejects": rejects.summary()}
+            if start:
+                result["appended_from_byte"] = start
+            if resumed_from > start:
+                result["resumed_from_byte"] = resumed_from
+            return result
     
     
     @staticmethod
-    def process_path(path: str, include_comment=False):
+    @metrics.instrumented("upload")
+    def process_stream(file_name: str, blocks, include_comment=False):
+        """
+        Ingère un CSV reçu sous forme de blocs bytes (ex. corps d'un upload)
+        sans passer par le disque : l'encodage est détecté sur le premier
+        échantillon, puis parsing, nettoyage et COPY avancent au rythme de
+        la réception. La taille n'étant pas connue à l'avance, un contenu
+        déjà importé sous un autre nom est détecté à la fin (annulation).
+        """
+        with advisory_lock(f"ingest:{file_name}") as lock_conn:
+            if lock_conn is None:
+                return IngestionService._in_progress(file_name)
+            writer = DBWriter(DB_CONFIG, TABLE_NAME, VIEW_NAME)
+            if writer.already_imported(file_name):
+                return {"status": "skipped", "file": file_name}
+
+            digest = ContentDigest()
+            blocks = metrics.timed("read", blocks, nbytes=len)
+            sample, blocks = IngestionService._take_sample(digest.wrap(blocks), IngestionService.ENCODING_SAMPLE_SIZE)
+            if not sample:
+                raise ValueError("Fichier CSV vide ou illisible")
+
+            source = profile_source(file_name)
+            encoding = encoding_profiles.resolve(source, sample)
+            logger.info(f"[UPLOAD] Encodage détecté pour {file_name} : {encoding}")
+
+            rejects = RejectSink(file_name, conn=lock_conn)
+            rejects.reset_from(0)
+            with rejects, writer.session(file_name) as session:
+                total_rows, encoding = IngestionService._copy_blocks(
+                    session, chain([sample], blocks), encoding, source, include_comment, rejects=rejects
+                )
+                original = writer.find_by_content(digest.hexdigest(), digest.length)
+                if original is not None:
+                    session.rollback()
+                    rejects.discard()
+                    logger.info(f"[DEDUP] {file_name} est identique à {original}, import annulé")
+                    writer.log_import(file_name, digest.hexdigest(), digest.length, 0)
+                    return {"status": "duplicate", "file": file_name, "duplicate_of": original}
+                session.set_fingerprint(digest.hexdigest(), digest.length)
+                with metrics.stage("commit"):
+                    session.commit()
+
+            return {
+                "status": "success", "file": file_name, "rows": total_rows, "encoding": encoding,
+                "rejects": rejects.summary(),
+            }
+
+    @staticmethod
+    def process_many(paths, include_comment=False, max_workers=None):
+        """
+        Ingère plusieurs fichiers en parallèle dans un pool de processus.
+        Chaque fichier est isolé (une erreur n'affecte pas les autres) et
+        obtient son propre résultat, dans l'ordre des chemins fournis.
+        Le nombre de workers est plafonné pour que l'ensemble des workers
+        ne dépasse pas INGEST_MAX_DB_CONNECTIONS connexions, chacun pouvant
+        en ouvrir INGEST_WORKER_CONNECTIONS.
+        """
+        paths = list(paths)
+        workers = min(
+            max_workers or INGEST_MAX_WORKERS,
+            INGEST_MAX_DB_CONNECTIONS // INGEST_WORKER_CONNECTIONS,
+            len(paths),
+        )
+        if workers <= 1:
+            return [_process_csv_isolated(p, include_comment) for p in paths]
+
+        logger.info(f"[INGESTION] {len(paths)} fichier(s) à traiter avec {workers} worker(s)")
+        results = IngestionService._run_pool(paths, include_comment, workers)
+
+        # Worker tué (OOM...) : le pool entier est cassé et tous ses fichiers
+        # inachevés aussi ; ils sont relancés dans un nouveau pool
+        remaining = [p for p in paths if p not in results]
+        if remaining:
+            logger.warning(f"[INGESTION] Pool de workers interrompu : {len(remaining)} fichier(s) relancé(s)")
+            results.update(IngestionService._run_pool(remaining, include_comment, min(workers, len(remaining))))
+            remaining = [p for p in paths if p not in results]
+
+        # Nouvelle interruption : un worker par fichier, seul le fichier fautif est en erreur
+        for path in remaining:
+            results.update(IngestionService._run_pool([path], include_comment, 1))
+            if path not in results:
+                results[path] = {
+                    "status": "error", "file": os.path.basename(path),
+                    "message": "Worker d'ingestion arrêté brutalement pendant ce fichier",
+                }
+                logger.error(f"[INGESTION] {os.path.basename(path)} → error (worker arrêté brutalement)")
+
+        return [results[p] for p in paths]
+
+    @staticmethod
+    def _run_pool(paths, include_comment, workers) -> dict:
+        """
+        Traite `paths` dans un pool de processus neuf ; retourne les résultats
+        des fichiers terminés (chemin → résultat). Si un worker meurt, les
+        fichiers inachevés sont absents du résultat.
+        """
+        results = {}
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_ingest_worker,
+        ) as pool:
+            futures = {pool.submit(_process_csv_isolated, p, include_comment): p for p in paths}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    results[path] = future.result()
+                except BrokenProcessPool:
+                    continue
+                # Mesures prises dans le worker : reportées dans le registre de ce processus
+                if "metrics" in results[path]:
+                    metrics.record("csv", results[path]["status"], results[path]["metrics"])
+                # Les workers sont d'autres processus : progression remontée fichier par fichier
+                progress.report(results[path].get("rows", 0), results[path]["file"])
+                logger.info(f"[INGESTION] {os.path.basename(path)} → {results[path]['status']}")
+        return results
+
+    @staticmethod
+    def process_path(path: str, include_comment=False, parallel=False, max_workers=None):
         """
         Si path = dossier → traite tous les CSV à l’intérieur.
         Si path = fichier → traite le fichier unique.
+        `parallel=True` répartit les fichiers d'un dossier sur un pool de processus.
         """
         if os.path.isdir(path):
+            files = [
+                os.path.join(path, file)
+                for file in os.listdir(path)
+                if file.lower().endswith(".csv")
+            ]
+            if parallel:
+                return IngestionService.process_many(files, include_comment, max_workers)
+
             results = []
-            for file in os.listdir(path):
-                if file.lower().endswith(".csv"):
-                    file_path = os.path.join(path, file)
-                    res = IngestionService.process_csv(file_path, include_comment)
-                    results.append(res)
+            for file_path in files:
+                res = IngestionService.process_csv(file_path, include_comment)
+                results.append(res)
             return results
         else:
             return IngestionService.process_csv(path, include_comment)
 
     @staticmethod
-    def clean_csv_remove_comment_column(raw_data: bytes, encoding: str) -> StringIO:
+    def iter_lines_without_comment_column(lines):
         """
-        Supprime la dernière colonne (COMMENTAIRE) de chaque ligne CSV avant lecture.
-        Cette approche évite les erreurs liées aux retours à la ligne dans le champ commentaire.
+        Version streaming de `clean_csv_remove_comment_column` : consomme un
+        itérateur de lignes décodées et produit les lignes sans la colonne
+        COMMENTAIRE, sans jamais matérialiser le fichier complet.
         """
-        decoded = raw_data.decode(encoding, errors="ignore").splitlines()
+        lines = iter(lines)
+        first = next(lines, None)
 
         # Si le fichier est vide
-        if not decoded:
+        if first is None:
             raise ValueError("Fichier CSV vide ou illisible")
 
         # Détection de la colonne COMMENTAIRE
-        header = decoded[0].split(",")
+        header = first.split(",")
         if "COMMENTAIRE" in header:
             comment_idx = header.index("COMMENTAIRE")
             logger.info(f"[CLEAN] Colonne 'COMMENTAIRE' détectée à l’index {comment_idx}, suppression.")
@@ -81,96 +449,299 @@ class IngestionService:
             comment_idx = None
             logger.warning("[CLEAN] Aucune colonne 'COMMENTAIRE' détectée, rien à supprimer.")
 
-        cleaned_lines = []
-        for line in decoded:
+        for line in chain([first], lines):
             # on coupe avant la colonne commentaire si elle existe
             if comment_idx is not None:
                 parts = line.split(",")
                 if len(parts) > comment_idx:
                     parts = parts[:comment_idx]
-                cleaned_lines.append(",".join(parts))
+                yield ",".join(parts)
             else:
-                cleaned_lines.append(line)
+                yield line
+
+    @staticmethod
+    def clean_csv_remove_comment_column(raw_data: bytes, encoding: str) -> StringIO:
+        """
+        Supprime la dernière colonne (COMMENTAIRE) de chaque ligne CSV avant lecture.
+        Cette approche évite les erreurs liées aux retours à la ligne dans le champ commentaire.
+        """
+        decoded = raw_data.decode(encoding, errors="ignore").splitlines()
+        cleaned_lines = IngestionService.iter_lines_without_comment_column(decoded)
 
         cleaned_csv = "\n".join(cleaned_lines)
         return StringIO(cleaned_csv)
 
+    @staticmethod
+    def _ingest_sftp_buffered(sftp_client: SFTPClient, remote_path: str, session: ImportSession,
+                              digest: ContentDigest):
+        """
+        Mode historique : télécharge tout le fichier en mémoire avant de le parser.
+        """
+        file_name = os.path.basename(remote_path)
+
+        # Lecture du fichier distant
+        with metrics.stage("download") as download:
+            raw_data = sftp_client.read_file(remote_path)
+            download.bytes = len(raw_data)
+        logger.info(f"[SFTP] Lecture réussie du fichier {file_name} ({len(raw_data)} octets)")
+        if digest.length == 0:
+            digest.update(raw_data)
+
+        # Détection de l'encodage
+        encoding = sftp_client.detect_encoding(raw_data)
+        logger.info(f"[SFTP] Encodage détecté : {encoding}")
+
+        # Nettoyage du CSV pour supprimer la colonne "COMMENTAIRE"
+        str_io = IngestionService.clean_csv_remove_comment_column(raw_data, encoding)
+
+        # Lecture du CSV par chunk
+        chunks = pd.read_csv(
+            str_io,
+            chunksize=IngestionService.CHUNK_SIZE,
+            dtype=str,
+            encoding=encoding,
+            on_bad_lines="warn"
+        )
+
+        # Nettoyage complet via DataCleaner puis insertion dans la base
+        inserted_rows = session.copy_chunks(IngestionService._clean_chunks(chunks))
+        return inserted_rows, encoding
 
     @staticmethod
-    def process_sftp_file(remote_path: str):
+    def _ingest_sftp_stream(sftp_client: SFTPClient, remote_path: str, session: ImportSession,
+                            writer: DBWriter, digest: ContentDigest, start: int = 0,
+                            rejects: RejectSink = None):
+        """
+        Mode streaming : le fichier distant est lu par blocs bornés, décodé
+        incrémentalement, débarrassé de la colonne COMMENTAIRE ligne à ligne
+        puis parsé chunk par chunk. Chaque chunk nettoyé part directement en
+        base : la mémoire consommée ne dépend pas de la taille du fichier.
+        Avec `start`, seuls les octets ajoutés depuis le dernier import sont lus ;
+        les gros fichiers sont validés par segments et repris après interruption.
+        Les enregistrements mal formés sont mis en quarantaine dans `rejects`.
+        """
+        file_name = os.path.basename(remote_path)
+        open_source = lambda: sftp_client.open_file(remote_path)
+
+        # Détection de l'encodage sur le début du fichier uniquement
+        with metrics.stage("download"), open_source() as remote_file:
+            sample = remote_file.read(IngestionService.ENCODING_SAMPLE_SIZE)
+        encoding = encoding_profiles.resolve(IngestionService.SFTP_ENCODING_SOURCE, sample)
+        logger.info(f"[SFTP] Encodage détecté : {encoding}")
+
+        if CSV_ENGINE == "python":
+            # Ancien découpage ligne à ligne, conservé pour comparaison (sans reprise)
+            with open_source() as remote_file:
+                blocks = IngestionService._source_blocks(
+                    remote_file, digest, start, IngestionService.STREAM_BLOCK_SIZE, read_stage="download"
+                )
+                lines = iter_decoded_lines(blocks, encoding)
+                cleaned_lines = IngestionService.iter_lines_without_comment_column(lines)
+                chunks = pd.read_csv(
+                    IterStream(line + "\n" for line in cleaned_lines),
+                    chunksize=IngestionService.CHUNK_SIZE,
+                    dtype=str,
+                    on_bad_lines="warn"
+                )
+                session.copy_chunks(IngestionService._clean_chunks(chunks))
+        else:
+            def copy_segment(blocks, segment_encoding, line_offset):
+                # Tokeniseur RFC 4180 : COMMENTAIRE retiré au niveau octets, flux
+                # transcodé en UTF-8 avec bascule d'encodage si une séquence est invalide
+                transcoder = Utf8Transcoder(blocks, segment_encoding)
+                chunks = read_stripped_csv(
+                    iter(transcoder),
+                    "utf-8",
+                    engine=CSV_ENGINE,
+                    chunksize=IngestionService.CHUNK_SIZE,
+                    rejects=rejects,
+                    line_offset=line_offset,
+                    schema=CALL_LOGS,
+                    on_bad_lines="warn"
+                )
+                session.copy_chunks(IngestionService._clean_chunks(chunks))
+                return transcoder.encoding
+
+            _, final_encoding = IngestionService._ingest_resumable(
+                writer, session, file_name, open_source, digest, start, encoding,
+                copy_segment, IngestionService.STREAM_BLOCK_SIZE, read_stage="download", rejects=rejects
+            )
+            if final_encoding != encoding:
+                encoding = final_encoding
+                encoding_profiles.remember(IngestionService.SFTP_ENCODING_SOURCE, encoding)
+
+        logger.info(f"[SFTP] Lecture streaming terminée pour {file_name}")
+        return session.rows, encoding
+
+    @staticmethod
+    @metrics.instrumented("sftp")
+    def process_sftp_file(remote_path: str, stream: bool = True, sftp_client: SFTPClient = None):
         """
         Télécharge un fichier CSV depuis le SFTP, détecte l'encodage,
         nettoie les colonnes commentaires, normalise les noms de colonnes,
         vérifie si le fichier a déjà été importé, insère les données en base,
         et log l'import pour suivi.
-        Si PermissionError, retente toutes les 20 minutes jusqu'à succès.
+        En mode `stream` (par défaut), le fichier n'est jamais chargé en entier
+        en mémoire ; `stream=False` conserve l'ancien téléchargement complet
+        (sauf pour l'ajout à un fichier déjà importé, toujours streamé).
+        Un fichier inchangé ou déjà importé sous un autre nom est ignoré ; un
+        fichier qui a grossi n'est ingéré qu'à partir de la fin du dernier import.
+        `sftp_client` : connexion existante à réutiliser (laissée ouverte) ;
+        à défaut, une session est empruntée au pool SFTP.
+        Un échec transitoire (fichier verrouillé, connexion coupée) est confié
+        au RetryService : nouvelle tentative planifiée avec délai exponentiel,
+        sans garder de thread ni de connexion en attendant.
         """
+        if sftp_client is None:
+            try:
+                with sftp_pool.session() as pooled_client:
+                    return IngestionService.process_sftp_file(remote_path, stream, pooled_client)
+            except Exception as e:  # connexion SFTP impossible
+                return IngestionService._sftp_failure(remote_path, stream, e)
+
         file_name = os.path.basename(remote_path)
-        logger.info(f"[SFTP] Début du traitement du fichier {file_name}")
-        sftp_client = None
-        db_writer = DBWriter(DB_CONFIG, TABLE_NAME, VIEW_NAME)
+        with advisory_lock(f"ingest:{file_name}") as lock_conn:
+            if lock_conn is None:
+                return IngestionService._in_progress(file_name)
+            logger.info(f"[SFTP] Début du traitement du fichier {file_name}")
+            db_writer = DBWriter(DB_CONFIG, TABLE_NAME, VIEW_NAME)
 
-        try:
-            # Vérification si le fichier a déjà été importé
-            if db_writer.already_imported(file_name):
-                db_writer.close()
-                logger.info(f"[SFTP] Fichier {file_name} déjà importé, skipped.")
-                return {"status": "skipped", "file": file_name}
+            try:
+                # Déjà importé, doublon ou ajout : décidé sur la taille puis l'empreinte
+                with metrics.stage("dedup"):
+                    result, digest, start = IngestionService._plan_import(
+                        db_writer, file_name, sftp_client.file_size(remote_path),
+                        lambda: sftp_client.open_file(remote_path)
+                    )
+                if result is not None:
+                    logger.info(f"[SFTP] Fichier {file_name} : {result['status']}.")
+                    return result
 
-            while True:
-                try:
-                    # Connexion au SFTP
-                    sftp_client = SFTPClient(SFTP_CONFIG)
-
-                    # Lecture du fichier distant
-                    raw_data = sftp_client.read_file(remote_path)
-                    logger.info(f"[SFTP] Lecture réussie du fichier {file_name} ({len(raw_data)} octets)")
-
-                    # Détection de l'encodage
-                    encoding = sftp_client.detect_encoding(raw_data)
-                    logger.info(f"[SFTP] Encodage détecté : {encoding}")
-
-                    # Nettoyage du CSV pour supprimer la colonne "COMMENTAIRE"
-                    str_io = IngestionService.clean_csv_remove_comment_column(raw_data, encoding)
-
-                    inserted_rows = 0
-
-                    # Lecture du CSV par chunk
-                    for chunk in pd.read_csv(
-                        str_io,
-                        chunksize=IngestionService.CHUNK_SIZE,
-                        dtype=str,
-                        encoding=encoding,
-                        on_bad_lines="warn"
-                    ):
-                        # Nettoyage complet via DataCleaner
-                        clean_df = DataCleaner.clean(chunk)
-
-                        # Insertion dans la base
-                        db_writer.copy_dataframe(clean_df)
-                        inserted_rows += len(clean_df)
-
-                    # Log du fichier importé pour suivi
-                    db_writer.log_import(file_name)
-                    logger.info(f"[INGESTION] {inserted_rows} lignes insérées dans la base depuis {file_name}.")
-                    return {"status": "success", "file": file_name, "rows": inserted_rows, "encoding": encoding}
-
-                except PermissionError as e:
-                    if getattr(e, "errno", None) == errno.EACCES or "[Errno 13]" in str(e):
-                        logger.warning(f"[SFTP] Permission denied pour {file_name}, nouvelle tentative dans 20 minutes...")
-                        time.sleep(20*60)  # attend 20 minutes
+                # Données + ligne imported_files dans une seule transaction
+                rejects = RejectSink(file_name, conn=lock_conn)
+                with rejects, db_writer.session(file_name) as session:
+                    if stream or start:
+                        inserted_rows, encoding = IngestionService._ingest_sftp_stream(
+                            sftp_client, remote_path, session, db_writer, digest, start, rejects
+                        )
                     else:
-                        raise  # relance pour les autres erreurs
+                        inserted_rows, encoding = IngestionService._ingest_sftp_buffered(
+                            sftp_client, remote_path, session, digest
+                        )
+                    session.set_fingerprint(digest.hexdigest(), digest.length, append=start > 0)
+                    with metrics.stage("commit"):
+                        session.commit()
+
+                logger.info(f"[INGESTION] {inserted_rows} lignes insérées dans la base depuis {file_name}.")
+                result = {
+                    "status": "success", "file": file_name, "rows": inserted_rows, "encoding": encoding,
+                    "rejects": rejects.summary(),
+                }
+                if start:
+                    result["appended_from_byte"] = start
+                return result
 
+            except Exception as e:
+                return IngestionService._sftp_failure(remote_path, stream, e)
+
+            finally:
+                db_writer.close()
+
+    @staticmethod
+    def _in_progress(file_name: str) -> dict:
+        """Résultat quand le fichier est déjà en cours d'import ailleurs (autre worker ou processus)."""
+        logger.warning(f"[INGESTION] {file_name} est déjà en cours d'import par un autre processus, ignoré")
+        return {"status": "in_progress", "file": file_name}
+
+    @staticmethod
+    def _is_transient(error: Exception) -> bool:
+        """Échec susceptible de disparaître en réessayant plus tard ?"""
+        if isinstance(error, PermissionError):
+            # Fichier encore verrouillé par l'émetteur
+            return getattr(error, "errno", None) == errno.EACCES or "[Errno 13]" in str(error)
+        return isinstance(error, IngestionService.TRANSIENT_ERRORS)
+
+    @staticmethod
+    def _sftp_failure(remote_path: str, stream: bool, error: Exception) -> dict:
+        """Résultat d'un import SFTP en échec ; planifie une nouvelle tentative si l'erreur est transitoire."""
+        file_name = os.path.basename(remote_path)
+        if not IngestionService._is_transient(error):
+            logger.error(f"Erreur lors de l’ingestion SFTP du fichier {file_name} : {error}", exc_info=error)
+            return {"status": "error", "file": file_name, "message": str(error)}
+
+        try:
+            retry = retry_service.schedule(
+                "sftp_file", f"sftp_file:{remote_path}", {"remote_path": remote_path, "stream": stream}, str(error)
+            )
         except Exception as e:
-            logger.error(f"Erreur lors de l’ingestion SFTP du fichier {file_name} : {e}", exc_info=True)
-            return {"status": "error", "file": file_name, "message": str(e)}
+            logger.error(f"[RETRY] Impossible de planifier une nouvelle tentative pour {file_name} : {e}")
+            return {"status": "error", "file": file_name, "message": str(error)}
+
+        if retry["state"] == "failed":
+            return {
+                "status": "error", "file": file_name,
+                "message": f"{error} (abandon après {retry['attempts']} tentatives)",
+            }
+        return {
+            "status": "retry_scheduled", "file": file_name, "message": str(error),
+            "attempt": retry["attempts"], "next_attempt_at": retry["next_attempt_at"],
+        }
+
+    @staticmethod
+    def process_sftp_dir(remote_dir: str = None, stream: bool = True, pattern: str = SFTP_WATCH_PATTERN):
+        """
+        Mode découverte : liste le dossier distant (`listdir_attr`, un seul
+        aller-retour) et ingère chaque fichier nouveau ou modifié, du plus
+        ancien au plus récent, sur une seule connexion SFTP. Les jours manqués
+        sont ainsi rattrapés au passage suivant.
+        Un fichier dont taille et mtime correspondent au cache local est
+        ignoré sans autre accès ; sinon la taille enregistrée dans
+        imported_files (une requête pour tout le lot) écarte les fichiers déjà
+        importés à l'identique. Les fichiers en erreur ou en attente de
+        nouvelle tentative ne sont pas mis en cache : le passage suivant les
+        reprend.
+        """
+        remote_dir = remote_dir or SFTP_CONFIG["remote_dir"]
+        db_writer = DBWriter(DB_CONFIG, TABLE_NAME, VIEW_NAME)
+        results = []
+
+        try:
+            with sftp_pool.session() as sftp_client:
+                entries = sorted(
+                    (e for e in sftp_client.list_attr(remote_dir) if fnmatch(e.filename, pattern)),
+                    key=lambda e: e.filename
+                )
+                paths = {e.filename: posixpath.join(remote_dir, e.filename) for e in entries}
+                candidates = [e for e in entries if remote_file_cache.changed(paths[e.filename], e.st_size, e.st_mtime)]
+                imported = db_writer.imported_sizes([e.filename for e in candidates])
+
+                for entry in candidates:
+                    remote_path = paths[entry.filename]
+                    if imported.get(entry.filename) == entry.st_size:
+                        remote_file_cache.remember(remote_path, entry.st_size, entry.st_mtime)
+                        continue
+
+                    result = IngestionService.process_sftp_file(remote_path, stream=stream, sftp_client=sftp_client)
+                    if result["status"] in IngestionService.DONE_STATUSES:
+                        remote_file_cache.remember(remote_path, entry.st_size, entry.st_mtime)
+                    results.append(result)
+
+                logger.info(
+                    f"[SFTP] {remote_dir} : {len(entries)} fichier(s) listé(s), "
+                    f"{len(results)} traité(s), {len(entries) - len(results)} inchangé(s)"
+                )
+                return {
+                    "status": "done",
+                    "remote_dir": remote_dir,
+                    "listed": len(entries),
+                    "unchanged": len(entries) - len(results),
+                    "files": results,
+                }
 
         finally:
-            if sftp_client:
-                sftp_client.close()
+            remote_file_cache.save()
             db_writer.close()
-                
+
     @staticmethod
     def insert_into_db(df: pd.DataFrame):
         """
@@ -178,9 +749,10 @@ class IngestionService:
         """
         clean_df = DataCleaner.clean(df)
 
-        engine = create_engine(
-            f"postgresql+psycopg2://{DB_CONFIG['user']}:{DB_CONFIG['password']}"
-            f"@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
-        )
+        engine = get_engine()
         clean_df.to_sql(TABLE_NAME, con=engine, if_exists="append", index=False)
         logger.info(f"{len(clean_df)} lignes insérées dans la table {TABLE_NAME}")
+
+
+# Nouvelle tentative d'un fichier SFTP (voir RetryService)
+retry_service.register("sftp_file", IngestionService.process_sftp_file)
@@ -0,0 +1,371 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+from app.config import (
+    INGEST_JOB_WORKERS, INGEST_JOB_QUEUE_SIZE, INGEST_JOB_HISTORY, INGEST_JOB_HEARTBEAT_S, INGEST_JOB_STALE_S,
+)
+from app.database import get_engine, init_schema
+from app.utils import progress
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """Trop de jobs en attente : la soumission est refusée."""
+
+
+class Job:
+    """État d'un job d'ingestion, mis à jour par le thread qui l'exécute."""
+
+    def __init__(self, kind: str, params: dict):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.state = "queued"  # queued → running → succeeded | partial | deferred | failed (| interrupted)
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.rows = 0
+        self.files_done = 0
+        self.current_file = None
+        self.result = None
+        self.errors = []
+        self._lock = threading.Lock()
+
+    def add_progress(self, rows: int, file_name: str = None):
+        with self._lock:
+            self.rows += rows
+            if file_name and file_name != self.current_file:
+                if self.current_file is not None:
+                    self.files_done += 1
+                self.current_file = file_name
+
+    def to_dict(self) -> dict:
+        return _job_dict(
+            self.id, self.kind, self.params, self.state, self.submitted_at, self.started_at,
+            self.finished_at, self.rows, self.files_done, self.current_file, self.errors, self.result,
+        )
+
+
+def _job_dict(job_id, kind, params, state, submitted_at, started_at, finished_at, rows, files_done,
+              current_file, errors, result) -> dict:
+    end = finished_at or time.time()
+    elapsed = end - started_at if started_at else 0.0
+    return {
+        "job_id": job_id,
+        "kind": kind,
+        "params": params,
+        "state": state,
+        "submitted_at": submitted_at,
+        "started_at": started_at,
+        "finished_at": finished_at,
+        "elapsed_s": round(elapsed, 3),
+        "rows_processed": rows,
+        "rows_per_s": round(rows / elapsed, 1) if elapsed > 0 else None,
+        "files_done": files_done,
+        "current_file": current_file,
+        "errors": errors,
+        "result": result,
+    }
+
+
+def _row_dict(row) -> dict:
+    """Job lu dans ingest_jobs (même forme que Job.to_dict)."""
+    return _job_dict(
+        row.job_id, row.kind, json.loads(row.params), row.state, row.submitted_at, row.started_at,
+        row.finished_at, row.rows_processed, row.files_done, row.current_file, json.loads(row.errors),
+        json.loads(row.result) if row.result is not None else None,
+    )
+
+
+FINISHED_STATES = ("succeeded", "partial", "deferred", "failed", "interrupted")
+ACTIVE_STATES = ("queued", "running")
+INTERRUPTED_ERROR = "Processus arrêté avant la fin du job (redémarrage ?)"
+
+JOB_COLUMNS = """
+    job_id, kind, params, state, submitted_at, started_at, finished_at,
+    rows_processed, files_done, current_file, errors, result
+"""
+
+
+def _file_results(result) -> list:
+    """Résultats par fichier : liste (process_many), `files` d'un dossier SFTP, ou résultat unique."""
+    if isinstance(result, list):
+        return result
+    if isinstance(result, dict) and isinstance(result.get("files"), list):
+        return result["files"]
+    return [result]
+
+
+# Fichiers non chargés par ce job mais pas en échec : import en cours dans un
+# autre processus, ou nouvelle tentative planifiée (voir RetryService)
+DEFERRED_STATUSES = {
+    "in_progress": "import déjà en cours dans un autre processus",
+    "retry_scheduled": "nouvelle tentative planifiée",
+}
+
+
+def _status(item):
+    return item.get("status") if isinstance(item, dict) else None
+
+
+def _collect_errors(items: list) -> list:
+    """Messages d'erreur des résultats par fichier, fichiers différés compris (avec leur motif)."""
+    errors = []
+    for r in items:
+        status = _status(r)
+        if status == "error":
+            errors.append(f"{r.get('file')}: {r.get('message')}")
+        elif status in DEFERRED_STATUSES:
+            detail = f" ({r['message']})" if r.get("message") else ""
+            errors.append(f"{r.get('file')}: {DEFERRED_STATUSES[status]}{detail}")
+    return errors
+
+
+def _final_state(result) -> str:
+    """
+    succeeded si chaque fichier est chargé ou déjà connu (success, duplicate,
+    skipped...), failed si tous ont échoué, deferred si tous sont différés
+    (non chargés par ce job), partial sinon.
+    """
+    statuses = [_status(r) for r in _file_results(result)]
+    failed = statuses.count("error")
+    deferred = sum(1 for s in statuses if s in DEFERRED_STATUSES)
+    if not failed and not deferred:
+        return "succeeded"
+    if failed == len(statuses):
+        return "failed"
+    if deferred == len(statuses):
+        return "deferred"
+    return "partial"
+
+
+class JobManager:
+    """
+    File de jobs d'ingestion exécutés par un pool de threads borné. La
+    soumission rend la main immédiatement avec un identifiant ; l'état et la
+    progression (lignes, débit, erreurs) sont consultables pendant et après
+    l'exécution. Seuls les INGEST_JOB_HISTORY derniers jobs sont conservés.
+    Chaque job est enregistré dans ingest_jobs (soumission, démarrage, fin,
+    et progression toutes les INGEST_JOB_HEARTBEAT_S secondes) : avec
+    plusieurs workers uvicorn, n'importe lequel répond sur un job, et un job
+    dont le processus s'est arrêté apparaît `interrupted` au lieu de
+    disparaître. Une indisponibilité de la base n'interrompt pas les jobs :
+    seul l'état consultable depuis les autres processus prend du retard.
+    """
+
+    def __init__(self, max_workers: int = INGEST_JOB_WORKERS, max_pending: int = INGEST_JOB_QUEUE_SIZE,
+                 history: int = INGEST_JOB_HISTORY):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.history = history
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._heartbeat = None
+        self._stopped = threading.Event()
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ingest-job")
+        return self._executor
+
+    def submit(self, kind: str, func, *args, params: dict = None, cleanup=None, **kwargs) -> Job:
+        """
+        Planifie `func(*args, **kwargs)`. `cleanup` (optionnel) est appelé une
+        fois le job terminé, quel que soit son issue.
+        """
+        job = Job(kind, params or {})
+        with self._lock:
+            pending = sum(1 for j in self._jobs.values() if j.state == "queued")
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"{pending} job(s) déjà en attente")
+            self._jobs[job.id] = job
+            self._prune()
+        self._execute(
+            f"""
+                INSERT INTO ingest_jobs ({JOB_COLUMNS}, owner)
+                VALUES (:id, :kind, :params, 'queued', :submitted, NULL, NULL, 0, 0, NULL, '[]', NULL, :owner)
+            """,
+            {"id": job.id, "kind": kind, "params": _dumps(job.params), "submitted": job.submitted_at,
+             "owner": self.owner},
+            job,
+        )
+        with self._lock:
+            self._pool().submit(self._run, job, func, args, kwargs, cleanup)
+            self._start_heartbeat()
+        logger.info(f"[JOB] {job.id} ({kind}) en file d'attente")
+        return job
+
+    def _run(self, job: Job, func, args, kwargs, cleanup):
+        job.state = "running"
+        job.started_at = time.time()
+        self._execute(
+            "UPDATE ingest_jobs SET state = 'running', started_at = :started, heartbeat_at = now() WHERE job_id = :id",
+            {"id": job.id, "started": job.started_at},
+            job,
+        )
+        token = progress.bind(job.add_progress)
+        try:
+            job.result = func(*args, **kwargs)
+            job.errors = _collect_errors(_file_results(job.result))
+            job.state = _final_state(job.result)
+        except Exception as e:
+            logger.error(f"[JOB] {job.id} en échec : {e}", exc_info=True)
+            job.errors.append(str(e))
+            job.state = "failed"
+        finally:
+            progress.unbind(token)
+            if job.current_file is not None:
+                job.files_done += 1
+                job.current_file = None
+            job.finished_at = time.time()
+            if cleanup is not None:
+                try:
+                    cleanup()
+                except Exception as e:
+                    logger.warning(f"[JOB] Nettoyage du job {job.id} impossible : {e}")
+            self._save_final(job)
+            logger.info(f"[JOB] {job.id} terminé : {job.state} ({job.rows} lignes)")
+
+    def _execute(self, sql: str, params, job: Job = None):
+        """Écriture dans ingest_jobs ; un échec est journalisé sans interrompre le job."""
+        try:
+            init_schema()
+            with get_engine().begin() as conn:
+                conn.execute(text(sql), params)
+        except Exception as e:
+            logger.warning(f"[JOB] État{f' du job {job.id}' if job else ''} non enregistré : {e}")
+
+    def _save_final(self, job: Job):
+        self._execute(
+            """
+                UPDATE ingest_jobs SET state = :state, finished_at = :finished, rows_processed = :rows,
+                    files_done = :files, current_file = NULL, errors = :errors, result = :result,
+                    heartbeat_at = now()
+                WHERE job_id = :id
+            """,
+            {"id": job.id, "state": job.state, "finished": job.finished_at, "rows": job.rows,
+             "files": job.files_done, "errors": _dumps(job.errors), "result": _dumps(job.result)},
+            job,
+        )
+        # Historique borné, comme en mémoire
+        self._execute(
+            """
+                DELETE FROM ingest_jobs WHERE job_id IN (
+                    SELECT job_id FROM ingest_jobs WHERE state NOT IN ('queued', 'running')
+                    ORDER BY submitted_at DESC OFFSET :history
+                )
+            """,
+            {"history": self.history},
+        )
+
+    def _start_heartbeat(self):
+        """Démarre le thread de battement s'il ne tourne pas (appelé sous self._lock)."""
+        if self._heartbeat is None and not self._stopped.is_set():
+            self._heartbeat = threading.Thread(target=self._beat, name="ingest-job-heartbeat", daemon=True)
+            self._heartbeat.start()
+
+    def _beat(self):
+        """Enregistre la progression des jobs actifs du processus ; s'arrête quand il n'y en a plus."""
+        while not self._stopped.wait(INGEST_JOB_HEARTBEAT_S):
+            with self._lock:
+                active = [j for j in self._jobs.values() if j.state in ACTIVE_STATES]
+                if not active:
+                    self._heartbeat = None
+                    return
+            self._execute(
+                """
+                    UPDATE ingest_jobs SET rows_processed = :rows, files_done = :files,
+                        current_file = :current, heartbeat_at = now()
+                    WHERE job_id = :id AND state IN ('queued', 'running')
+                """,
+                [{"id": j.id, "rows": j.rows, "files": j.files_done, "current": j.current_file} for j in active],
+            )
+
+    @staticmethod
+    def _expire_stale(conn):
+        """Jobs en file ou en cours sans battement récent : leur processus s'est arrêté."""
+        conn.execute(
+            text("""
+                UPDATE ingest_jobs SET state = 'interrupted', current_file = NULL,
+                    finished_at = EXTRACT(EPOCH FROM now()),
+                    errors = (CAST(errors AS JSONB) || jsonb_build_array(CAST(:error AS TEXT)))::TEXT
+                WHERE state IN ('queued', 'running') AND heartbeat_at < now() - make_interval(secs => :stale)
+            """),
+            {"error": INTERRUPTED_ERROR, "stale": INGEST_JOB_STALE_S}
+        )
+
+    def _prune(self):
+        """Oublie les jobs terminés les plus anciens au-delà de l'historique."""
+        excess = len(self._jobs) - self.history
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].state in FINISHED_STATES:
+                del self._jobs[job_id]
+                excess -= 1
+
+    def get(self, job_id: str):
+        """État d'un job (dict), qu'il tourne dans ce processus ou dans un autre ; None s'il est inconnu."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        init_schema()
+        with get_engine().begin() as conn:
+            self._expire_stale(conn)
+            row = conn.execute(
+                text(f"SELECT {JOB_COLUMNS} FROM ingest_jobs WHERE job_id = :id"), {"id": job_id}
+            ).fetchone()
+        return _row_dict(row) if row is not None else None
+
+    def list(self, state: str = None) -> list:
+        """Jobs de tous les processus, les plus récents d'abord ; ceux de ce processus au plus frais."""
+        with self._lock:
+            local = {j.id: j.to_dict() for j in self._jobs.values()}
+        try:
+            init_schema()
+            with get_engine().begin() as conn:
+                self._expire_stale(conn)
+                rows = conn.execute(
+                    text(f"""
+                        SELECT {JOB_COLUMNS} FROM ingest_jobs
+                        ORDER BY submitted_at DESC LIMIT :history
+                    """),
+                    {"history": self.history}
+                ).fetchall()
+        except Exception as e:
+            logger.warning(f"[JOB] Jobs des autres processus indisponibles : {e}")
+            jobs = sorted(local.values(), key=lambda j: j["submitted_at"], reverse=True)
+        else:
+            jobs = [local.get(row.job_id) or _row_dict(row) for row in rows]
+        return [j for j in jobs if state is None or j["state"] == state]
+
+    def shutdown(self, wait: bool = False):
+        self._stopped.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
+        with self._lock:
+            cancelled = [j for j in self._jobs.values() if j.state == "queued"]
+        # Jobs annulés avant d'avoir démarré : consignés tout de suite
+        for job in cancelled:
+            job.state, job.finished_at = "interrupted", time.time()
+            job.errors.append(INTERRUPTED_ERROR)
+            self._save_final(job)
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, default=str, ensure_ascii=False)
+
+
+job_manager = JobManager()
@@ -0,0 +1,147 @@
+import logging
+import os
+import threading
+from datetime import datetime
+import psycopg2
+from app.config import SCHEDULER_MODE, SCHEDULER_LOCK_NAME, SCHEDULER_ELECTION_INTERVAL_S
+from app.database import get_engine
+from app.services.retry_service import retry_service
+from app.utils.advisory_locks import lock_key
+
+logger = logging.getLogger(__name__)
+
+MODES = ("leader", "always", "off")
+
+
+class SchedulerLeader:
+    """
+    Exécute les tâches planifiées (cron, nouvelles tentatives) dans un seul
+    processus quand l'API tourne avec plusieurs workers uvicorn.
+    Mode "leader" : chaque processus démarre son scheduler en pause et tente
+    périodiquement de prendre un verrou consultatif PostgreSQL, tenu sur une
+    connexion dédiée. Le détenteur reprend son scheduler et réarme les
+    tentatives en attente ; si sa connexion tombe ou si le processus meurt,
+    le verrou est libéré par PostgreSQL et un autre processus prend le
+    relais au tour d'élection suivant.
+    Mode "always" : scheduler actif dans chaque processus (déploiement à un
+    seul worker). Mode "off" : aucun scheduler dans ce processus.
+    """
+
+    def __init__(self, scheduler, mode: str = SCHEDULER_MODE, lock_name: str = SCHEDULER_LOCK_NAME,
+                 interval: float = SCHEDULER_ELECTION_INTERVAL_S):
+        if mode not in MODES:
+            raise ValueError(f"SCHEDULER_MODE inconnu : {mode} (attendu : {', '.join(MODES)})")
+        self.scheduler = scheduler
+        self.mode = mode
+        self.lock_name = lock_name
+        self.key = lock_key(lock_name)
+        self.interval = interval
+        self.is_leader = False
+        self.leader_since = None
+        self._conn = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.mode == "off":
+            logger.info("[SCHEDULER] Désactivé dans ce processus (SCHEDULER_MODE=off)")
+            return
+        if self.mode == "always":
+            self.scheduler.start()
+            self._on_elected()
+            return
+        self.scheduler.start(paused=True)
+        self._thread = threading.Thread(target=self._run, name="scheduler-leader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+        self._release()
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.is_leader:
+                    self._heartbeat()
+                else:
+                    self._try_acquire()
+            except Exception as e:
+                if self.is_leader:
+                    logger.error(f"[SCHEDULER] Verrou de leader perdu ({e}) : scheduler suspendu")
+                    self._on_lost()
+                else:
+                    logger.warning(f"[SCHEDULER] Élection impossible : {e}")
+                self._release()
+            self._stop.wait(self.interval)
+
+    def _connect(self):
+        # Connexion hors pool (mêmes paramètres que l'engine), gardée ouverte tant que ce processus est leader
+        conn = psycopg2.connect(
+            **get_engine().url.translate_connect_args(username="user", database="dbname"),
+            keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3,
+            application_name=f"incoming-api scheduler {os.getpid()}",
+        )
+        conn.autocommit = True
+        return conn
+
+    def _try_acquire(self):
+        if self._conn is None:
+            self._conn = self._connect()
+        with self._conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (self.key,))
+            acquired = cur.fetchone()[0]
+        if acquired:
+            self._on_elected()
+
+    def _heartbeat(self):
+        """Vérifie la connexion qui porte le verrou et arme les tentatives consignées ailleurs."""
+        with self._conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        try:
+            retry_service.arm_pending()
+        except Exception as e:
+            logger.error(f"[RETRY] Lecture des tentatives en attente impossible : {e}")
+
+    def _on_elected(self):
+        self.is_leader = True
+        self.leader_since = datetime.now()
+        if self.mode == "leader":
+            logger.info(f"[SCHEDULER] Processus {os.getpid()} élu leader : tâches planifiées actives")
+            self.scheduler.resume()
+        try:
+            retry_service.bind(self.scheduler)
+        except Exception as e:
+            logger.error(f"[RETRY] Réarmement des tentatives impossible : {e}")
+
+    def _on_lost(self):
+        self.is_leader = False
+        self.leader_since = None
+        self.scheduler.pause()
+        retry_service.unbind()
+
+    def _release(self):
+        if self._conn is None:
+            return
+        try:
+            self._conn.close()  # verrou libéré avec la session
+        except Exception:
+            pass
+        self._conn = None
+        if self.is_leader and self.mode == "leader":
+            self._on_lost()
+
+    def status(self) -> dict:
+        return {
+            "mode": self.mode,
+            "pid": os.getpid(),
+            "leader": self.is_leader,
+            "leader_since": self.leader_since.isoformat(timespec="seconds") if self.leader_since else None,
+            "jobs": [
+                {"id": job.id, "next_run_time": job.next_run_time.isoformat() if job.next_run_time else None}
+                for job in self.scheduler.get_jobs()
+            ] if self.scheduler.running else [],
+        }
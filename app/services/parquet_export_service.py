@@ -0,0 +1,290 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from sqlalchemy import text
+from app.config import VIEW_NAME, EXPORT_PARQUET_DIR, EXPORT_PARQUET_BATCH_SIZE
+from app.database import get_engine
+from app.utils.range_filters import date_range_filter
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "_manifest.json"
+NULL_PARTITION = "__null__"  # lignes sans date_appel
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("L'export Parquet nécessite le paquet pyarrow") from e
+    return pa, pq
+
+
+def _arrow_type(pa, type_code: int):
+    """Type Arrow correspondant à un OID PostgreSQL (cursor.description)."""
+    return {
+        16: pa.bool_(),
+        20: pa.int64(), 21: pa.int16(), 23: pa.int32(),
+        700: pa.float32(), 701: pa.float64(), 1700: pa.float64(),
+        1082: pa.date32(),
+        1114: pa.timestamp("us"), 1184: pa.timestamp("us", tz="UTC"),
+    }.get(type_code, pa.string())
+
+
+def _partition_key(partition_by: str, day) -> str:
+    if day is None:
+        return NULL_PARTITION
+    if hasattr(day, "date"):
+        day = day.date()
+    if partition_by == "week":
+        iso = day.isocalendar()
+        return f"{iso[0]}-W{iso[1]:02d}"
+    return day.isoformat()
+
+
+def _partition_dir(partition_by: str, key: str) -> str:
+    return f"{'iso_week' if partition_by == 'week' else 'date'}={key}"
+
+
+def _merge_ranges(ranges):
+    """Fusionne des plages de dates [début, fin] qui se chevauchent ou se touchent."""
+    merged = []
+    for low, high in sorted(ranges):
+        if merged and low <= merged[-1][1] + timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], high)
+        else:
+            merged.append([low, high])
+    return merged
+
+
+def _week_bounds(low: date, high: date):
+    """Étend une plage aux semaines ISO complètes (partitions hebdomadaires)."""
+    return low - timedelta(days=low.weekday()), high + timedelta(days=6 - high.weekday())
+
+
+class ParquetExportService:
+    """
+    Export colonne (Parquet) de la vue, partitionné par jour ou par semaine
+    ISO. La vue est lue en flux via un curseur serveur et convertie en
+    RecordBatch Arrow : la mémoire reste bornée par la taille d'un lot.
+    Un manifeste mémorise le dernier imported_files.id exporté ; les runs
+    suivants ne réécrivent que les partitions touchées par les nouveaux imports.
+    """
+
+    @staticmethod
+    def _load_manifest(output_dir: str):
+        try:
+            with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    @staticmethod
+    def _save_manifest(output_dir: str, manifest: dict):
+        fd, tmp = tempfile.mkstemp(dir=output_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(tmp, os.path.join(output_dir, MANIFEST_NAME))
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    @staticmethod
+    def _changed_ranges(conn, watermark: int, partition_by: str):
+        """Plages de dates touchées par les imports postérieurs au watermark."""
+        rows = conn.execute(
+            text("SELECT min_date, max_date FROM imported_files WHERE id > :wm"),
+            {"wm": watermark}
+        ).fetchall()
+        ranges = []
+        for r in rows:
+            if r.min_date is None:
+                continue
+            low, high = r.min_date, r.max_date
+            if partition_by == "week":
+                low, high = _week_bounds(low, high)
+            ranges.append((low, high))
+        return _merge_ranges(ranges), bool(rows)
+
+    @staticmethod
+    def _write_partitions(raw_conn, sql: str, params, output_dir: str, partition_by: str,
+                          compression: str, batch_size: int):
+        """
+        Parcourt le résultat trié par date et écrit une partition à la fois.
+        Chaque partition est écrite sous un nom temporaire (.parquet.part) et
+        ne remplace part-0.parquet qu'une fois le fichier fermé avec succès :
+        sur erreur, le writer est fermé et le fichier partiel supprimé.
+        """
+        pa, pq = _require_pyarrow()
+        written = {}
+        writer, current, tmp_path = None, None, None
+
+        def close_current():
+            nonlocal writer, tmp_path
+            if writer is None:
+                return
+            closing, writer = writer, None
+            closing.close()
+            target = os.path.join(output_dir, _partition_dir(partition_by, current))
+            os.makedirs(target, exist_ok=True)
+            os.replace(tmp_path, os.path.join(target, "part-0.parquet"))
+            tmp_path = None
+
+        cur = raw_conn.cursor(name="parquet_export")  # curseur côté serveur
+        cur.itersize = batch_size
+        try:
+            cur.execute(sql, params)
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                return written
+            names = [d.name for d in cur.description]
+            schema = pa.schema([(d.name, _arrow_type(pa, d.type_code)) for d in cur.description])
+            date_idx = names.index("date_appel")
+
+            def to_batch(block):
+                columns = []
+                for i, field in enumerate(schema):
+                    values = [r[i] for r in block]
+                    if pa.types.is_floating(field.type):
+                        values = [float(v) if isinstance(v, Decimal) else v for v in values]
+                    elif pa.types.is_string(field.type):
+                        values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+                    columns.append(pa.array(values, type=field.type))
+                return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+            while rows:
+                keys = [_partition_key(partition_by, r[date_idx]) for r in rows]
+                start = 0
+                for i in range(1, len(rows) + 1):
+                    if i < len(rows) and keys[i] == keys[start]:
+                        continue
+                    key = keys[start]
+                    if key != current:
+                        close_current()
+                        current = key
+                        fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix=".parquet.part")
+                        os.close(fd)
+                        writer = pq.ParquetWriter(tmp_path, schema, compression=compression)
+                        written[key] = 0
+                    writer.write_batch(to_batch(rows[start:i]))
+                    written[key] += i - start
+                    start = i
+                rows = cur.fetchmany(batch_size)
+
+            close_current()
+        finally:
+            try:
+                if writer is not None:
+                    writer.close()
+            except Exception as e:
+                logger.warning(f"[PARQUET] Fermeture du writer impossible après erreur : {e}")
+            finally:
+                if tmp_path is not None and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                cur.close()
+        return written
+
+    @staticmethod
+    def export_parquet(output_dir: str = EXPORT_PARQUET_DIR, partition_by: str = "date",
+                       full: bool = False, compression: str = "zstd",
+                       batch_size: int = EXPORT_PARQUET_BATCH_SIZE):
+        """
+        Exporte la vue en Parquet partitionné (`partition_by` : "date" ou "week").
+        Sans `full`, seules les partitions modifiées depuis le dernier run sont
+        réécrites. Retourne un résumé (partitions écrites/supprimées, lignes).
+        """
+        if partition_by not in ("date", "week"):
+            raise ValueError("partition_by doit valoir 'date' ou 'week'")
+        os.makedirs(output_dir, exist_ok=True)
+
+        manifest = ParquetExportService._load_manifest(output_dir)
+        if manifest and (manifest.get("partition_by") != partition_by or manifest.get("view") != VIEW_NAME):
+            full = True
+
+        engine = get_engine()
+        with engine.connect() as conn:
+            # Watermark pris avant la lecture : un import concurrent sera repris au run suivant
+            watermark = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM imported_files")).scalar()
+            if manifest is None or full:
+                ranges, changed = None, True
+            else:
+                ranges, changed = ParquetExportService._changed_ranges(conn, manifest["watermark"], partition_by)
+
+        if not changed:
+            logger.info("[PARQUET] Aucun nouvel import depuis le dernier export")
+            return {"status": "up_to_date", "output_dir": os.path.abspath(output_dir), "partitions": 0, "rows": 0}
+
+        base = f"SELECT * FROM public.{VIEW_NAME}"
+        if ranges is None:
+            queries = [(f"{base} ORDER BY date_appel NULLS LAST", None)]
+        else:
+            queries = []
+            for low, high in ranges:
+                condition, params = date_range_filter(low, high)
+                queries.append((f"{base} WHERE {condition} ORDER BY date_appel", params))
+            # Lignes sans date : partition dédiée, relue à chaque import
+            queries.append((f"{base} WHERE date_appel IS NULL", None))
+
+        partitions = {} if full or manifest is None else dict(manifest.get("partitions", {}))
+        written = {}
+        raw_conn = engine.raw_connection()
+        try:
+            for sql, params in queries:
+                written.update(ParquetExportService._write_partitions(
+                    raw_conn, sql, params, output_dir, partition_by, compression, batch_size
+                ))
+            raw_conn.commit()
+        finally:
+            raw_conn.close()
+
+        # Partitions concernées mais désormais vides : suppression
+        keep = {_partition_dir(partition_by, k) for k in written}
+        if ranges is None:
+            stale = [
+                name for name in os.listdir(output_dir)
+                if name.startswith(("date=", "iso_week=")) and name not in keep
+            ]
+        else:
+            stale = [
+                _partition_dir(partition_by, k) for k in partitions
+                if k not in written and (k == NULL_PARTITION or any(
+                    low <= date.fromisoformat(partitions[k]["first_day"]) <= high for low, high in ranges
+                ))
+            ]
+        removed = []
+        for name in stale:
+            shutil.rmtree(os.path.join(output_dir, name), ignore_errors=True)
+            partitions.pop(name.split("=", 1)[1], None)
+            removed.append(name)
+
+        for key, count in written.items():
+            partitions[key] = {"rows": count, "first_day": ParquetExportService._first_day(partition_by, key)}
+
+        ParquetExportService._save_manifest(output_dir, {
+            "view": VIEW_NAME, "partition_by": partition_by,
+            "watermark": watermark, "partitions": partitions,
+        })
+        logger.info(f"[PARQUET] {len(written)} partition(s) écrite(s), {len(removed)} supprimée(s)")
+        return {
+            "status": "ok",
+            "output_dir": os.path.abspath(output_dir),
+            "partitions": len(written),
+            "removed": len(removed),
+            "rows": sum(written.values()),
+        }
+
+    @staticmethod
+    def _first_day(partition_by: str, key: str):
+        """Premier jour couvert par une partition (None pour les lignes sans date)."""
+        if key == NULL_PARTITION:
+            return None
+        if partition_by == "week":
+            year, week = key.split("-W")
+            return date.fromisocalendar(int(year), int(week), 1).isoformat()
+        return key
@@ -0,0 +1,236 @@
+import base64
+import json
+import logging
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from sqlalchemy import text
+from app.config import TABLE_NAME, VIEW_NAME, QUERY_MAX_LIMIT, QUERY_FETCH_SIZE
+from app.data_cleaner import DataCleaner
+from app.database import get_engine
+from app.partitions import partition_manager
+
+logger = logging.getLogger(__name__)
+
+# Clé de pagination (index call_logs (datetime_appel, id), voir create_keyset_index)
+KEYSET = ("datetime_appel", "id")
+KEYSET_INDEX = f"{TABLE_NAME}_keyset_idx"
+ORDERS = {"desc": ("DESC", "<"), "asc": ("ASC", ">")}
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return str(value)
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """Curseur opaque : position (datetime_appel, id) de la dernière ligne servie."""
+    raw = json.dumps([timestamp.isoformat(), row_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, row_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError(f"Curseur invalide : {cursor!r}")
+
+
+class QueryService:
+    """
+    Lecture filtrée de la vue d'appels en NDJSON (une ligne JSON par appel),
+    paginée par clé sur (datetime_appel, id) : une page reprend juste après
+    la dernière ligne de la précédente, via l'index, sans OFFSET ; son coût
+    ne dépend ni de sa position ni de la taille de la table, et les pages
+    récentes ne lisent que les dernières partitions mensuelles. Les lignes
+    sans horodatage n'ont pas de place dans cet ordre et sont exclues.
+    La dernière ligne du flux est `{"_page": {"rows": n, "next_cursor": ...}}`
+    (curseur null en fin de résultat).
+    """
+
+    _columns = None  # colonnes de la vue, lues une fois dans le catalogue
+
+    @staticmethod
+    def columns() -> list:
+        if QueryService._columns is None:
+            with get_engine().connect() as conn:
+                columns = conn.execute(
+                    text("""
+                        SELECT column_name FROM information_schema.columns
+                        WHERE table_schema = 'public' AND table_name = :v
+                        ORDER BY ordinal_position
+                    """),
+                    {"v": VIEW_NAME}
+                ).scalars().all()
+            missing = [c for c in KEYSET if c not in columns]
+            if missing:
+                raise RuntimeError(f"La vue {VIEW_NAME} n'expose pas {', '.join(missing)} (pagination impossible)")
+            QueryService._columns = columns
+        return QueryService._columns
+
+    @staticmethod
+    def build(start: date = None, end: date = None, groupes=None, numeros=None, columns=None,
+              cursor: str = None, order: str = "desc", limit: int = 1000) -> tuple:
+        """
+        Requête d'une page : (sql, paramètres, colonnes projetées). Filtres et
+        projection sont validés sur les colonnes de la vue (ValueError).
+        """
+        if order not in ORDERS:
+            raise ValueError("order doit valoir 'desc' ou 'asc'")
+        if not 1 <= limit <= QUERY_MAX_LIMIT:
+            raise ValueError(f"limit doit être compris entre 1 et {QUERY_MAX_LIMIT}")
+        available = QueryService.columns()
+
+        if columns:
+            projection = list(dict.fromkeys(c.strip() for c in columns if c.strip()))
+            unknown = [c for c in projection if c not in available]
+            if unknown:
+                raise ValueError(f"Colonne(s) inconnue(s) : {', '.join(unknown)}")
+        else:
+            projection = list(available)
+
+        conditions = ["datetime_appel IS NOT NULL"]
+        params = {"limit": limit + 1}  # une ligne de plus : y a-t-il une page suivante ?
+        if start is not None:
+            conditions.append("datetime_appel >= %(start)s")
+            params["start"] = start
+        if end is not None:
+            conditions.append("datetime_appel < %(stop)s")
+            params["stop"] = end + timedelta(days=1)
+        if groupes:
+            if "groupe" not in available:
+                raise ValueError(f"Filtre groupe indisponible sur {VIEW_NAME}")
+            conditions.append("groupe = ANY(%(groupes)s)")
+            params["groupes"] = list(groupes)
+        if numeros:
+            if "numero_telephone_clean" not in available:
+                raise ValueError(f"Filtre numero indisponible sur {VIEW_NAME}")
+            cleaned = [DataCleaner.normalize_phone(n) for n in numeros]
+            if None in cleaned:
+                raise ValueError("numero doit contenir au moins un chiffre")
+            conditions.append("numero_telephone_clean = ANY(%(numeros)s)")
+            params["numeros"] = cleaned
+        direction, comparison = ORDERS[order]
+        if cursor:
+            params["after_ts"], params["after_id"] = decode_cursor(cursor)
+            conditions.append(f"(datetime_appel, id) {comparison} (%(after_ts)s, %(after_id)s)")
+
+        selected = projection + [k for k in KEYSET if k not in projection]
+        sql = f"""
+            SELECT {', '.join(selected)} FROM public.{VIEW_NAME}
+            WHERE {' AND '.join(conditions)}
+            ORDER BY datetime_appel {direction}, id {direction}
+            LIMIT %(limit)s
+        """
+        return sql, params, projection
+
+    @staticmethod
+    def stream_ndjson(limit: int = 1000, fetch_size: int = QUERY_FETCH_SIZE, **filters):
+        """
+        Générateur d'octets NDJSON pour une page. Arguments, projection et
+        curseur sont validés avant de rendre le générateur (ValueError →
+        400) ; la connexion n'est empruntée qu'au premier octet demandé et
+        rendue à la fin du flux ou dès que le client se déconnecte. Les
+        lignes sont lues par lots de `fetch_size` sur un curseur côté
+        serveur : la mémoire ne dépend pas de la taille de la page.
+        """
+        sql, params, projection = QueryService.build(limit=limit, **filters)
+
+        def generate():
+            conn = get_engine().raw_connection()
+            cur = None
+            try:
+                cur = conn.cursor(name="query_ndjson")  # curseur côté serveur
+                cur.itersize = fetch_size
+                cur.execute(sql, params)
+                rows = cur.fetchmany(fetch_size)
+                names = [d.name for d in cur.description]
+                out = [(c, names.index(c)) for c in projection]
+                ts_idx, id_idx = (names.index(k) for k in KEYSET)
+                dumps = json.JSONEncoder(default=_json_value, ensure_ascii=False).encode
+                sent, last, more = 0, None, False
+                while rows:
+                    if sent + len(rows) > limit:
+                        rows, more = rows[:limit - sent], True
+                    lines = [dumps({c: row[i] for c, i in out}) for row in rows]
+                    if lines:
+                        yield ("\n".join(lines) + "\n").encode("utf-8")
+                        sent, last = sent + len(rows), rows[-1]
+                    rows = [] if more else cur.fetchmany(fetch_size)
+                next_cursor = encode_cursor(last[ts_idx], last[id_idx]) if more else None
+                yield (dumps({"_page": {"rows": sent, "next_cursor": next_cursor}}) + "\n").encode("utf-8")
+            finally:
+                try:
+                    if cur is not None:
+                        cur.close()
+                    conn.rollback()  # lecture seule : ferme la transaction du curseur
+                except Exception as e:
+                    logger.warning(f"[QUERY] Fermeture du curseur impossible ({e}), connexion écartée")
+                    conn.invalidate()
+                finally:
+                    conn.close()
+
+        return generate()
+
+    @staticmethod
+    def _build_index_concurrently(conn, index: str, table: str):
+        """CREATE INDEX CONCURRENTLY idempotent : un index invalide (build interrompu) est reconstruit."""
+        valid = conn.execute(
+            text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:i)"), {"i": index}
+        ).scalar()
+        if valid:
+            return False
+        if valid is not None:
+            logger.warning(f"[QUERY] Index {index} invalide (construction interrompue), reconstruction")
+            conn.execute(text(f"DROP INDEX CONCURRENTLY {index}"))
+        conn.execute(text(f"CREATE INDEX CONCURRENTLY {index} ON {table} ({', '.join(KEYSET)})"))
+        return True
+
+    @staticmethod
+    def create_keyset_index() -> dict:
+        """
+        Crée l'index (datetime_appel, id) de la pagination, sans bloquer
+        l'ingestion (CREATE INDEX CONCURRENTLY, hors transaction). Sur une
+        table partitionnée : index parent ON ONLY (instantané), index de
+        chaque partition construit en parallèle des écritures puis attaché ;
+        les partitions créées ensuite reçoivent l'index à leur attachement.
+        Opération d'administration (python -m app.manage keyset-index),
+        relançable : les index déjà valides sont conservés.
+        """
+        engine = get_engine()
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if conn.execute(text("SELECT to_regclass(:t)"), {"t": TABLE_NAME}).scalar() is None:
+                raise RuntimeError(f"Table {TABLE_NAME} introuvable")
+            if not partition_manager.is_partitioned():
+                created = QueryService._build_index_concurrently(conn, KEYSET_INDEX, TABLE_NAME)
+                return {"index": KEYSET_INDEX, "created": [KEYSET_INDEX] if created else []}
+
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {KEYSET_INDEX} ON ONLY {TABLE_NAME} ({', '.join(KEYSET)})"
+            ))
+            created, attached = [], []
+            for partition in partition_manager.list():
+                name = partition["name"]
+                attached_index = conn.execute(
+                    text("""
+                        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                        JOIN pg_index x ON x.indexrelid = i.inhrelid
+                        WHERE i.inhparent = to_regclass(:parent) AND x.indrelid = to_regclass(:part)
+                    """),
+                    {"parent": KEYSET_INDEX, "part": name}
+                ).scalar()
+                if attached_index is not None:
+                    continue
+                index = f"{name}_keyset_idx"
+                if QueryService._build_index_concurrently(conn, index, name):
+                    created.append(index)
+                conn.execute(text(f"ALTER INDEX {KEYSET_INDEX} ATTACH PARTITION {index}"))
+                attached.append(index)
+                logger.info(f"[QUERY] Index {index} attaché à {KEYSET_INDEX}")
+        return {"index": KEYSET_INDEX, "created": created, "attached": attached}
@@ -0,0 +1,204 @@
+import json
+import logging
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from app.config import RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY_S, RETRY_MAX_DELAY_S, RETRY_JITTER
+from app.database import get_engine, init_schema
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RetryService:
+    """
+    Nouvelles tentatives différées, sans bloquer de thread : un échec
+    transitoire est consigné dans ingest_retries puis replanifié comme tâche
+    "date" du scheduler, avec un délai exponentiel (borné, avec jitter).
+    Entre deux tentatives, aucun thread ni aucune connexion n'est retenu.
+    Au-delà de RETRY_MAX_ATTEMPTS échecs, la tâche passe en `failed`.
+    Les tâches sont identifiées par une clé (ex. "sftp_file:<chemin>") et
+    exécutées par le handler enregistré pour leur type.
+    Avec plusieurs processus, seul le leader (voir SchedulerLeader) a un
+    scheduler lié : les échecs consignés par les autres sont armés par le
+    leader au tour suivant (`arm_pending`).
+    """
+
+    def __init__(self, max_attempts: int = RETRY_MAX_ATTEMPTS, base_delay: int = RETRY_BASE_DELAY_S,
+                 max_delay: int = RETRY_MAX_DELAY_S, jitter: float = RETRY_JITTER):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self._handlers = {}
+        self._scheduler = None
+
+    def register(self, kind: str, handler):
+        """`handler(**params)` rejoue une tâche de type `kind`."""
+        self._handlers[kind] = handler
+
+    def bind(self, scheduler):
+        """Associe le scheduler APScheduler et réarme les tâches en attente."""
+        self._scheduler = scheduler
+        self.restore()
+
+    def unbind(self):
+        """Détache le scheduler (leadership perdu) en retirant les tentatives armées."""
+        scheduler, self._scheduler = self._scheduler, None
+        if scheduler is None:
+            return
+        for job in scheduler.get_jobs():
+            if job.id.startswith("retry:"):
+                job.remove()
+
+    def delay(self, attempt: int) -> float:
+        """Délai avant la tentative suivant le `attempt`-ième échec."""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+    def schedule(self, kind: str, task_key: str, params: dict, error: str) -> dict:
+        """
+        Consigne un échec et planifie la tentative suivante. Un échec survenu
+        hors d'une tentative en cours repart de zéro.
+        """
+        init_schema()
+        with get_engine().begin() as conn:
+            attempts = conn.execute(
+                text("""
+                    INSERT INTO ingest_retries (task_key, kind, params, attempts, state, last_error, updated_at)
+                    VALUES (:k, :kind, :p, 1, 'pending', :err, now())
+                    ON CONFLICT (task_key) DO UPDATE SET
+                        attempts = CASE WHEN ingest_retries.state IN ('pending', 'running')
+                                        THEN ingest_retries.attempts + 1 ELSE 1 END,
+                        kind = EXCLUDED.kind, params = EXCLUDED.params,
+                        state = 'pending', last_error = EXCLUDED.last_error, updated_at = now()
+                    RETURNING attempts
+                """),
+                {"k": task_key, "kind": kind, "p": json.dumps(params), "err": error}
+            ).scalar()
+
+            metrics.RETRIES.inc(kind=kind)
+            metrics.count("retries")
+            if attempts >= self.max_attempts:
+                conn.execute(
+                    text("UPDATE ingest_retries SET state = 'failed', next_attempt_at = NULL WHERE task_key = :k"),
+                    {"k": task_key}
+                )
+                logger.error(f"[RETRY] {task_key} abandonné après {attempts} tentative(s) : {error}")
+                return {"state": "failed", "attempts": attempts, "next_attempt_at": None}
+
+            run_at = datetime.now() + timedelta(seconds=self.delay(attempts))
+            conn.execute(
+                text("UPDATE ingest_retries SET next_attempt_at = :t WHERE task_key = :k"),
+                {"k": task_key, "t": run_at}
+            )
+
+        self._arm(task_key, run_at)
+        logger.warning(
+            f"[RETRY] {task_key} : échec {attempts}/{self.max_attempts} ({error}), "
+            f"nouvelle tentative à {run_at.strftime('%Y-%m-%d %H:%M:%S')}"
+        )
+        return {"state": "pending", "attempts": attempts, "next_attempt_at": run_at.isoformat(timespec="seconds")}
+
+    def _arm(self, task_key: str, run_at: datetime):
+        if self._scheduler is None:
+            logger.warning(f"[RETRY] Aucun scheduler actif ici : {task_key} sera armé par le processus leader")
+            return
+        self._scheduler.add_job(
+            self.run, "date", run_date=run_at, args=[task_key],
+            id=f"retry:{task_key}", replace_existing=True, misfire_grace_time=None,
+        )
+
+    def run(self, task_key: str):
+        """Exécute une tentative (appelé par le scheduler)."""
+        with get_engine().begin() as conn:
+            row = conn.execute(
+                text("""
+                    UPDATE ingest_retries SET state = 'running', updated_at = now()
+                    WHERE task_key = :k AND state = 'pending'
+                    RETURNING kind, params, attempts
+                """),
+                {"k": task_key}
+            ).fetchone()
+        if row is None:
+            return None
+
+        params = json.loads(row.params)
+        handler = self._handlers.get(row.kind)
+        if handler is None:
+            return self._finish(task_key, "failed", f"Type de tâche inconnu : {row.kind}")
+
+        logger.info(f"[RETRY] Tentative {row.attempts + 1} pour {task_key}")
+        try:
+            result = handler(**params)
+        except Exception as e:
+            logger.error(f"[RETRY] {task_key} en échec : {e}", exc_info=True)
+            self.schedule(row.kind, task_key, params, str(e))
+            return None
+
+        # Un handler qui a lui-même replanifié la tâche l'a repassée en `pending`
+        status = result.get("status") if isinstance(result, dict) else None
+        if status == "error":
+            self._finish(task_key, "failed", result.get("message"))
+        else:
+            self._finish(task_key, "succeeded")
+        return result
+
+    def _finish(self, task_key: str, state: str, error: str = None):
+        with get_engine().begin() as conn:
+            conn.execute(
+                text("""
+                    UPDATE ingest_retries SET state = :s, last_error = COALESCE(:err, last_error),
+                        next_attempt_at = NULL, updated_at = now()
+                    WHERE task_key = :k AND state = 'running'
+                """),
+                {"k": task_key, "s": state, "err": error}
+            )
+        logger.info(f"[RETRY] {task_key} : {state}")
+
+    def restore(self):
+        """Réarme les tâches en attente (ou interrompues par un arrêt) au démarrage."""
+        init_schema()
+        with get_engine().begin() as conn:
+            rows = conn.execute(
+                text("""
+                    UPDATE ingest_retries SET state = 'pending'
+                    WHERE state IN ('pending', 'running')
+                    RETURNING task_key, next_attempt_at
+                """)
+            ).fetchall()
+        now = datetime.now()
+        for row in rows:
+            self._arm(row.task_key, max(row.next_attempt_at or now, now))
+        if rows:
+            logger.info(f"[RETRY] {len(rows)} tentative(s) en attente réarmée(s)")
+
+    def arm_pending(self):
+        """Arme les tentatives en attente pas encore planifiées (consignées par un autre processus)."""
+        if self._scheduler is None:
+            return
+        with get_engine().connect() as conn:
+            rows = conn.execute(
+                text("SELECT task_key, next_attempt_at FROM ingest_retries WHERE state = 'pending'")
+            ).fetchall()
+        now = datetime.now()
+        for row in rows:
+            if self._scheduler.get_job(f"retry:{row.task_key}") is None:
+                self._arm(row.task_key, max(row.next_attempt_at or now, now))
+
+    def list(self, state: str = None) -> list:
+        init_schema()
+        with get_engine().connect() as conn:
+            rows = conn.execute(
+                text("""
+                    SELECT task_key, kind, params, attempts, state, next_attempt_at, last_error, updated_at
+                    FROM ingest_retries
+                    WHERE CAST(:s AS TEXT) IS NULL OR state = :s
+                    ORDER BY updated_at DESC
+                """),
+                {"s": state}
+            ).mappings().fetchall()
+        return [{**r, "params": json.loads(r["params"])} for r in rows]
+
+
+retry_service = RetryService()
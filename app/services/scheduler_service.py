@@ -14,11 +14,15 @@ class SchedulerService:
         return IngestionService.process_csv(file_path)
 
     @staticmethod
-    def run_monthly(folder: str):
+    def run_monthly(folder: str, parallel: bool = False, max_workers: int = None):
         files = glob.glob(os.path.join(folder, "*.csv"))
         if not files:
             return {"status": "empty", "folder": folder}
 
+        if parallel:
+            results = IngestionService.process_many(sorted(files), max_workers=max_workers)
+            return {"status": "done", "files": results}
+
         results = []
         for f in files:
             results.append(IngestionService.process_csv(f))
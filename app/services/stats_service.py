@@ -0,0 +1,99 @@
+import logging
+from datetime import date
+from sqlalchemy import text
+from app.config import TABLE_NAME, STATS_GROUP_COLUMN
+from app.database import get_engine, init_schema
+from app.utils.rollup import MEASURES, DAILY_TABLE, WEEKLY_TABLE
+
+logger = logging.getLogger(__name__)
+
+_SUMS = ", ".join(f"{m}_sum" for m in MEASURES)
+_AVGS = ", ".join(f"round({m}_sum::numeric / NULLIF(calls, 0), 2) AS {m}_avg" for m in MEASURES)
+
+
+def _parse_week(week: str):
+    """"2024-W37" → (2024, 37)"""
+    try:
+        year, num = week.upper().split("-W")
+        return int(year), int(num)
+    except ValueError:
+        raise ValueError(f"Semaine invalide : {week!r} (format attendu : AAAA-Wss)")
+
+
+class StatsService:
+    """
+    Statistiques servies depuis les tables de rollup (jour et semaine ISO
+    par groupe), tenues à jour par l'ingestion : quelques milliers de lignes
+    lues au lieu d'un parcours complet de la vue.
+    """
+
+    @staticmethod
+    def _query(sql: str, params: dict) -> list:
+        init_schema()
+        with get_engine().connect() as conn:
+            return [dict(r) for r in conn.execute(text(sql), params).mappings()]
+
+    @staticmethod
+    def daily(start: date, end: date, groupe: str = None) -> list:
+        return StatsService._query(
+            f"""
+                SELECT jour, groupe, calls, {_SUMS}, {_AVGS}
+                FROM {DAILY_TABLE}
+                WHERE jour BETWEEN :start AND :end
+                  AND (CAST(:groupe AS TEXT) IS NULL OR groupe = :groupe)
+                ORDER BY jour, groupe
+            """,
+            {"start": start, "end": end, "groupe": groupe}
+        )
+
+    @staticmethod
+    def weekly(start_week: str, end_week: str, groupe: str = None) -> list:
+        (y1, w1), (y2, w2) = _parse_week(start_week), _parse_week(end_week)
+        rows = StatsService._query(
+            f"""
+                SELECT iso_year, iso_week, groupe, calls, {_SUMS}, {_AVGS}
+                FROM {WEEKLY_TABLE}
+                WHERE (iso_year, iso_week) BETWEEN (:y1, :w1) AND (:y2, :w2)
+                  AND (CAST(:groupe AS TEXT) IS NULL OR groupe = :groupe)
+                ORDER BY iso_year, iso_week, groupe
+            """,
+            {"y1": y1, "w1": w1, "y2": y2, "w2": w2, "groupe": groupe}
+        )
+        for row in rows:
+            row["week"] = f"{row['iso_year']}-W{row['iso_week']:02d}"
+        return rows
+
+    @staticmethod
+    def groups() -> list:
+        rows = StatsService._query(f"SELECT DISTINCT groupe FROM {WEEKLY_TABLE} ORDER BY groupe", {})
+        return [r["groupe"] for r in rows]
+
+    @staticmethod
+    def rebuild() -> dict:
+        """
+        Recalcule entièrement les rollups depuis la table (données importées
+        avant leur mise en place, correction manuelle...). Les tables sont
+        verrouillées le temps du recalcul : une ingestion concurrente attend.
+        """
+        init_schema()
+        sums = ", ".join(f"COALESCE(SUM({m}), 0)" for m in MEASURES)
+        with get_engine().begin() as conn:
+            conn.execute(text(f"LOCK TABLE {DAILY_TABLE}, {WEEKLY_TABLE} IN EXCLUSIVE MODE"))
+            conn.execute(text(f"DELETE FROM {DAILY_TABLE}"))
+            conn.execute(text(f"DELETE FROM {WEEKLY_TABLE}"))
+            days = conn.execute(text(f"""
+                INSERT INTO {DAILY_TABLE} (jour, groupe, calls, {_SUMS})
+                SELECT date_appel::date, COALESCE({STATS_GROUP_COLUMN}::text, ''), count(*), {sums}
+                FROM {TABLE_NAME}
+                WHERE date_appel IS NOT NULL
+                GROUP BY 1, 2
+            """)).rowcount
+            weeks = conn.execute(text(f"""
+                INSERT INTO {WEEKLY_TABLE} (iso_year, iso_week, groupe, calls, {_SUMS})
+                SELECT EXTRACT(isoyear FROM jour)::int, EXTRACT(week FROM jour)::int, groupe,
+                       SUM(calls), {", ".join(f"SUM({m}_sum)" for m in MEASURES)}
+                FROM {DAILY_TABLE}
+                GROUP BY 1, 2, 3
+            """)).rowcount
+        logger.info(f"[STATS] Rollups recalculés : {days} ligne(s) jour, {weeks} ligne(s) semaine")
+        return {"status": "rebuilt", "daily_rows": days, "weekly_rows": weeks}
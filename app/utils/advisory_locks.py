@@ -0,0 +1,47 @@
+# app/utils/advisory_locks.py
+import hashlib
+import logging
+from contextlib import contextmanager
+from app.database import get_engine
+
+logger = logging.getLogger(__name__)
+
+
+def lock_key(name: str) -> int:
+    """Clé bigint stable (identique dans tous les processus) d'un verrou nommé."""
+    return int.from_bytes(hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
+@contextmanager
+def advisory_lock(name: str):
+    """
+    Verrou consultatif PostgreSQL de session, sans attente : produit la
+    connexion qui le tient s'il est obtenu, None s'il est tenu par une autre
+    session (autre worker uvicorn, autre processus d'ingestion). Il est tenu
+    sur une connexion du pool dédiée, pour toute la durée du bloc,
+    indépendamment des transactions validées entre-temps ; il disparaît avec
+    la connexion si le processus meurt. Le bloc peut se servir de cette
+    connexion pour ses propres écritures (ex. quarantaine des rejets) tant
+    qu'il laisse la transaction close.
+    """
+    key = lock_key(name)
+    conn = get_engine().raw_connection()
+    acquired = False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (key,))
+            acquired = cur.fetchone()[0]
+        conn.commit()
+        yield conn if acquired else None
+    finally:
+        try:
+            if acquired:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (key,))
+                conn.commit()
+        except Exception as e:
+            # Connexion douteuse : retirée du pool plutôt que d'y laisser un verrou
+            logger.warning(f"[LOCK] Libération du verrou '{name}' impossible ({e}), connexion écartée")
+            conn.invalidate()
+        finally:
+            conn.close()
@@ -0,0 +1,445 @@
+# app/utils/csv_tokenizer.py
+import csv
+import logging
+from itertools import chain
+from typing import Iterator
+
+import pandas as pd
+
+from app.utils.stream_io import IterStream
+from app.utils import metrics
+from app.utils.rejects import TOO_MANY_FIELDS, MISSING_FIELDS, INVALID_ROW
+
+logger = logging.getLogger(__name__)
+
+QUOTE = b'"'
+COMMA = b","
+FIELD_QUOTE = b',"'  # guillemet ouvrant un champ
+NEWLINE = b"\n"
+# Caractère d'échappement du flux (escapechar="\\" du lecteur historique) :
+# \" et \, sont littéraux, y compris entre guillemets
+ESCAPE = b"\\"
+
+# Au-delà, un guillemet isolé est considéré comme une anomalie et non comme
+# l'ouverture d'un champ multi-lignes (évite d'avaler le reste du fichier).
+MAX_RECORD_LINES = 200
+
+# Taille des blocs lus par pyarrow (octets)
+PYARROW_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def _scan_escaped(line: bytes, quoted: bool, escape: bytes) -> bool:
+    """scan_quotes pour une ligne contenant le caractère d'échappement."""
+    pos = 0
+    size = len(line)
+    field_start = not quoted
+    while pos < size:
+        char = line[pos:pos + 1]
+        if char == escape:
+            pos += 2
+            field_start = False
+            continue
+        if quoted:
+            if char == QUOTE:
+                if line.startswith(QUOTE, pos + 1):
+                    pos += 1
+                else:
+                    quoted = False
+        elif char == QUOTE and field_start:
+            quoted = True
+        field_start = char == COMMA and not quoted
+        pos += 1
+    return quoted
+
+
+def scan_quotes(line: bytes, quoted: bool = False, escape: bytes = ESCAPE) -> bool:
+    """
+    Indique si la ligne physique `line` se termine entre guillemets, en
+    partant de l'état `quoted` (ligne précédente de l'enregistrement). Comme
+    pour le parser C, un guillemet n'ouvre un champ qu'en début de champ :
+    un guillemet isolé dans un texte non protégé est un caractère ordinaire.
+    Entre guillemets, "" est un guillemet échappé.
+    """
+    if QUOTE not in line:
+        return quoted
+    if escape and escape in line:
+        return _scan_escaped(line, quoted, escape)
+    pos = 0
+    if not quoted and line.startswith(QUOTE):
+        quoted, pos = True, 1
+    while True:
+        if quoted:
+            q = line.find(QUOTE, pos)
+            if q < 0:
+                return True
+            if line.startswith(QUOTE, q + 1):
+                pos = q + 2
+                continue
+            quoted, pos = False, q + 1
+        else:
+            q = line.find(FIELD_QUOTE, pos)
+            if q < 0:
+                return False
+            quoted, pos = True, q + 2
+
+
+def _split_escaped(record: bytes, escape: bytes) -> list:
+    """split_record pour un enregistrement contenant le caractère d'échappement."""
+    fields = []
+    start = pos = 0
+    quoted = False
+    size = len(record)
+    while pos < size:
+        char = record[pos:pos + 1]
+        if char == escape:
+            pos += 2
+            continue
+        if char == QUOTE:
+            if quoted and record.startswith(QUOTE, pos + 1):
+                pos += 2
+                continue
+            if quoted or pos == start:
+                quoted = not quoted
+        elif char == COMMA and not quoted:
+            fields.append(record[start:pos])
+            start = pos + 1
+        pos += 1
+    fields.append(record[start:])
+    return fields
+
+
+def split_record(record: bytes, escape: bytes = ESCAPE) -> list:
+    """
+    Découpe un enregistrement CSV complet (RFC 4180) en champs bruts.
+    Les guillemets sont conservés tels quels : seul le découpage est fait ici,
+    le parser en aval se charge de l'interprétation des champs. Un caractère
+    précédé de `escape` (None : pas d'échappement) n'est jamais un séparateur.
+    """
+    if escape and escape in record:
+        return _split_escaped(record, escape)
+    if QUOTE not in record:
+        return record.split(COMMA)
+
+    fields = []
+    pos = 0
+    size = len(record)
+    while True:
+        end = pos
+        if record.startswith(QUOTE, pos):
+            # Champ entre guillemets : "" est un guillemet échappé
+            end = pos + 1
+            while True:
+                q = record.find(QUOTE, end)
+                if q < 0:
+                    end = size
+                    break
+                if record.startswith(QUOTE, q + 1):
+                    end = q + 2
+                    continue
+                end = q + 1
+                break
+
+        comma = record.find(COMMA, end)
+        if comma < 0:
+            fields.append(record[pos:])
+            return fields
+        fields.append(record[pos:comma])
+        pos = comma + 1
+
+
+def iter_record_segments(blocks, segment_size: int, escape: bytes = ESCAPE):
+    """
+    Regroupe un flux de blocs bytes bruts en segments d'au moins
+    `segment_size` octets qui se terminent sur une fin d'enregistrement
+    (`\n` hors guillemets, même règle que `CommentColumnStripper`).
+    Concaténés, les segments redonnent exactement le flux d'origine : la
+    somme de leurs tailles est un offset valide pour reprendre la lecture.
+    """
+    carry = b""
+    out, size = [], 0
+    for block in blocks:
+        data = carry + block
+        lines = data.split(NEWLINE)
+        lines.pop()  # ligne incomplète : reportée au bloc suivant
+        consumed = boundary = 0
+        in_record, open_lines = False, 0
+        for line in lines:
+            consumed += len(line) + 1
+            in_record = scan_quotes(line, in_record, escape)
+            if in_record:
+                open_lines += 1
+                if open_lines < MAX_RECORD_LINES:
+                    continue
+                in_record = False  # guillemet isolé : découpage ligne par ligne
+            open_lines = 0
+            boundary = consumed
+
+        carry = data[boundary:]
+        if boundary:
+            out.append(data[:boundary])
+            size += boundary
+        if size >= segment_size:
+            yield b"".join(out)
+            out, size = [], 0
+
+    if out or carry:
+        yield b"".join(out) + carry
+
+
+class CommentColumnStripper:
+    """
+    Tokeniseur CSV en streaming, conforme RFC 4180, qui travaille directement
+    sur les octets (UTF-8, latin1 et cp1252 ne codent jamais `,` `"` ou `\\n`
+    dans un caractère multi-octets). Il reconstitue les enregistrements
+    multi-lignes et supprime la colonne texte libre (COMMENTAIRE) avant que
+    le parser ne les voie, ce qui permet d'utiliser les moteurs C ou pyarrow.
+    Un enregistrement dont le nombre de champs (après suppression) diffère
+    de l'en-tête est écarté avant le parser et transmis à `rejects`
+    (RejectSink) avec son numéro de ligne ; `line_offset` est le nombre de
+    lignes du fichier qui précèdent les blocs reçus, en-tête non compris.
+    `escape` : caractère d'échappement du flux (None : aucun).
+    """
+
+    def __init__(self, column: str = "COMMENTAIRE", rejects=None, line_offset: int = 0, escape: bytes = ESCAPE):
+        self.column = column.upper().encode("ascii") if column else None
+        self.escape = escape
+        self.rejects = rejects
+        self.line_offset = line_offset
+        self.header = None        # champs bruts de l'en-tête d'origine
+        self.column_idx = None    # index de la colonne supprimée
+        self.expected_fields = None
+        self.records = 0          # enregistrements de données traités
+        self.rejected = 0
+        self.lines = 0            # lignes physiques lues
+        self.record_line = 0      # première ligne de l'enregistrement courant
+
+    def _process_header(self, record: bytes):
+        self.header = split_record(record, self.escape)
+        names = [f.strip().strip(QUOTE).strip().upper() for f in self.header]
+        # Le BOM UTF-8 éventuel colle au premier nom de colonne
+        if names:
+            names[0] = names[0].lstrip(b"\xef\xbb\xbf")
+
+        if self.column is not None and self.column in names:
+            self.column_idx = names.index(self.column)
+            logger.info(f"[CLEAN] Colonne '{self.column.decode()}' détectée à l’index {self.column_idx}, suppression.")
+        elif self.column is not None:
+            logger.warning(f"[CLEAN] Aucune colonne '{self.column.decode()}' détectée, rien à supprimer.")
+        self.expected_fields = len(self.header) - (self.column_idx is not None)
+
+    def _strip(self, record: bytes) -> tuple:
+        """Retourne (enregistrement sans la colonne, nombre de champs restants)."""
+        if self.column_idx is None:
+            plain = QUOTE not in record and not (self.escape and self.escape in record)
+            count = record.count(COMMA) + 1 if plain else len(split_record(record, self.escape))
+            return record, count
+
+        fields = split_record(record, self.escape)
+        # Des virgules non protégées dans le texte libre produisent des champs
+        # en trop : on les attribue à la colonne supprimée.
+        extra = len(fields) - len(self.header)
+        if extra > 0:
+            del fields[self.column_idx:self.column_idx + extra + 1]
+        elif len(fields) > self.column_idx:
+            del fields[self.column_idx]
+        return COMMA.join(fields), len(fields)
+
+    def _reject(self, record: bytes, count: int):
+        reason = TOO_MANY_FIELDS if count > self.expected_fields else MISSING_FIELDS
+        line = self.line_offset + self.record_line
+        self.rejected += 1
+        metrics.count("bad_lines")
+        if self.rejects is not None:
+            self.rejects.add(line, reason, record)
+        else:
+            logger.warning(f"[CSV] Ligne {line} ignorée ({count} champs au lieu de {self.expected_fields})")
+
+    def iter_records(self, blocks, block_marks: bool = False):
+        """
+        Produit les enregistrements logiques (sans fin de ligne) à partir d'un
+        flux de blocs bytes. Un enregistrement se termine sur un `\\n` situé
+        hors guillemets (voir scan_quotes).
+        Avec `block_marks`, `None` est produit à la fin de chaque bloc d'entrée.
+        """
+        pending = b""
+        open_record = []  # lignes physiques d'un enregistrement multi-lignes
+
+        for block in blocks:
+            lines = (pending + block).split(NEWLINE)
+            pending = lines.pop()
+            for line in lines:
+                self.lines += 1
+                if open_record:
+                    open_record.append(line)
+                    if not scan_quotes(line, True, self.escape):
+                        yield NEWLINE.join(open_record).rstrip(b"\r")
+                        open_record = []
+                    elif len(open_record) >= MAX_RECORD_LINES:
+                        logger.warning("[CLEAN] Guillemet non refermé, enregistrement découpé ligne par ligne.")
+                        first = self.record_line
+                        for i, physical in enumerate(open_record):
+                            self.record_line = first + i
+                            yield physical.rstrip(b"\r")
+                        open_record = []
+                elif scan_quotes(line, False, self.escape):
+                    open_record.append(line)
+                    self.record_line = self.lines
+                else:
+                    self.record_line = self.lines
+                    yield line.rstrip(b"\r")
+            if block_marks:
+                yield None
+
+        if pending:
+            self.lines += 1
+        if open_record:
+            open_record.append(pending)
+            yield NEWLINE.join(open_record).rstrip(b"\r")
+        elif pending:
+            self.record_line = self.lines
+            yield pending.rstrip(b"\r")
+
+    def iter_cleaned(self, blocks):
+        """
+        Produit des blocs bytes alignés sur les enregistrements, en-tête
+        compris, sans la colonne COMMENTAIRE. Un bloc de sortie est émis par
+        bloc d'entrée : la mémoire reste bornée par la taille des blocs.
+        """
+        out = []
+        for record in self.iter_records(blocks, block_marks=True):
+            if record is None:
+                if out:
+                    out.append(b"")
+                    yield NEWLINE.join(out)
+                    out = []
+            elif self.header is None:
+                self._process_header(record)
+                out.append(self._strip(record)[0])
+            elif record:
+                stripped, count = self._strip(record)
+                if count != self.expected_fields:
+                    self._reject(record, count)
+                    continue
+                self.records += 1
+                out.append(stripped)
+
+        if out:
+            out.append(b"")
+            yield NEWLINE.join(out)
+
+    def output_columns(self, encoding: str) -> list:
+        """Noms des colonnes restantes après suppression, décodés."""
+        header = self._strip(COMMA.join(self.header))[0].decode(encoding, errors="replace")
+        return next(csv.reader([header], escapechar=self.escape.decode() if self.escape else None))
+
+
+def _read_pyarrow(stream, columns: list, encoding: str, chunksize: int, na_values=None, on_invalid=None,
+                  names: list = None, schema=None, escapechar: str = None):
+    """
+    Lecture via pyarrow.csv, regroupée en DataFrames de `chunksize` lignes.
+    `on_invalid(texte)` reçoit les lignes refusées par pyarrow. Avec `schema`
+    (TableSchema), les colonnes prennent les noms `names` et leurs types
+    finaux avant la conversion en pandas.
+    """
+    try:
+        import pyarrow as pa
+        from pyarrow import csv as pa_csv
+    except ImportError as e:
+        raise RuntimeError("Le moteur CSV 'pyarrow' nécessite le paquet pyarrow") from e
+
+    def on_invalid_row(row):
+        logger.warning(f"[CSV] Ligne {row.number} ignorée : {row.text!r}")
+        if on_invalid is not None:
+            on_invalid(row.text)
+        return "skip"
+
+    reader = pa_csv.open_csv(
+        stream,
+        read_options=pa_csv.ReadOptions(encoding=encoding, block_size=PYARROW_BLOCK_SIZE),
+        parse_options=pa_csv.ParseOptions(
+            newlines_in_values=True, escape_char=escapechar or False, invalid_row_handler=on_invalid_row
+        ),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={c: pa.string() for c in columns},
+            null_values=list(na_values) if na_values is not None else [""],
+            strings_can_be_null=True,
+        ),
+    )
+
+    def to_pandas(table):
+        if schema is None:
+            return table.to_pandas()
+        return schema.to_pandas(table.rename_columns(names))
+
+    batches, rows = [], 0
+    for batch in reader:
+        batches.append(batch)
+        rows += batch.num_rows
+        while rows >= chunksize:
+            table = pa.Table.from_batches(batches, schema=reader.schema)
+            yield to_pandas(table.slice(0, chunksize))
+            rest = table.slice(chunksize)
+            batches, rows = rest.to_batches(), rest.num_rows
+
+    if rows:
+        yield to_pandas(pa.Table.from_batches(batches, schema=reader.schema))
+
+
+def read_stripped_csv(blocks, encoding: str, engine: str = "c", chunksize: int = 50000,
+                      column: str = "COMMENTAIRE", rejects=None, line_offset: int = 0,
+                      schema=None, **read_kwargs) -> Iterator[pd.DataFrame]:
+    """
+    Lit un CSV fourni sous forme de blocs bytes, en supprimant la colonne
+    `column` au fil de l'eau, et produit des DataFrames de `chunksize` lignes.
+    `engine` : "c" (pandas) ou "pyarrow". Les options supplémentaires sont
+    transmises à `pd.read_csv` (moteur C uniquement, sauf `na_values` et
+    `escapechar`, "\\" par défaut comme le lecteur historique ; None pour
+    un flux sans échappement).
+    Les enregistrements rejetés partent dans `rejects` (RejectSink), numérotés
+    à partir de `line_offset` (voir CommentColumnStripper).
+    Avec `schema` (app.schema.TableSchema), les chunks sortent avec les noms
+    de colonnes cibles et leurs types finaux : texte en chaînes Arrow,
+    entiers en Int64 (les dates restent à DataCleaner).
+    """
+    if engine not in ("c", "pyarrow"):
+        raise ValueError(f"Moteur CSV non supporté par le tokeniseur : {engine}")
+
+    escapechar = read_kwargs.setdefault("escapechar", ESCAPE.decode())
+    stripper = CommentColumnStripper(column, rejects, line_offset, escapechar.encode() if escapechar else None)
+    parser_rejects = []
+
+    def on_invalid(record):
+        parser_rejects.append(1)
+        metrics.count("bad_lines")
+        if rejects is not None:
+            rejects.add(None, INVALID_ROW, record)
+
+    pieces = stripper.iter_cleaned(blocks)
+    first = next(pieces, None)
+    if first is None:
+        raise ValueError("Fichier CSV vide ou illisible")
+    stream = IterStream(chain([first], pieces), binary=True)
+    columns = stripper.output_columns(encoding)
+    names = schema.target_names(columns) if schema is not None else None
+
+    if engine == "pyarrow":
+        chunks = _read_pyarrow(
+            stream, columns, encoding, chunksize,
+            na_values=read_kwargs.get("na_values"), on_invalid=on_invalid, names=names, schema=schema,
+            escapechar=escapechar
+        )
+    elif schema is not None:
+        read_kwargs.update(names=names, header=0, dtype=schema.read_dtypes(names))
+        chunks = pd.read_csv(stream, engine="c", encoding=encoding, chunksize=chunksize, **read_kwargs)
+        chunks = (schema.convert(chunk) for chunk in chunks)
+    else:
+        chunks = pd.read_csv(stream, engine="c", encoding=encoding, chunksize=chunksize, **read_kwargs)
+
+    rows = 0
+    for chunk in chunks:
+        rows += len(chunk)
+        yield chunk
+    # Enregistrements transmis au parser mais écartés sans notification
+    dropped = stripper.records - rows - len(parser_rejects)
+    if dropped > 0:
+        metrics.count("bad_lines", dropped)
@@ -0,0 +1,199 @@
+# app/utils/encoding.py
+import fnmatch
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from charset_normalizer import from_bytes
+from app.config import ENCODING_SAMPLE_SIZE, ENCODING_FALLBACKS, ENCODING_PROFILES_PATH, SFTP_WATCH_PATTERN
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(encoding: str) -> str:
+    return encoding.lower().replace("_", "-")
+
+
+def _is_utf8(encoding: str) -> bool:
+    return _normalize(encoding) in ("utf-8", "utf8")
+
+
+def _decodes(sample: bytes, encoding: str) -> bool:
+    """L'échantillon se décode-t-il strictement ? (caractère tronqué en fin toléré)"""
+    try:
+        sample.decode(encoding)
+        return True
+    except UnicodeDecodeError as e:
+        return e.reason == "unexpected end of data" and e.end == len(sample)
+    except LookupError:
+        return False
+
+
+def detect_encoding(data: bytes, sample_size: int = ENCODING_SAMPLE_SIZE) -> str:
+    """
+    Détection sur un échantillon borné. Un échantillon UTF-8 valide contenant
+    des octets non ASCII est un signal quasi certain : charset_normalizer n'est
+    appelé qu'à défaut, restreint aux encodages candidats (ENCODING_FALLBACKS).
+    """
+    sample = bytes(data[:sample_size])
+    if _decodes(sample, "utf-8"):
+        return "utf-8"
+    result = from_bytes(sample, cp_isolation=list(ENCODING_FALLBACKS)).best()
+    if result and result.encoding:
+        return result.encoding
+    logger.warning("[ENCODING] Encodage indéterminé → fallback sur utf-8")
+    return "utf-8"
+
+
+def profile_source(file_name: str) -> str:
+    """
+    Clé de profil d'un fichier, indépendante de son emplacement : le motif
+    SFTP_WATCH_PATTERN (ex. "*_VocalCom_Incoming.csv") s'il correspond,
+    sinon le nom dont les chiffres (dates, numéros) sont rendus génériques.
+    """
+    name = os.path.basename(file_name)
+    if fnmatch.fnmatch(name, SFTP_WATCH_PATTERN):
+        return f"pattern:{SFTP_WATCH_PATTERN}"
+    return "pattern:" + re.sub(r"\d+", "*", name)
+
+
+class EncodingProfiles:
+    """
+    Dernier encodage constaté par source (ex. "sftp:<hôte>" ou motif de
+    nom, voir profile_source), persisté en JSON. Pour un flux connu, l'échantillon est seulement validé contre
+    l'encodage mémorisé au lieu de relancer la détection.
+    """
+
+    def __init__(self, path: str = ENCODING_PROFILES_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._profiles = None
+
+    def _load(self) -> dict:
+        if self._profiles is None:
+            try:
+                with open(self.path) as f:
+                    self._profiles = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._profiles = {}
+            # Anciennes clés par dossier ("path:<chemin absolu>") : abandonnées
+            for key in [k for k in self._profiles if k.startswith("path:")]:
+                del self._profiles[key]
+        return self._profiles
+
+    def get(self, source: str):
+        with self._lock:
+            profile = self._load().get(source)
+        return profile["encoding"] if profile else None
+
+    def remember(self, source: str, encoding: str):
+        with self._lock:
+            profiles = self._load()
+            previous = profiles.get(source, {})
+            if previous.get("encoding") == encoding:
+                return
+            profiles[source] = {"encoding": encoding, "updated_at": time.time()}
+            try:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                with os.fdopen(fd, "w") as f:
+                    json.dump(profiles, f, indent=2)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                logger.warning(f"[ENCODING] Profil non sauvegardé pour {source} : {e}")
+        logger.info(f"[ENCODING] Profil {source} → {encoding}")
+
+    def resolve(self, source: str, sample: bytes) -> str:
+        """Encodage à utiliser pour un nouveau fichier de `source`."""
+        sample = bytes(sample[:ENCODING_SAMPLE_SIZE])
+        known = self.get(source) if source else None
+
+        with metrics.stage("encoding", nbytes=len(sample)):
+            if _decodes(sample, "utf-8") and (not sample.isascii() or known is None):
+                encoding = "utf-8"
+            elif known and _decodes(sample, known):
+                # Échantillon ASCII ou compatible : l'encodage habituel du flux s'applique
+                return known
+            else:
+                encoding = detect_encoding(sample)
+
+        if source:
+            self.remember(source, encoding)
+        return encoding
+
+
+encoding_profiles = EncodingProfiles()
+
+
+class Utf8Transcoder:
+    """
+    Convertit un flux de blocs bytes en UTF-8 en décodant strictement avec
+    `encoding`. À la première séquence invalide, le flux bascule sur
+    l'encodage de repli suivant à partir de l'octet fautif : tout ce qui a
+    déjà été décodé (et parsé en aval) est conservé. Un flux déjà en UTF-8
+    est validé puis transmis tel quel, sans réencodage.
+    """
+
+    def __init__(self, blocks, encoding: str, fallbacks=ENCODING_FALLBACKS):
+        self.blocks = blocks
+        self.encoding = encoding
+        self.initial_encoding = encoding
+        self.switches = []  # (position en octets, ancien encodage, nouvel encodage)
+        self._fallbacks = [e for e in fallbacks if _normalize(e) != _normalize(encoding)]
+        self._offset = 0
+
+    def _switch(self, position: int, error: UnicodeDecodeError):
+        if not self._fallbacks:
+            raise error
+        new = self._fallbacks.pop(0)
+        logger.warning(
+            f"[ENCODING] Séquence invalide en {self.encoding} à l'octet {position}, bascule sur {new}"
+        )
+        self.switches.append((position, self.encoding, new))
+        self.encoding = new
+
+    def _convert(self, data: bytes, final: bool):
+        """Retourne (octets UTF-8, reste non décodé à reporter au bloc suivant)."""
+        out = []
+        while data:
+            try:
+                text = data.decode(self.encoding)
+            except UnicodeDecodeError as e:
+                if not final and e.reason == "unexpected end of data" and e.end == len(data):
+                    valid, rest = data[:e.start], data[e.start:]
+                    out.append(self._emit(valid))
+                    self._offset += len(valid)
+                    return b"".join(out), rest
+                valid = data[:e.start]
+                out.append(self._emit(valid))
+                self._switch(self._offset + len(valid), e)
+                self._offset += len(valid)
+                data = data[e.start:]
+                continue
+            out.append(text.encode("utf-8") if not _is_utf8(self.encoding) else data)
+            self._offset += len(data)
+            break
+        return b"".join(out), b""
+
+    def _emit(self, valid: bytes) -> bytes:
+        if _is_utf8(self.encoding):
+            return valid
+        return valid.decode(self.encoding).encode("utf-8")
+
+    def __iter__(self):
+        return metrics.timed("decode", self._iter_converted(), nbytes=len)
+
+    def _iter_converted(self):
+        carry = b""
+        for block in self.blocks:
+            data, carry = self._convert(carry + block, final=False)
+            if data:
+                yield data
+        if carry:
+            data, _ = self._convert(carry, final=True)
+            if data:
+                yield data
@@ -0,0 +1,63 @@
+# app/utils/fingerprint.py
+import hashlib
+
+BLOCK_SIZE = 1024 * 1024
+
+
+class ContentDigest:
+    """
+    Empreinte d'un contenu calculée au fil de la lecture : sha256, taille en
+    octets, nombre de lignes et premier enregistrement (en-tête CSV). Le hash peut être
+    prolongé : après vérification d'un préfixe déjà importé, les octets
+    ajoutés complètent la même empreinte.
+    """
+
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        self.length = 0
+        self.lines = 0           # fins de ligne vues (numérotation des rejets)
+        self.header = b""        # première ligne, fin de ligne comprise
+        self._header_done = False
+        self.last_byte = b""
+
+    def update(self, block: bytes):
+        if not block:
+            return
+        self._hash.update(block)
+        self.length += len(block)
+        self.lines += block.count(b"\n")
+        self.last_byte = block[-1:]
+        if not self._header_done:
+            idx = block.find(b"\n")
+            self.header += block if idx < 0 else block[:idx + 1]
+            self._header_done = idx >= 0
+
+    def copy(self) -> "ContentDigest":
+        clone = ContentDigest()
+        clone._hash = self._hash.copy()
+        clone.length, clone.lines, clone.header = self.length, self.lines, self.header
+        clone._header_done, clone.last_byte = self._header_done, self.last_byte
+        return clone
+
+    def wrap(self, blocks):
+        """Relaie les blocs en les ajoutant à l'empreinte."""
+        for block in blocks:
+            self.update(block)
+            yield block
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+def read_range(file_like, start: int = 0, end: int = None, block_size: int = BLOCK_SIZE):
+    """Lit les octets [start, end) d'un fichier positionnable, par blocs bornés."""
+    file_like.seek(start)
+    remaining = None if end is None else end - start
+    while remaining is None or remaining > 0:
+        size = block_size if remaining is None else min(block_size, remaining)
+        block = file_like.read(size)
+        if not block:
+            break
+        if remaining is not None:
+            remaining -= len(block)
+        yield block
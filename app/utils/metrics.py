@@ -0,0 +1,289 @@
+# app/utils/metrics.py
+import functools
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter, time
+from types import SimpleNamespace
+
+# Mesures de l'ingestion en cours dans ce contexte (None hors ingestion)
+_current = ContextVar("ingest_metrics", default=None)
+
+# Étapes qui lisent la source : leurs octets sont ceux du fichier ingéré
+SOURCE_STAGES = ("read", "download")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(l, "")) for l in self.labels)
+
+    def _samples(self):
+        """(suffixe, labels, valeur) de chaque série."""
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield "", dict(zip(self.labels, key)), value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, value=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=()):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            counts = [c + (value <= b) for c, b in zip(counts, self.buckets)]
+            self._values[key] = (counts, total + value)
+
+    def _samples(self):
+        for _, labels, (counts, total) in super()._samples():
+            for bound, count in zip(self.buckets, counts):
+                yield "_bucket", {**labels, "le": _format_value(bound)}, count
+            yield "_sum", labels, total
+            yield "_count", labels, counts[-1]
+
+
+class MetricsRegistry:
+    """Métriques du processus, exposées au format texte Prometheus."""
+
+    def __init__(self, prefix: str = "incoming_"):
+        self.prefix = prefix
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels=()) -> Counter:
+        return self._add(Counter(self.prefix + name, help, labels))
+
+    def gauge(self, name: str, help: str, labels=()) -> Gauge:
+        return self._add(Gauge(self.prefix + name, help, labels))
+
+    def histogram(self, name: str, help: str, labels=(), buckets=()) -> Histogram:
+        return self._add(Histogram(self.prefix + name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+FILES = registry.counter("ingest_files_total", "Fichiers traités par source et statut", ("source", "status"))
+FILE_SECONDS = registry.histogram(
+    "ingest_file_duration_seconds", "Durée de traitement d'un fichier", ("source",),
+    buckets=(0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+ROWS = registry.counter("ingest_rows_total", "Lignes importées", ("source",))
+BYTES = registry.counter("ingest_bytes_total", "Octets source lus", ("source",))
+BAD_LINES = registry.counter("ingest_bad_lines_total", "Enregistrements CSV rejetés par le parser", ("source",))
+STAGE_SECONDS = registry.counter("ingest_stage_seconds_total", "Temps passé par étape (hors sous-étapes)", ("stage",))
+STAGE_ROWS = registry.counter("ingest_stage_rows_total", "Lignes traitées par étape", ("stage",))
+STAGE_BYTES = registry.counter("ingest_stage_bytes_total", "Octets traités par étape", ("stage",))
+RETRIES = registry.counter("ingest_retries_total", "Nouvelles tentatives planifiées", ("kind",))
+LAST_ROWS_PER_S = registry.gauge("ingest_last_rows_per_second", "Débit du dernier import réussi", ("source",))
+LAST_SUCCESS = registry.gauge("ingest_last_success_timestamp_seconds", "Fin du dernier import réussi", ("source",))
+
+
+class IngestRun:
+    """
+    Mesures d'une ingestion (un fichier) : temps, lignes et octets par
+    étape, compteurs (lignes rejetées, nouvelles tentatives). Le pipeline
+    étant fait de générateurs imbriqués, le temps d'une étape exclut celui
+    des étapes appelées pendant qu'elle s'exécute : la somme des étapes
+    reste égale au temps mesuré.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.stages = {}  # étape → [secondes, lignes, octets]
+        self.counters = defaultdict(int)
+        self._nested = []  # temps des sous-étapes de chaque étape ouverte
+        self._started = perf_counter()
+
+    def _enter(self) -> float:
+        self._nested.append(0.0)
+        return perf_counter()
+
+    def _exit(self, name: str, started: float, rows: int = 0, nbytes: int = 0):
+        elapsed = perf_counter() - started
+        nested = self._nested.pop()
+        if self._nested:
+            self._nested[-1] += elapsed
+        acc = self.stages.setdefault(name, [0.0, 0, 0])
+        acc[0] += elapsed - nested
+        acc[1] += rows
+        acc[2] += nbytes
+
+    def _timed(self, name: str, iterable, rows, nbytes):
+        iterator = iter(iterable)
+        while True:
+            started = self._enter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._exit(name, started)
+                return
+            except BaseException:
+                self._exit(name, started)
+                raise
+            self._exit(name, started, rows(item) if rows else 0, nbytes(item) if nbytes else 0)
+            yield item
+
+    def summary(self, rows: int) -> dict:
+        duration = perf_counter() - self._started
+        nbytes = sum(self.stages[s][2] for s in SOURCE_STAGES if s in self.stages)
+        return {
+            "duration_s": round(duration, 3),
+            "rows": rows,
+            "bytes": nbytes,
+            "rows_per_s": round(rows / duration, 1) if duration > 0 else None,
+            "bad_lines": self.counters["bad_lines"],
+            "retries": self.counters["retries"],
+            "stages": {
+                name: {
+                    "seconds": round(seconds, 3),
+                    "rows": stage_rows,
+                    "bytes": stage_bytes,
+                    "rows_per_s": round(stage_rows / seconds, 1) if stage_rows and seconds > 0 else None,
+                }
+                for name, (seconds, stage_rows, stage_bytes) in self.stages.items()
+            },
+        }
+
+
+def timed(name: str, iterable, rows=None, nbytes=None):
+    """
+    Compte dans l'étape `name` le temps passé à produire chaque élément
+    d'`iterable` ; `rows(item)` / `nbytes(item)` en donnent le volume.
+    Sans ingestion en cours, `iterable` est rendu tel quel.
+    """
+    run = _current.get()
+    if run is None:
+        return iterable
+    return run._timed(name, iterable, rows, nbytes)
+
+
+@contextmanager
+def stage(name: str, rows: int = 0, nbytes: int = 0):
+    """Mesure un bloc ; les volumes peuvent être renseignés sur l'objet produit (`.rows`, `.bytes`)."""
+    probe = SimpleNamespace(rows=rows, bytes=nbytes)
+    run = _current.get()
+    if run is None:
+        yield probe
+        return
+    started = run._enter()
+    try:
+        yield probe
+    finally:
+        run._exit(name, started, probe.rows, probe.bytes)
+
+
+def count(name: str, value: int = 1):
+    """Incrémente un compteur de l'ingestion en cours ; sans effet hors ingestion."""
+    run = _current.get()
+    if run is not None:
+        run.counters[name] += value
+
+
+def record(source: str, status: str, summary: dict):
+    """Reporte les mesures d'un fichier (éventuellement traité dans un autre processus) dans le registre."""
+    FILES.inc(source=source, status=status)
+    FILE_SECONDS.observe(summary["duration_s"], source=source)
+    ROWS.inc(summary["rows"], source=source)
+    BYTES.inc(summary["bytes"], source=source)
+    if summary["bad_lines"]:
+        BAD_LINES.inc(summary["bad_lines"], source=source)
+    for name, values in summary["stages"].items():
+        STAGE_SECONDS.inc(values["seconds"], stage=name)
+        STAGE_ROWS.inc(values["rows"], stage=name)
+        STAGE_BYTES.inc(values["bytes"], stage=name)
+    if status == "success":
+        if summary["rows_per_s"] is not None:
+            LAST_ROWS_PER_S.set(summary["rows_per_s"], source=source)
+        LAST_SUCCESS.set(round(time(), 3), source=source)
+
+
+def instrumented(source: str):
+    """
+    Décorateur des points d'entrée d'ingestion : mesure l'appel, ajoute les
+    mesures au résultat (clé "metrics") et les reporte dans le registre.
+    Un appel imbriqué dans une ingestion déjà mesurée n'ouvre pas de
+    nouvelle mesure.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current.get() is not None:
+                return func(*args, **kwargs)
+            run = IngestRun(source)
+            token = _current.set(run)
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                record(source, "error", run.summary(0))
+                raise
+            finally:
+                _current.reset(token)
+            if isinstance(result, dict):
+                result["metrics"] = run.summary(result.get("rows") or 0)
+                record(source, result.get("status", "unknown"), result["metrics"])
+            return result
+        return wrapper
+    return decorate
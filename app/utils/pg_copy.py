@@ -0,0 +1,201 @@
+# app/utils/pg_copy.py
+import logging
+import queue
+import struct
+import threading
+import zlib
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Format binaire COPY : https://www.postgresql.org/docs/current/sql-copy.html
+BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+BINARY_TRAILER = struct.pack(">h", -1)
+NULL_FIELD = struct.pack(">i", -1)
+
+PG_EPOCH_US = np.datetime64("2000-01-01T00:00:00", "us").astype(np.int64)
+PG_EPOCH_DAYS = np.datetime64("2000-01-01", "D").astype(np.int64)
+
+# type PostgreSQL (information_schema.columns.data_type) → encodeur
+_INT_TYPES = {"smallint": ">i2", "integer": ">i4", "bigint": ">i8"}
+_FLOAT_TYPES = {"real": ">f4", "double precision": ">f8"}
+_TEXT_TYPES = {"text", "character varying", "character"}
+_TIMESTAMP_TYPES = {"timestamp without time zone", "timestamp with time zone"}
+
+
+class UnsupportedCopyType(Exception):
+    """Type de colonne non géré par l'encodeur binaire."""
+
+
+def iter_csv_copy(chunks):
+    """Sérialise chaque chunk en CSV (format COPY ... WITH CSV)."""
+    for df in chunks:
+        buffer = BytesIO()
+        df.to_csv(buffer, index=False, header=False)
+        yield buffer.getvalue()
+
+
+def _encode_fixed(values: np.ndarray, mask: np.ndarray, dtype: str) -> list:
+    """Champs longueur + valeur big-endian, calculés en bloc par numpy."""
+    width = np.dtype(dtype).itemsize
+    packed = np.empty(len(values), dtype=[("len", ">i4"), ("val", dtype)])
+    packed["len"] = width
+    packed["val"] = values
+    raw = packed.tobytes()
+    step = 4 + width
+    fields = [raw[i:i + step] for i in range(0, len(raw), step)]
+    for i in np.flatnonzero(mask):
+        fields[i] = NULL_FIELD
+    return fields
+
+
+def _encode_text(series: pd.Series) -> list:
+    fields = []
+    pack = struct.Struct(">i").pack
+    for value in series.astype(object).tolist():
+        if value is None or value is pd.NA or (isinstance(value, float) and value != value):
+            fields.append(NULL_FIELD)
+        else:
+            data = str(value).encode("utf-8")
+            fields.append(pack(len(data)) + data)
+    return fields
+
+
+class BinaryCopyEncoder:
+    """
+    Encode des DataFrames au format COPY binaire de PostgreSQL. Les types
+    cibles sont lus dans information_schema : l'encodage doit correspondre
+    exactement au type de la colonne (int4 ≠ int8).
+    """
+
+    def __init__(self, column_types: dict):
+        for name, pg_type in column_types.items():
+            if not (pg_type in _INT_TYPES or pg_type in _FLOAT_TYPES or pg_type in _TEXT_TYPES
+                    or pg_type in _TIMESTAMP_TYPES or pg_type == "date"):
+                raise UnsupportedCopyType(f"{name} ({pg_type})")
+        self.column_types = column_types
+
+    def _encode_column(self, series: pd.Series, pg_type: str) -> list:
+        mask = series.isna().to_numpy()
+        if pg_type in _TEXT_TYPES:
+            return _encode_text(series)
+        if pg_type in _INT_TYPES:
+            values = pd.to_numeric(series).astype("Int64").to_numpy(dtype="int64", na_value=0)
+            return _encode_fixed(values, mask, _INT_TYPES[pg_type])
+        if pg_type in _FLOAT_TYPES:
+            values = pd.to_numeric(series).to_numpy(dtype="float64", na_value=0)
+            return _encode_fixed(values, mask, _FLOAT_TYPES[pg_type])
+
+        stamps = pd.to_datetime(series).to_numpy(dtype="datetime64[us]")
+        if pg_type == "date":
+            days = stamps.astype("datetime64[D]").astype(np.int64) - PG_EPOCH_DAYS
+            return _encode_fixed(np.where(mask, 0, days), mask, ">i4")
+        micros = stamps.astype(np.int64) - PG_EPOCH_US
+        return _encode_fixed(np.where(mask, 0, micros), mask, ">i8")
+
+    def encode(self, df: pd.DataFrame) -> bytes:
+        columns = [self._encode_column(df[c], self.column_types[c]) for c in df.columns]
+        field_count = struct.pack(">h", len(columns))
+        return b"".join(field_count + b"".join(row) for row in zip(*columns))
+
+    def iter_copy(self, chunks):
+        yield BINARY_HEADER
+        for df in chunks:
+            yield self.encode(df)
+        yield BINARY_TRAILER
+
+
+class _QueueWriter:
+    """
+    Cible de COPY TO STDOUT. psycopg2 écrit ligne par ligne : les lignes sont
+    regroupées en blocs de `min_chunk` octets avant de partir dans la file bornée.
+    """
+
+    def __init__(self, q: queue.Queue, cancelled: threading.Event, min_chunk: int):
+        self.q = q
+        self.cancelled = cancelled
+        self.min_chunk = min_chunk
+        self.pending = []
+        self.size = 0
+
+    def write(self, data):
+        if self.cancelled.is_set():
+            raise IOError("Export interrompu par le client")
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.pending.append(data)
+        self.size += len(data)
+        if self.size >= self.min_chunk:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.q.put(b"".join(self.pending))
+            self.pending, self.size = [], 0
+
+
+_END = object()
+
+
+def iter_copy_out(engine, sql: str, gzip: bool = False, queue_size: int = 64, min_chunk: int = 256 * 1024):
+    """
+    Exécute `COPY (...) TO STDOUT` dans un thread et produit les octets au fur
+    et à mesure (compressés en gzip si demandé). La file bornée fait
+    contre-pression : la mémoire ne dépend pas de la taille du résultat.
+    Si le consommateur s'arrête (client déconnecté), le COPY est annulé et la
+    connexion est retirée du pool.
+    """
+    q = queue.Queue(maxsize=queue_size)
+    cancelled = threading.Event()
+    conn = engine.raw_connection()
+
+    def produce():
+        try:
+            cur = conn.cursor()
+            writer = _QueueWriter(q, cancelled, min_chunk)
+            cur.copy_expert(sql, writer)
+            writer.flush()
+            cur.close()
+            conn.commit()
+            q.put(_END)
+        except Exception as e:
+            if not cancelled.is_set():
+                logger.error(f"[EXPORT] Erreur pendant le COPY : {e}")
+            q.put(e)
+
+    thread = threading.Thread(target=produce, name="copy-out", daemon=True)
+    thread.start()
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+    finished = False
+    try:
+        while True:
+            item = q.get()
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            data = compressor.compress(item) if compressor else item
+            if data:
+                yield data
+
+        if compressor:
+            yield compressor.flush()
+        finished = True
+    finally:
+        if not finished:
+            cancelled.set()
+            # Débloque le producteur s'il attend de la place dans la file
+            while thread.is_alive():
+                try:
+                    q.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+        thread.join()
+        if finished:
+            conn.close()
+        else:
+            conn.invalidate()  # état COPY incertain : la connexion n'est pas réutilisée
@@ -0,0 +1,21 @@
+# app/utils/progress.py
+from contextvars import ContextVar
+
+# Callback de progression du job en cours d'exécution (None hors job)
+_current = ContextVar("ingest_progress", default=None)
+
+
+def bind(callback):
+    """Associe un callback `callback(rows, file_name)` au contexte courant."""
+    return _current.set(callback)
+
+
+def unbind(token):
+    _current.reset(token)
+
+
+def report(rows: int = 0, file_name: str = None):
+    """Signale `rows` lignes traitées ; sans effet hors d'un job."""
+    callback = _current.get()
+    if callback is not None:
+        callback(rows, file_name)
@@ -0,0 +1,48 @@
+# app/utils/range_filters.py
+import re
+from datetime import date, timedelta
+from app.config import PARTITION_KEY
+
+ISO_WEEK = re.compile(r"^(\d{4})-?W(\d{1,2})$", re.IGNORECASE)
+
+
+def date_range_filter(start: date, end: date) -> tuple:
+    """
+    Condition SQL (paramètres psycopg2 nommés) sélectionnant les appels du
+    [start, end]. Bornes demi-ouvertes sur les colonnes brutes, sans cast :
+    les index servent et le planner élague les partitions mensuelles. Les
+    lignes sans horodatage (partition DEFAULT) sont retrouvées par date_appel.
+    """
+    condition = f"""
+        (({PARTITION_KEY} >= %(start)s AND {PARTITION_KEY} < %(stop)s)
+         OR ({PARTITION_KEY} IS NULL AND date_appel >= %(start)s AND date_appel < %(stop)s))
+    """
+    return condition, {"start": start, "stop": end + timedelta(days=1)}
+
+
+def iso_week_range(start_week: str, end_week: str):
+    """
+    "2024-W37", "2024-W38" → (lundi de la S37, dimanche de la S38) ;
+    None si les semaines ne sont pas au format ISO avec année.
+    """
+    first, last = ISO_WEEK.match(start_week.strip()), ISO_WEEK.match(end_week.strip())
+    if not (first and last):
+        return None
+    low = date.fromisocalendar(int(first[1]), int(first[2]), 1)
+    high = date.fromisocalendar(int(last[1]), int(last[2]), 7)
+    return low, high
+
+
+def week_range_filter(start_week: str, end_week: str) -> tuple:
+    """
+    Condition SQL pour une plage de semaines : au format ISO avec année,
+    plage de dates (élagage des partitions) ; sinon numéros de semaine
+    comparés en entiers sur `semaine` (et non plus en texte, où "10" < "9").
+    """
+    bounds = iso_week_range(start_week, end_week)
+    if bounds is not None:
+        return date_range_filter(*bounds)
+    try:
+        return "semaine BETWEEN %(start)s AND %(end)s", {"start": int(start_week), "end": int(end_week)}
+    except ValueError:
+        raise ValueError(f"Semaine invalide : {start_week!r} / {end_week!r} (numéro ou AAAA-Wss attendu)")
@@ -0,0 +1,141 @@
+# app/utils/rejects.py
+import csv
+import logging
+from collections import Counter
+from io import StringIO
+from sqlalchemy import text
+from app.config import REJECTS_TABLE, REJECTS_BATCH_ROWS, REJECTS_MAX_RECORD_BYTES
+from app.database import get_engine, init_schema
+
+logger = logging.getLogger(__name__)
+
+# Motifs de rejet
+TOO_MANY_FIELDS = "too_many_fields"
+MISSING_FIELDS = "missing_fields"
+INVALID_ROW = "invalid_row"  # ligne refusée par le parser lui-même
+
+
+class RejectSink:
+    """
+    Quarantaine des enregistrements rejetés pendant l'import d'un fichier :
+    chaque rejet (numéro de ligne, motif, enregistrement brut tronqué) est
+    mis en tampon puis écrit par lots de REJECTS_BATCH_ROWS via COPY, sur
+    une connexion dédiée : l'écriture a lieu pendant le COPY des données,
+    et la mémoire reste bornée quel que soit le nombre de rejets.
+    Les rejets sont conservés même si l'import est annulé ; un nouvel
+    import du fichier remplace ceux des lignes qu'il relit (`reset_from`).
+    `conn` : connexion existante à utiliser (laissée ouverte, ex. celle du
+    verrou du fichier) ; à défaut, une connexion est empruntée au pool.
+    """
+
+    def __init__(self, file_name: str, batch_rows: int = REJECTS_BATCH_ROWS,
+                 max_record_bytes: int = REJECTS_MAX_RECORD_BYTES, conn=None):
+        self.file_name = file_name
+        self.batch_rows = batch_rows
+        self.max_record_bytes = max_record_bytes
+        self.counts = Counter()
+        self._buffer = []
+        self._conn = conn
+        self._owns_conn = conn is None
+
+    def reset_from(self, line_number: int = 0):
+        """
+        Supprime les rejets déjà enregistrés pour ce fichier à partir de
+        `line_number` ; ceux sans numéro de ligne (refusés par le parser)
+        ne sont supprimés que pour un import complet (`line_number` 0).
+        """
+        init_schema()
+        with get_engine().begin() as conn:
+            conn.execute(
+                text(f"""
+                    DELETE FROM {REJECTS_TABLE}
+                    WHERE file_name = :f
+                      AND (line_number >= :l OR (line_number IS NULL AND :l = 0))
+                """),
+                {"f": self.file_name, "l": line_number}
+            )
+
+    def discard(self):
+        """Oublie tous les rejets du fichier (import abandonné, ex. doublon)."""
+        self._buffer.clear()
+        self.counts.clear()
+        self.reset_from(0)
+
+    def add(self, line_number, reason: str, record):
+        """Met un enregistrement (bytes UTF-8 ou str) en quarantaine."""
+        self.counts[reason] += 1
+        if isinstance(record, bytes):
+            record = record[:self.max_record_bytes].decode("utf-8", errors="replace")
+        else:
+            record = str(record)[:self.max_record_bytes]
+        # COPY refuse le caractère NUL
+        self._buffer.append((self.file_name, line_number, reason, record.replace("\x00", "")))
+        if len(self._buffer) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        buffer = StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        try:
+            init_schema()
+            if self._conn is None:
+                self._conn = get_engine().raw_connection()
+            with self._conn.cursor() as cur:
+                cur.copy_expert(
+                    f"COPY {REJECTS_TABLE} (file_name, line_number, reason, raw_record) FROM STDIN WITH CSV",
+                    buffer
+                )
+            self._conn.commit()
+        except Exception as e:
+            # La quarantaine ne doit jamais faire échouer l'import : les compteurs restent exacts
+            logger.error(f"[REJECTS] {len(rows)} rejet(s) de {self.file_name} non enregistré(s) : {e}")
+            if self._conn is not None:
+                self._conn.rollback()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self._owns_conn and self._conn is not None:
+                self._conn.close()  # rendue au pool
+                self._conn = None
+        if self.counts:
+            logger.warning(
+                f"[REJECTS] {self.file_name} : {self.total} enregistrement(s) en quarantaine dans "
+                f"{REJECTS_TABLE} ({', '.join(f'{r}={n}' for r, n in self.counts.items())})"
+            )
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def summary(self) -> dict:
+        return {"total": self.total, "by_reason": dict(self.counts)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    @staticmethod
+    def list(file_name: str = None, limit: int = 100) -> list:
+        """Derniers rejets enregistrés, éventuellement pour un seul fichier."""
+        init_schema()
+        with get_engine().connect() as conn:
+            rows = conn.execute(
+                text(f"""
+                    SELECT file_name, line_number, reason, raw_record, rejected_at
+                    FROM {REJECTS_TABLE}
+                    WHERE CAST(:f AS TEXT) IS NULL OR file_name = :f
+                    ORDER BY rejected_at DESC, line_number
+                    LIMIT :n
+                """),
+                {"f": file_name, "n": limit}
+            ).mappings().fetchall()
+        return [dict(r) for r in rows]
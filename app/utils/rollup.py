@@ -0,0 +1,74 @@
+# app/utils/rollup.py
+from collections import defaultdict
+import pandas as pd
+from psycopg2.extras import execute_values
+from app.config import STATS_GROUP_COLUMN
+
+# Mesures cumulées par jour/semaine et groupe (colonne `<mesure>_sum` des tables de rollup)
+MEASURES = ["duree_appel", "duree_prise_en_charge", "duree_post_travail_agent", "raccrochage"]
+
+DAILY_TABLE = "call_stats_daily"
+WEEKLY_TABLE = "call_stats_weekly"
+
+
+def _upsert(cur, table: str, keys: list, rows: list):
+    columns = keys + ["calls"] + [f"{m}_sum" for m in MEASURES]
+    updates = ", ".join(f"{c} = {table}.{c} + EXCLUDED.{c}" for c in columns[len(keys):])
+    execute_values(
+        cur,
+        f"""
+        INSERT INTO {table} ({", ".join(columns)}) VALUES %s
+        ON CONFLICT ({", ".join(keys)}) DO UPDATE SET {updates}, updated_at = now()
+        """,
+        rows
+    )
+
+
+class RollupAccumulator:
+    """
+    Agrégats (nombre d'appels, somme des mesures) par jour et par groupe,
+    cumulés chunk par chunk pendant un import puis ajoutés aux tables de
+    rollup jour et semaine ISO par `flush`, sur le curseur de l'import :
+    données et agrégats sont validés dans la même transaction.
+    """
+
+    def __init__(self, group_column: str = STATS_GROUP_COLUMN):
+        self.group_column = group_column
+        self._days = defaultdict(lambda: [0] * (len(MEASURES) + 1))
+
+    def add(self, df: pd.DataFrame):
+        if "date_appel" not in df.columns or not pd.api.types.is_datetime64_any_dtype(df["date_appel"]):
+            return
+        days = df["date_appel"].dt.normalize()
+        groups = df[self.group_column].fillna("") if self.group_column in df.columns else ""
+        frame = pd.DataFrame({"jour": days, "groupe": groups})
+        for m in MEASURES:
+            frame[m] = df[m].astype("float64") if m in df.columns else 0.0
+        frame = frame[days.notna()]
+        if frame.empty:
+            return
+
+        grouped = frame.groupby(["jour", "groupe"], sort=False)
+        sums = grouped[MEASURES].sum()
+        sums.insert(0, "calls", grouped.size())
+        for (day, group), values in zip(sums.index, sums.to_numpy()):
+            acc = self._days[(day.date(), group)]
+            for i, v in enumerate(values):
+                acc[i] += int(v)
+
+    def flush(self, cur):
+        """Ajoute les agrégats accumulés aux tables de rollup puis repart de zéro."""
+        if not self._days:
+            return
+        weeks = defaultdict(lambda: [0] * (len(MEASURES) + 1))
+        daily = []
+        for (day, group), values in self._days.items():
+            daily.append((day, group, *values))
+            iso = day.isocalendar()
+            acc = weeks[(iso[0], iso[1], group)]
+            for i, v in enumerate(values):
+                acc[i] += v
+
+        _upsert(cur, DAILY_TABLE, ["jour", "groupe"], daily)
+        _upsert(cur, WEEKLY_TABLE, ["iso_year", "iso_week", "groupe"], [(*k, *v) for k, v in weeks.items()])
+        self._days.clear()
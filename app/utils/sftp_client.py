@@ -1,12 +1,87 @@
 # app/utils/sftp_client.py
 import paramiko
-from io import BytesIO
-from charset_normalizer import from_bytes
+import stat
+import time
+from io import BytesIO, RawIOBase, SEEK_SET, SEEK_CUR, SEEK_END
 import logging
+from app.config import (
+    ENCODING_SAMPLE_SIZE, SFTP_KEEPALIVE_S, SFTP_WINDOW_SIZE, SFTP_MAX_PACKET_SIZE,
+    SFTP_PREFETCH_WINDOW, SFTP_REQUEST_SIZE, SFTP_MAX_REQUESTS,
+)
+from app.utils.encoding import detect_encoding
 
 logger = logging.getLogger("AUTO")
 
 
+class PrefetchReader(RawIOBase):
+    """
+    Lecture d'un fichier SFTP en pipeline : les requêtes READ d'une fenêtre
+    (`window` octets découpés en requêtes de `request_size`, au plus
+    `max_requests` en vol) partent ensemble au lieu d'attendre un aller-retour
+    par bloc. La fenêtre suivante est demandée quand la précédente est
+    consommée : la mémoire reste bornée et une fermeture anticipée (lecture
+    d'un échantillon) ne coûte qu'une fenêtre.
+    """
+
+    def __init__(self, sftp_file, size: int, window: int = SFTP_PREFETCH_WINDOW,
+                 request_size: int = SFTP_REQUEST_SIZE, max_requests: int = SFTP_MAX_REQUESTS):
+        super().__init__()
+        self._file = sftp_file
+        self._file.MAX_REQUEST_SIZE = request_size
+        self.size = size
+        self.window = window
+        self.max_requests = max_requests
+        self._pos = 0
+        self._window = (0, 0)  # [début, fin) de la fenêtre demandée
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset: int, whence: int = SEEK_SET):
+        if whence == SEEK_CUR:
+            offset += self._pos
+        elif whence == SEEK_END:
+            offset += self.size
+        self._pos = max(0, offset)
+        self._file.seek(self._pos)
+        return self._pos
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.size - self._pos
+        out = []
+        while size > 0 and self._pos < self.size:
+            start, end = self._window
+            if not start <= self._pos < end:
+                end = min(self.size, self._pos + self.window)
+                self._file.seek(self._pos)
+                self._file.prefetch(end, self.max_requests)
+                self._window = (self._pos, end)
+            data = self._file.read(min(size, end - self._pos))
+            if not data:
+                break
+            out.append(data)
+            self._pos += len(data)
+            size -= len(data)
+        return b"".join(out)
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+
 class SFTPClient:
     def __init__(self, config: dict):
         """
@@ -23,6 +98,7 @@ class SFTPClient:
         self.config = config
         self.transport = None
         self.sftp = None
+        self.last_used = time.monotonic()
         self._connect()
 
     # -------------------------------------------------------------------------
@@ -30,18 +106,40 @@ class SFTPClient:
         """Établit la connexion SFTP avec gestion des erreurs."""
         try:
             self.transport = paramiko.Transport(
-                (self.config["host"], self.config.get("port", 22))
+                (self.config["host"], self.config.get("port", 22)),
+                default_window_size=SFTP_WINDOW_SIZE,
+                default_max_packet_size=SFTP_MAX_PACKET_SIZE,
             )
             self.transport.connect(
                 username=self.config["user"],
                 password=self.config["password"]
             )
+            # Paquets keepalive : la session survit aux pauses entre deux fichiers
+            self.transport.set_keepalive(SFTP_KEEPALIVE_S)
             self.sftp = paramiko.SFTPClient.from_transport(self.transport)
             logger.info(f"[SFTP] Connexion réussie à {self.config['host']}")
         except Exception as e:
             logger.error(f"[SFTP] Échec de connexion : {e}")
             raise
 
+    # -------------------------------------------------------------------------
+    def is_alive(self, probe: bool = False) -> bool:
+        """
+        La session est-elle utilisable ? `probe` ajoute un aller-retour
+        (stat du dossier courant) pour détecter une connexion coupée sans
+        que le transport l'ait encore remarqué.
+        """
+        if self.transport is None or not self.transport.is_active():
+            return False
+        if not probe:
+            return True
+        try:
+            self.sftp.stat(".")
+            return True
+        except Exception as e:
+            logger.warning(f"[SFTP] Session inutilisable : {e}")
+            return False
+
     # -------------------------------------------------------------------------
     def list_files(self, remote_dir: str = None):
         """Liste les fichiers dans un dossier distant."""
@@ -54,6 +152,21 @@ class SFTPClient:
             logger.error(f"[SFTP] Impossible de lister {directory} : {e}")
             raise
 
+    # -------------------------------------------------------------------------
+    def list_attr(self, remote_dir: str = None):
+        """
+        Liste les fichiers réguliers d'un dossier distant avec leurs
+        attributs (nom, taille, mtime) en un seul aller-retour.
+        """
+        directory = remote_dir or self.config.get("remote_dir", ".")
+        try:
+            entries = [e for e in self.sftp.listdir_attr(directory) if stat.S_ISREG(e.st_mode or 0)]
+            logger.info(f"[SFTP] {len(entries)} fichier(s) trouvé(s) dans {directory}")
+            return entries
+        except Exception as e:
+            logger.error(f"[SFTP] Impossible de lister {directory} : {e}")
+            raise
+
     # -------------------------------------------------------------------------
     def read_file(self, remote_path: str) -> bytes:
         """
@@ -61,7 +174,7 @@ class SFTPClient:
         Ferme automatiquement le handle après lecture.
         """
         try:
-            with self.sftp.open(remote_path, "rb") as remote_file:
+            with self.open_file(remote_path) as remote_file:
                 content = remote_file.read()
             logger.info(f"[SFTP] Lecture réussie du fichier {remote_path} ({len(content)} octets)")
             return content
@@ -73,40 +186,38 @@ class SFTPClient:
             raise
 
     # -------------------------------------------------------------------------
-    def detect_encoding(self, file_bytes: bytes, sample_size: int = 20000) -> str:
+    def detect_encoding(self, file_bytes: bytes, sample_size: int = ENCODING_SAMPLE_SIZE) -> str:
         """
         Détecte l’encodage probable du fichier distant.
-        Utilise un échantillon des premiers bytes pour optimiser la performance.
+        Seul un échantillon borné des premiers bytes est analysé.
         """
         if not isinstance(file_bytes, (bytes, bytearray)):
             raise TypeError("detect_encoding attend des bytes en entrée")
 
         try:
-            sample = file_bytes[:sample_size]
-            result = from_bytes(sample).best()
-
-            if result and getattr(result, "encoding", None):
-                logger.info(
-                    f"[SFTP] Encodage détecté : {result.encoding} "
-                    f"(fiabilité {getattr(result, 'chaos', 'N/A')})"
-                )
-                return result.encoding
-
-            logger.warning("[SFTP] Encodage indéterminé → fallback sur utf-8")
-            return "utf-8"
+            encoding = detect_encoding(file_bytes, sample_size)
+            logger.info(f"[SFTP] Encodage détecté : {encoding}")
+            return encoding
 
         except Exception as e:
             logger.warning(f"[SFTP] Erreur détection encodage ({e}) → utf-8 par défaut")
             return "utf-8"
 
+    # -------------------------------------------------------------------------
+    def file_size(self, remote_path: str) -> int:
+        """Taille du fichier distant en octets (stat, sans lecture)."""
+        return self.sftp.stat(remote_path).st_size
+
     # -------------------------------------------------------------------------
     def open_file(self, remote_path: str):
         """
-        Retourne un objet file-like (à fermer manuellement).
+        Retourne un objet file-like (à fermer manuellement), lu en pipeline
+        par fenêtres préchargées (PrefetchReader).
         À utiliser uniquement si tu veux streamer le contenu.
         """
         try:
-            return self.sftp.open(remote_path, "rb")
+            remote_file = self.sftp.open(remote_path, "rb")
+            return PrefetchReader(remote_file, self.file_size(remote_path))
         except Exception as e:
             logger.error(f"[SFTP] Erreur ouverture fichier {remote_path} : {e}")
             raise
@@ -1,43 +1,79 @@
 import pandas as pd
 import logging
 from io import StringIO
-from charset_normalizer import from_bytes
+from app.config import CSV_ENGINE, ENCODING_SAMPLE_SIZE
+from app.utils.encoding import detect_encoding
+from app.utils.csv_tokenizer import read_stripped_csv
+from app.utils.rejects import TOO_MANY_FIELDS
+from app.schema import CALL_LOGS
+from app.utils.stream_io import iter_blocks
+from app.utils import metrics
 
 logger = logging.getLogger(__name__)
 
 class SFTPCSVReader:
-    def __init__(self, file_like, chunksize=50000, include_comment=False, encoding=None):
+    def __init__(self, file_like, chunksize=50000, include_comment=False, encoding=None, engine=None, rejects=None):
         """
         file_like: objet BytesIO ou fichier ouvert depuis SFTP
+        engine: "c" / "pyarrow" (lecture streaming) ou "python" (ancien chemin)
+        rejects: RejectSink recevant les lignes corrompues (sinon simplement journalisées)
         """
         self.file_like = file_like
         self.chunksize = chunksize
         self.include_comment = include_comment
+        self.engine = engine or CSV_ENGINE
+        self.rejects = rejects
 
         # Détection automatique d'encodage si pas précisé
         self.encoding = encoding or self._detect_encoding()
 
-        # Lire tout le contenu pour Pandas
-        self.file_like.seek(0)
-        self.str_io = StringIO(self.file_like.read().decode(self.encoding, errors="replace"))
+        # Le moteur python a besoin de tout le contenu décodé pour Pandas
+        self.str_io = None
+        if self.engine == "python":
+            self.file_like.seek(0)
+            self.str_io = StringIO(self.file_like.read().decode(self.encoding, errors="replace"))
 
     def _detect_encoding(self):
         self.file_like.seek(0)
-        sample_bytes = self.file_like.read(10000)
+        sample_bytes = self.file_like.read(ENCODING_SAMPLE_SIZE)
+        self.file_like.seek(0)
+        encoding = detect_encoding(sample_bytes)
+        logger.info(f"[SFTP] Encodage détecté : {encoding}")
+        return encoding
+
+    def _get_chunks_tokenized(self):
+        """
+        Lecture streaming du fichier distant : COMMENTAIRE est retiré au niveau
+        octets puis les chunks sont parsés par le moteur C ou pyarrow, directement
+        aux noms et types du schéma CALL_LOGS.
+        """
         self.file_like.seek(0)
-        result = from_bytes(sample_bytes).best()
-        if result:
-            logger.info(f"[SFTP] Encodage détecté : {result.encoding} (fiabilité {result.chaos})")
-            return result.encoding
-        else:
-            logger.warning("[SFTP] Impossible de détecter l’encodage, fallback en utf-8")
-            return "utf-8"
+        yield from read_stripped_csv(
+            iter_blocks(self.file_like),
+            self.encoding,
+            engine=self.engine,
+            chunksize=self.chunksize,
+            column=None if self.include_comment else "COMMENTAIRE",
+            rejects=self.rejects,
+            schema=CALL_LOGS,
+            keep_default_na=False,
+            na_values=["", "NA", "NULL"],
+            quotechar='"',
+            doublequote=True,
+            encoding_errors="replace",
+            on_bad_lines="warn",
+        )
 
     def get_chunks(self):
         """
         Retourne un générateur de chunks Pandas, en excluant la colonne COMMENTAIRE.
-        Les lignes “problématiques” sont sauvegardées dans un fichier CSV séparé.
+        Les lignes “problématiques” sont écartées et mises en quarantaine au fil
+        de l'eau (RejectSink) : rien n'est accumulé en mémoire.
         """
+        if self.engine != "python":
+            yield from self._get_chunks_tokenized()
+            return
+
         # Détecter colonnes si on veut exclure COMMENTAIRE
         usecols = None
         if not self.include_comment:
@@ -45,35 +81,25 @@ class SFTPCSVReader:
             usecols = [c for c in header.columns if c.strip().upper() != "COMMENTAIRE"]
 
         self.str_io.seek(0)
-        bad_lines = []
 
         def on_bad_lines(bad_line):
             line_str = ",".join(bad_line) if isinstance(bad_line, list) else str(bad_line)
             logger.warning(f"[SFTP] Ligne corrompue détectée : {line_str}")
-            bad_lines.append(line_str)
-            return bad_line  # renvoyer pour l’inclure dans le chunk
+            metrics.count("bad_lines")
+            if self.rejects is not None:
+                self.rejects.add(None, TOO_MANY_FIELDS, line_str)
+            return None  # ligne ignorée
 
-        try:
-            for chunk in pd.read_csv(
-                self.str_io,
-                chunksize=self.chunksize,
-                dtype=str,
-                keep_default_na=False,
-                na_values=["", "NA", "NULL"],
-                engine="python",
-                quotechar='"',
-                doublequote=True,
-                escapechar="\\",
-                usecols=usecols,
-                on_bad_lines=on_bad_lines
-            ):
-                yield chunk
-        finally:
-            # sauvegarder lignes corrompues
-            if bad_lines:
-                ts = pd.Timestamp.now().strftime("%Y%m%d_%H%M%S")
-                error_file = f"sftp_bad_lines_{ts}.csv"
-                with open(error_file, "w", encoding="utf-8") as f:
-                    for line in bad_lines:
-                        f.write(line + "\n")
-                logger.warning(f"[SFTP] Lignes corrompues sauvegardées dans {error_file}")
+        yield from pd.read_csv(
+            self.str_io,
+            chunksize=self.chunksize,
+            dtype=str,
+            keep_default_na=False,
+            na_values=["", "NA", "NULL"],
+            engine="python",
+            quotechar='"',
+            doublequote=True,
+            escapechar="\\",
+            usecols=usecols,
+            on_bad_lines=on_bad_lines
+        )
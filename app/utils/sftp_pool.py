@@ -0,0 +1,86 @@
+# app/utils/sftp_pool.py
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from app.config import SFTP_CONFIG, SFTP_POOL_SIZE, SFTP_KEEPALIVE_S, SFTP_IDLE_TIMEOUT_S
+from app.utils.sftp_client import SFTPClient
+
+logger = logging.getLogger("AUTO")
+
+
+class SFTPPool:
+    """
+    Sessions SFTP réutilisées d'un fichier à l'autre : l'échange de clés et
+    l'authentification ne sont payés qu'à la première connexion. Au plus
+    `size` sessions inactives sont conservées ; une session inactive depuis
+    plus de `idle_timeout` secondes est fermée, et une session restée inactive
+    plus longtemps que l'intervalle de keepalive est vérifiée (aller-retour)
+    avant d'être reprise.
+    """
+
+    def __init__(self, config: dict = SFTP_CONFIG, size: int = SFTP_POOL_SIZE,
+                 idle_timeout: int = SFTP_IDLE_TIMEOUT_S, factory=SFTPClient):
+        self.config = config
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.factory = factory
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def _acquire(self):
+        while True:
+            with self._lock:
+                client = self._idle.pop() if self._idle else None
+            if client is None:
+                break
+            idle = time.monotonic() - client.last_used
+            if idle <= self.idle_timeout and client.is_alive(probe=idle > SFTP_KEEPALIVE_S):
+                self.reused += 1
+                return client
+            client.close()
+
+        client = self.factory(self.config)
+        self.created += 1
+        return client
+
+    def _release(self, client):
+        client.last_used = time.monotonic()
+        with self._lock:
+            if client.is_alive() and len(self._idle) < self.size:
+                self._idle.append(client)
+                return
+        client.close()
+
+    @contextmanager
+    def session(self):
+        """Emprunte une session SFTP ; elle est rendue au pool à la sortie."""
+        client = self._acquire()
+        try:
+            yield client
+        except Exception:
+            # Erreur en cours d'usage : la session n'est gardée que si elle répond
+            if client.is_alive(probe=True):
+                self._release(client)
+            else:
+                client.close()
+            raise
+        self._release(client)
+
+    def stats(self) -> dict:
+        with self._lock:
+            idle = len(self._idle)
+        return {"idle": idle, "max_idle": self.size, "created": self.created, "reused": self.reused}
+
+    def close(self):
+        """Ferme toutes les sessions inactives (arrêt de l'application)."""
+        with self._lock:
+            clients, self._idle = list(self._idle), deque()
+        for client in clients:
+            client.close()
+
+
+sftp_pool = SFTPPool()
@@ -0,0 +1,60 @@
+# app/utils/sftp_watch.py
+import json
+import logging
+import os
+import tempfile
+import threading
+from app.config import SFTP_WATCH_CACHE_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteFileCache:
+    """
+    Dernières métadonnées (taille, mtime) vues pour chaque fichier distant
+    traité, persistées en JSON. Un fichier dont la taille et le mtime n'ont
+    pas bougé depuis n'est ni rouvert ni recherché en base.
+    """
+
+    def __init__(self, path: str = SFTP_WATCH_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None
+        self._dirty = False
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            try:
+                with open(self.path) as f:
+                    self._entries = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def changed(self, remote_path: str, size: int, mtime: int) -> bool:
+        with self._lock:
+            entry = self._load().get(remote_path)
+        return entry is None or entry.get("size") != size or entry.get("mtime") != mtime
+
+    def remember(self, remote_path: str, size: int, mtime: int):
+        with self._lock:
+            self._load()[remote_path] = {"size": size, "mtime": mtime}
+            self._dirty = True
+
+    def save(self):
+        """Écrit le cache (une fois par passage, pas à chaque fichier)."""
+        with self._lock:
+            if not self._dirty:
+                return
+            try:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                with os.fdopen(fd, "w") as f:
+                    json.dump(self._entries, f, indent=2)
+                os.replace(tmp, self.path)
+                self._dirty = False
+            except OSError as e:
+                logger.warning(f"[SFTP] Cache de surveillance non sauvegardé : {e}")
+
+
+remote_file_cache = RemoteFileCache()
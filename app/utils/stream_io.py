@@ -0,0 +1,169 @@
+# app/utils/stream_io.py
+import codecs
+import queue
+import threading
+
+# Fins de ligne reconnues par str.splitlines(), hors "\r" (peut précéder un "\n")
+_LINE_BREAKS = "\n\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+
+
+def iter_blocks(file_like, block_size: int = 1024 * 1024):
+    """
+    Lit un objet file-like binaire par blocs de taille bornée.
+    Aucun bloc n'est conservé après avoir été consommé.
+    """
+    while True:
+        block = file_like.read(block_size)
+        if not block:
+            break
+        yield block
+
+
+def iter_decoded_lines(blocks, encoding: str, errors: str = "ignore"):
+    """
+    Décode incrémentalement un flux de blocs bytes et produit les lignes
+    (sans fin de ligne), avec la même sémantique que `str.splitlines()`.
+    Un caractère multi-octets ou un "\\r\\n" à cheval sur deux blocs est géré.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+    pending = ""
+
+    for block in blocks:
+        lines = (pending + decoder.decode(block)).splitlines(keepends=True)
+        # La dernière ligne peut être incomplète, ou un "\r" dont le "\n" arrive au bloc suivant
+        pending = lines.pop() if lines else ""
+        if pending and pending[-1] in _LINE_BREAKS:
+            lines.append(pending)
+            pending = ""
+        for line in lines:
+            yield line.splitlines()[0]
+
+    yield from (pending + decoder.decode(b"", final=True)).splitlines()
+
+
+class IterStream:
+    """
+    Objet file-like en lecture seule alimenté par un itérateur de blocs
+    (str ou bytes). Permet de brancher un générateur directement sur
+    `pd.read_csv` ou `cursor.copy_expert` sans matérialiser le contenu.
+    """
+
+    def __init__(self, iterable, binary: bool = False):
+        self._it = iter(iterable)
+        self._empty = b"" if binary else ""
+        self._leftover = self._empty
+        self.mode = "rb" if binary else "r"
+        self.closed = False
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def writable(self):
+        return False
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data = self._leftover + self._empty.join(self._it)
+            self._leftover = self._empty
+            return data
+
+        pieces = [self._leftover]
+        length = len(self._leftover)
+        while length < size:
+            try:
+                piece = next(self._it)
+            except StopIteration:
+                break
+            pieces.append(piece)
+            length += len(piece)
+
+        data = self._empty.join(pieces)
+        self._leftover = data[size:]
+        return data[:size]
+
+    def readline(self, size=-1):
+        newline = b"\n" if self.mode == "rb" else "\n"
+        pieces = []
+        while True:
+            if not self._leftover:
+                try:
+                    self._leftover = next(self._it)
+                except StopIteration:
+                    break
+            idx = self._leftover.find(newline)
+            if idx >= 0:
+                pieces.append(self._leftover[:idx + 1])
+                self._leftover = self._leftover[idx + 1:]
+                break
+            pieces.append(self._leftover)
+            self._leftover = self._empty
+        return self._empty.join(pieces)
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class BlockChannel:
+    """
+    Canal borné entre un producteur (ex. boucle asyncio qui reçoit un upload)
+    et un consommateur synchrone qui l'itère dans un thread. La file bornée
+    fait contre-pression ; si le consommateur abandonne (`close`), `put`
+    renvoie False au lieu de bloquer indéfiniment.
+    """
+
+    _END = object()
+
+    def __init__(self, maxsize: int = 16):
+        self._q = queue.Queue(maxsize=maxsize)
+        self._closed = threading.Event()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.is_set()
+
+    def try_put(self, block) -> bool:
+        """Dépôt non bloquant ; False si la file est pleine."""
+        try:
+            self._q.put_nowait(block)
+            return True
+        except queue.Full:
+            return False
+
+    def put(self, item) -> bool:
+        while not self._closed.is_set():
+            try:
+                self._q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def finish(self, error: Exception = None):
+        """Signale la fin du flux (ou une erreur à relever côté consommateur)."""
+        self.put(error if error is not None else self._END)
+
+    def close(self):
+        """Appelé par le consommateur : plus aucun bloc ne sera lu."""
+        self._closed.set()
+
+    def __iter__(self):
+        while True:
+            item = self._q.get()
+            if item is self._END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
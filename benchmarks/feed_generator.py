@@ -0,0 +1,152 @@
+"""
+Générateur de fichiers *_VocalCom_Incoming.csv synthétiques, reproductibles
+(graine fixe), pour les benchmarks et les essais d'ingestion.
+
+    python -m benchmarks.feed_generator /tmp/2024-09-02_VocalCom_Incoming.csv \\
+        --rows 500000 --encoding cp1252 --multiline-rate 0.02 --bad-rate 0.001
+"""
+import argparse
+import random
+from datetime import date, datetime, timedelta
+
+HEADER = [
+    "Date Appel", "Heure Appel", "Numero Telephone", "Numero Court", "Duree Appel",
+    "Duree Prise En Charge", "Duree Post Travail Agent", "Indice", "Raccrochage",
+    "Groupe", "COMMENTAIRE",
+]
+GROUPS = ["Accueil", "Facturation", "Réclamations", "Résiliation", "Support Technique", "Équipe Nuit"]
+PHONE_FORMATS = ["+261 34 {a:02d} {b:03d} {c:02d}", "034{a:02d}{b:03d}{c:02d}", "+261-32-{a:02d}-{b:03d}-{c:02d}"]
+WORDS = [
+    "client", "rappel", "demande", "facture", "coupure", "réseau", "déjà", "traité", "à", "vérifier",
+    "transféré", "n°", "dossier", "très", "mécontent", "attente", "ligne", "résolu", "élevé", "après",
+]
+# Caractères propres à cp1252 (absents de latin1) : exercent la bascule d'encodage
+CP1252_ONLY = ["€", "œ", "’", "…"]
+
+BAD_KINDS = ("truncated", "extra_fields", "stray_quote", "bad_values")
+
+
+class FeedGenerator:
+    """
+    Produit les lignes d'un flux VocalCom : heures croissantes sur la
+    journée, groupes accentués, COMMENTAIRE en texte libre (virgules,
+    guillemets doublés et retours à la ligne dans les champs entre
+    guillemets avec `multiline_rate`) et lignes défectueuses avec
+    `bad_rate` (champs manquants ou en trop, guillemet isolé, valeurs
+    invalides).
+    """
+
+    def __init__(self, rows: int, day: date = date(2024, 9, 2), encoding: str = "cp1252",
+                 multiline_rate: float = 0.02, bad_rate: float = 0.0, seed: int = 42):
+        self.rows = rows
+        self.day = day
+        self.encoding = encoding
+        self.multiline_rate = multiline_rate
+        self.bad_rate = bad_rate
+        self.random = random.Random(seed)
+        self._specials = CP1252_ONLY if encoding.lower().replace("-", "") in ("cp1252", "windows1252") else []
+
+    def _comment(self) -> str:
+        rnd = self.random
+        words = rnd.choices(WORDS, k=rnd.randint(0, 14))
+        if self._specials and rnd.random() < 0.05:
+            words.append(rnd.choice(self._specials))
+        text = " ".join(words)
+        if rnd.random() < self.multiline_rate:
+            text = f'{text},\n"{rnd.choice(WORDS)}" {rnd.choice(WORDS)}\r\nsuite, {rnd.choice(WORDS)}'
+        elif rnd.random() < 0.1:
+            text = f"{text}, {rnd.choice(WORDS)}"
+        if any(c in text for c in ',"\n'):
+            return '"' + text.replace('"', '""') + '"'
+        return text
+
+    def _fields(self, index: int) -> list:
+        rnd = self.random
+        start = datetime.combine(self.day, datetime.min.time()) + timedelta(hours=7)
+        moment = start + timedelta(seconds=index * 50_400 // max(self.rows, 1))
+        talk = rnd.randint(0, 900)
+        return [
+            moment.strftime("%Y-%m-%d"),
+            moment.strftime("%H:%M:%S"),
+            rnd.choice(PHONE_FORMATS).format(a=rnd.randint(0, 99), b=rnd.randint(0, 999), c=rnd.randint(0, 99)),
+            str(rnd.choice([100, 101, 102, 205, 310])),
+            str(talk),
+            str(rnd.randint(0, 120) if talk else 0),
+            str(rnd.randint(0, 60)),
+            str(rnd.randint(0, 9)),
+            str(rnd.randint(0, 1)),
+            rnd.choice(GROUPS),
+            self._comment(),
+        ]
+
+    def _corrupt(self, fields: list) -> list:
+        kind = self.random.choice(BAD_KINDS)
+        if kind == "truncated":
+            return fields[:self.random.randint(2, len(fields) - 2)]
+        if kind == "extra_fields":
+            return fields[:-1] + ["texte, non protégé", "par des guillemets"]
+        if kind == "stray_quote":
+            return fields[:-1] + ['commentaire avec un " isolé']
+        fields[0], fields[4] = "2024-13-45", "abc"
+        return fields
+
+    def lines(self):
+        """Lignes du fichier (str, fin de ligne CRLF comprise), en-tête en tête."""
+        yield ",".join(HEADER) + "\r\n"
+        for i in range(self.rows):
+            fields = self._fields(i)
+            if self.bad_rate and self.random.random() < self.bad_rate:
+                fields = self._corrupt(fields)
+            yield ",".join(fields) + "\r\n"
+
+    def blocks(self, lines_per_block: int = 10_000):
+        """Contenu encodé, par blocs bytes."""
+        batch = []
+        for line in self.lines():
+            batch.append(line)
+            if len(batch) >= lines_per_block:
+                yield "".join(batch).encode(self.encoding)
+                batch = []
+        if batch:
+            yield "".join(batch).encode(self.encoding)
+
+    def to_bytes(self) -> bytes:
+        return b"".join(self.blocks())
+
+    def write(self, path: str) -> int:
+        """Écrit le fichier ; retourne sa taille en octets."""
+        size = 0
+        with open(path, "wb") as f:
+            for block in self.blocks():
+                f.write(block)
+                size += len(block)
+        return size
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--encoding", default="cp1252", help="cp1252, latin1 ou utf-8")
+    parser.add_argument("--multiline-rate", type=float, default=0.02, help="part de COMMENTAIRE multi-lignes")
+    parser.add_argument("--bad-rate", type=float, default=0.0, help="part de lignes défectueuses")
+    parser.add_argument("--day", type=date.fromisoformat, default=date(2024, 9, 2))
+    parser.add_argument("--seed", type=int, default=42)
+
+
+def from_arguments(args) -> FeedGenerator:
+    return FeedGenerator(
+        args.rows, day=args.day, encoding=args.encoding,
+        multiline_rate=args.multiline_rate, bad_rate=args.bad_rate, seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génère un fichier VocalCom Incoming synthétique")
+    parser.add_argument("output", help="chemin du CSV à écrire")
+    add_arguments(parser)
+    args = parser.parse_args()
+    size = from_arguments(args).write(args.output)
+    print(f"{args.output} : {args.rows} lignes, {size} octets ({args.encoding})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Banc de mesure du pipeline d'ingestion : débit et pic mémoire par étape,
+sur un flux VocalCom synthétique (voir feed_generator), résultats en JSON.
+
+    python -m benchmarks.run --rows 200000 --encoding cp1252 --bad-rate 0.001
+    python -m benchmarks.run --sink pg --output after.json --compare before.json
+
+Étapes : détection d'encodage, tokeniseur (suppression de COMMENTAIRE),
+CSVReader, SFTPCSVReader, DataCleaner.clean, encodage COPY, COPY puis
+bout en bout. Avec `--sink fake`, le COPY est remplacé par un puits qui
+jette les octets encodés ; avec `--sink pg`, il vise la table configurée
+(DB_*, TABLE_NAME) et chaque import est annulé (rollback) : à lancer sur
+une base de test, les partitions manquantes pouvant y être créées.
+Chaque étape est chronométrée `--repeat` fois (médiane retenue), puis
+exécutée une fois sous tracemalloc pour le pic mémoire (allocations
+Python et numpy).
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+
+from benchmarks.feed_generator import add_arguments, from_arguments
+from app.config import CSV_ENGINE, COPY_FORMAT, ENCODING_SAMPLE_SIZE
+from app.csv_reader import CSVReader
+from app.data_cleaner import DataCleaner
+from app.schema import CALL_LOGS
+from app.utils import metrics
+from app.utils.csv_tokenizer import CommentColumnStripper
+from app.utils.encoding import Utf8Transcoder, detect_encoding
+from app.utils.pg_copy import BinaryCopyEncoder, iter_csv_copy
+from app.utils.sftp_csv_reader import SFTPCSVReader
+from app.utils.stream_io import iter_blocks
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Types de la table d'appels, pour l'encodage COPY binaire sans base (--sink fake)
+FAKE_COLUMN_TYPES = CALL_LOGS.pg_types()
+
+
+class BenchContext:
+    """Fichier généré et options communes aux étapes."""
+
+    def __init__(self, args):
+        self.args = args
+        self.generator = from_arguments(args)
+        self.data = self.generator.to_bytes()
+        fd, self.path = tempfile.mkstemp(suffix="_VocalCom_Incoming.csv")
+        with os.fdopen(fd, "wb") as f:
+            f.write(self.data)
+        self.encoding = args.encoding
+        self.engine = args.engine
+        self.chunksize = args.chunksize
+        self.copy_format = args.copy_format
+        self._parsed = None
+
+    def parsed(self) -> list:
+        """Chunks bruts (avant nettoyage), parsés une seule fois."""
+        if self._parsed is None:
+            reader = CSVReader(self.path, self.chunksize, encoding=self.encoding, engine=self.engine)
+            self._parsed = list(reader.get_chunks())
+        return self._parsed
+
+    def fresh_chunks(self) -> list:
+        # DataCleaner.clean modifie les chunks sur place : copie par exécution
+        return [df.copy() for df in self.parsed()]
+
+    def cleaned_chunks(self) -> list:
+        return [DataCleaner.clean(df) for df in self.fresh_chunks()]
+
+    def encoder(self):
+        if self.copy_format == "binary":
+            return BinaryCopyEncoder(FAKE_COLUMN_TYPES).iter_copy
+        return iter_csv_copy
+
+    def close(self):
+        os.remove(self.path)
+
+
+def _drain(blocks) -> int:
+    return sum(len(b) for b in blocks)
+
+
+def _pg_session(ctx, label: str):
+    from app.config import DB_CONFIG, TABLE_NAME, VIEW_NAME
+    from app.db_writer import DBWriter
+    writer = DBWriter(DB_CONFIG, TABLE_NAME, VIEW_NAME)
+    return writer, writer.session(f"bench_{label}_{time.time_ns()}", ctx.copy_format)
+
+
+# Étapes : nom → (préparation non chronométrée, exécution) ; l'exécution retourne (lignes, octets)
+
+def _encoding(ctx, _):
+    detect_encoding(ctx.data[:ENCODING_SAMPLE_SIZE])
+    return 0, min(len(ctx.data), ENCODING_SAMPLE_SIZE)
+
+
+def _tokenize(ctx, _):
+    stripper = CommentColumnStripper()
+    _drain(stripper.iter_cleaned(iter_blocks(BytesIO(ctx.data))))
+    return stripper.records, len(ctx.data)
+
+
+def _csv_reader(ctx, _):
+    reader = CSVReader(ctx.path, ctx.chunksize, encoding=ctx.encoding, engine=ctx.engine)
+    return sum(len(df) for df in reader.get_chunks()), len(ctx.data)
+
+
+def _sftp_csv_reader(ctx, _):
+    reader = SFTPCSVReader(BytesIO(ctx.data), ctx.chunksize, encoding=ctx.encoding, engine=ctx.engine)
+    return sum(len(df) for df in reader.get_chunks()), len(ctx.data)
+
+
+def _clean(ctx, chunks):
+    return sum(len(DataCleaner.clean(df)) for df in chunks), 0
+
+
+def _encode(ctx, chunks):
+    return sum(len(df) for df in chunks), _drain(ctx.encoder()(chunks))
+
+
+def _copy(ctx, chunks):
+    if ctx.args.sink == "fake":
+        return _encode(ctx, chunks)
+    writer, session = _pg_session(ctx, "copy")
+    with session:
+        rows = session.copy_chunks(chunks)
+        session.rollback()
+    writer.close()
+    return rows, 0
+
+
+def _end_to_end(ctx, _):
+    if ctx.args.sink == "pg":
+        from app.services.ingestion_service import IngestionService
+        writer, session = _pg_session(ctx, "e2e")
+        with session:
+            rows, _ = IngestionService._copy_blocks(
+                session, iter_blocks(BytesIO(ctx.data)), ctx.encoding, "", chunksize=ctx.chunksize
+            )
+            session.rollback()
+        writer.close()
+        return rows, len(ctx.data)
+
+    transcoder = Utf8Transcoder(iter_blocks(BytesIO(ctx.data)), ctx.encoding)
+    chunks = CSVReader.read_blocks(transcoder, ctx.encoding, ctx.chunksize, engine=ctx.engine)
+    rows = [0]
+
+    def cleaned():
+        for df in chunks:
+            df = DataCleaner.clean(df)
+            rows[0] += len(df)
+            yield df
+
+    _drain(ctx.encoder()(cleaned()))
+    return rows[0], len(ctx.data)
+
+
+STAGES = {
+    "encoding": (None, _encoding),
+    "tokenize": (None, _tokenize),
+    "csv_reader": (None, _csv_reader),
+    "sftp_csv_reader": (None, _sftp_csv_reader),
+    "clean": (BenchContext.fresh_chunks, _clean),
+    "encode": (BenchContext.cleaned_chunks, _encode),
+    "copy": (BenchContext.cleaned_chunks, _copy),
+    "end_to_end": (None, _end_to_end),
+}
+
+
+def measure(ctx: BenchContext, name: str, repeat: int, memory: bool = True) -> dict:
+    setup, run = STAGES[name]
+    durations = []
+    for _ in range(repeat):
+        payload = setup(ctx) if setup else None
+        gc.collect()
+        started = time.perf_counter()
+        rows, nbytes = run(ctx, payload)
+        durations.append(time.perf_counter() - started)
+
+    result = {"stage": name, "rows": rows, "bytes": nbytes, "runs_s": [round(d, 4) for d in durations]}
+    seconds = statistics.median(durations)
+    result["seconds"] = round(seconds, 4)
+    result["rows_per_s"] = round(rows / seconds, 1) if rows and seconds else None
+    result["mb_per_s"] = round(nbytes / seconds / 1e6, 2) if nbytes and seconds else None
+
+    if memory:
+        payload = setup(ctx) if setup else None
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run(ctx, payload)
+            result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def stage_breakdown(ctx: BenchContext) -> dict:
+    """Décomposition du bout en bout par les mesures d'ingestion de l'application."""
+    run = metrics.instrumented("bench")(lambda: {"rows": _end_to_end(ctx, None)[0]})
+    return run()["metrics"]["stages"]
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _metadata(ctx: BenchContext) -> dict:
+    try:
+        import pyarrow
+        pyarrow_version = pyarrow.__version__
+    except ImportError:
+        pyarrow_version = None
+    args = ctx.args
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "pyarrow": pyarrow_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "feed": {
+            "rows": args.rows, "bytes": len(ctx.data), "encoding": args.encoding, "day": str(args.day),
+            "multiline_rate": args.multiline_rate, "bad_rate": args.bad_rate, "seed": args.seed,
+        },
+        "engine": ctx.engine, "chunksize": ctx.chunksize, "copy_format": ctx.copy_format,
+        "sink": args.sink, "repeat": args.repeat,
+    }
+
+
+def compare(results: dict, baseline: dict):
+    """Affiche l'évolution débit / mémoire par rapport à un run précédent."""
+    before = {r["stage"]: r for r in baseline["results"]}
+    print(f"\n{'étape':<16} {'lignes/s avant':>15} {'après':>12} {'écart':>8} {'pic Mo avant':>13} {'après':>8}")
+    for r in results["results"]:
+        old = before.get(r["stage"])
+        if old is None:
+            continue
+        speed_old, speed_new = old.get("rows_per_s") or old.get("mb_per_s"), r.get("rows_per_s") or r.get("mb_per_s")
+        delta = f"{(speed_new / speed_old - 1) * 100:+.1f}%" if speed_old and speed_new else "-"
+        print(
+            f"{r['stage']:<16} {speed_old or '-':>15} {speed_new or '-':>12} {delta:>8} "
+            f"{old.get('peak_mb', '-'):>13} {r.get('peak_mb', '-'):>8}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark du pipeline d'ingestion")
+    add_arguments(parser)
+    parser.add_argument("--stages", default=",".join(STAGES), help="étapes à mesurer, séparées par des virgules")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--engine", default=CSV_ENGINE if CSV_ENGINE != "python" else "c", choices=["c", "pyarrow"])
+    parser.add_argument("--chunksize", type=int, default=50_000)
+    parser.add_argument("--copy-format", default=COPY_FORMAT, choices=["csv", "binary"])
+    parser.add_argument("--sink", default="fake", choices=["fake", "pg"], help="puits du COPY")
+    parser.add_argument("--no-memory", action="store_true", help="sans passe tracemalloc")
+    parser.add_argument("--output", help=f"fichier JSON (défaut : {RESULTS_DIR}/<date>.json)")
+    parser.add_argument("--compare", help="JSON d'un run précédent à comparer")
+    args = parser.parse_args(argv)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f"étapes inconnues : {', '.join(unknown)}")
+
+    ctx = BenchContext(args)
+    try:
+        print(f"[BENCH] {args.rows} lignes, {len(ctx.data) / 1e6:.1f} Mo ({args.encoding}), moteur {ctx.engine}")
+        results = {"meta": _metadata(ctx), "results": []}
+        for name in stages:
+            result = measure(ctx, name, args.repeat, memory=not args.no_memory)
+            results["results"].append(result)
+            print(
+                f"[BENCH] {name:<16} {result['seconds']:>8.3f} s  "
+                f"{result['rows_per_s'] or '-':>12} lignes/s  {result['mb_per_s'] or '-':>8} Mo/s  "
+                f"pic {result.get('peak_mb', '-')} Mo"
+            )
+        if "end_to_end" in stages:
+            results["end_to_end_stages"] = stage_breakdown(ctx)
+    finally:
+        ctx.close()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"[BENCH] Résultats enregistrés dans {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import io
+
+import pandas as pd
+import pytest
+
+from app.utils.csv_tokenizer import (
+    CommentColumnStripper, iter_record_segments, read_stripped_csv, scan_quotes, split_record,
+)
+
+HEADER = b"DATE,NUMERO,COMMENTAIRE,DUREE\r\n"
+
+
+class ListRejects:
+    """RejectSink minimal : garde (ligne, motif, enregistrement)."""
+
+    def __init__(self):
+        self.rows = []
+
+    def add(self, line, reason, record):
+        self.rows.append((line, reason, record))
+
+
+def records(data: bytes, block_size: int = None, escape=b"\\"):
+    blocks = [data] if block_size is None else [data[i:i + block_size] for i in range(0, len(data), block_size)]
+    return list(CommentColumnStripper(escape=escape).iter_records(iter(blocks)))
+
+
+def stripped(data: bytes, block_size: int = None, rejects=None) -> bytes:
+    blocks = [data] if block_size is None else [data[i:i + block_size] for i in range(0, len(data), block_size)]
+    return b"".join(CommentColumnStripper(rejects=rejects).iter_cleaned(iter(blocks)))
+
+
+def test_split_record_quoted_commas_and_doubled_quotes():
+    assert split_record(b'1,"a, b",c') == [b"1", b'"a, b"', b"c"]
+    assert split_record(b'1,"il a dit ""non"", puis",c') == [b"1", b'"il a dit ""non"", puis"', b"c"]
+    assert split_record(b'"",x,""""') == [b'""', b"x", b'""""']
+
+
+def test_split_record_escaped_quote_and_comma():
+    assert split_record(b'1,"a \\" b, c",d') == [b"1", b'"a \\" b, c"', b"d"]
+    assert split_record(b"1,a\\,b,c") == [b"1", b"a\\,b", b"c"]
+    assert split_record(b"1,a\\,b,c", escape=None) == [b"1", b"a\\", b"b", b"c"]
+
+
+def test_split_record_stray_quote_is_literal():
+    assert split_record(b'1,un " isol\xc3\xa9,3') == [b"1", b'un " isol\xc3\xa9', b"3"]
+
+
+@pytest.mark.parametrize("line, quoted, expected", [
+    (b"a,b,c", False, False),
+    (b'a,"b,c', False, True),
+    (b'a,"b",c', False, False),
+    (b'a,un " isol\xc3\xa9', False, False),
+    (b'suite ""x"" fin",c', True, False),
+    (b'suite ""x""', True, True),
+    (b'a,"b \\" c', False, True),
+])
+def test_scan_quotes(line, quoted, expected):
+    assert scan_quotes(line, quoted) is expected
+
+
+def test_crlf_inside_quoted_field():
+    data = HEADER + b'2024-09-02,034,"ligne 1\r\nligne 2",12\r\n2024-09-02,035,ok,7\r\n'
+    assert records(data) == [
+        HEADER.rstrip(),
+        b'2024-09-02,034,"ligne 1\r\nligne 2",12',
+        b"2024-09-02,035,ok,7",
+    ]
+    assert stripped(data) == b"DATE,NUMERO,DUREE\n2024-09-02,034,12\n2024-09-02,035,7\n"
+
+
+def test_quote_straddling_block_boundary():
+    data = HEADER + b'2024-09-02,034,"a ""b"", c\r\nsuite",12\r\n2024-09-02,035,"x,y",7\r\n'
+    expected = stripped(data)
+    for block_size in range(1, len(data) + 1):
+        assert stripped(data, block_size) == expected, block_size
+
+
+def test_stray_quote_does_not_swallow_following_lines():
+    data = (HEADER
+            + b'2024-09-02,034,commentaire avec un " isol\xc3\xa9,12\r\n'
+            + b"2024-09-02,035,ok,7\r\n"
+            + b'2024-09-02,036,"vrai, champ",9\r\n')
+    rejects = ListRejects()
+    assert stripped(data, rejects=rejects) == (
+        b"DATE,NUMERO,DUREE\n2024-09-02,034,12\n2024-09-02,035,7\n2024-09-02,036,9\n"
+    )
+    assert rejects.rows == []
+
+
+def test_unclosed_quote_falls_back_to_line_by_line():
+    lines = [b"2024-09-02,%03d,ok,1" % i for i in range(300)]
+    data = HEADER + b'2024-09-02,999,"jamais ferm\xc3\xa9,1\r\n' + b"\r\n".join(lines) + b"\r\n"
+    out = stripped(data, rejects=ListRejects()).split(b"\n")
+    assert b"2024-09-02,299,1" in out
+
+
+def test_unquoted_commas_go_to_stripped_column():
+    rejects = ListRejects()
+    data = HEADER + b"2024-09-02,034,texte, non, prot\xc3\xa9g\xc3\xa9,12\r\n2024-09-02,035\r\n"
+    assert stripped(data, rejects=rejects) == b"DATE,NUMERO,DUREE\n2024-09-02,034,12\n"
+    assert [(line, reason) for line, reason, _ in rejects.rows] == [(3, "missing_fields")]
+
+
+def test_record_segments_end_on_record_boundaries():
+    data = HEADER + b"".join(
+        b'2024-09-02,%03d,"multi\r\nligne, %d",1\r\n' % (i, i) for i in range(50)
+    )
+    blocks = [data[i:i + 37] for i in range(0, len(data), 37)]
+    segments = list(iter_record_segments(iter(blocks), 100))
+    assert b"".join(segments) == data
+    for segment in segments:
+        assert not scan_quotes(segment.replace(b"\r\n", b" ").replace(b"\n", b" "))
+
+
+LEGACY_CSV = (
+    b"DATE,NUMERO,COMMENTAIRE,DUREE\r\n"
+    b'2024-09-02,034,"il a dit ""stop"", puis raccroche",10\r\n'
+    b'2024-09-02,035,"il a dit \\"stop\\", \\"encore\\"",11\r\n'
+    b'2024-09-02,036,"sur\r\ndeux lignes",12\r\n'
+    b'2024-09-02,037,un " isol\xc3\xa9,13\r\n'
+    b"2024-09-02,038,,14\r\n"
+)
+
+
+@pytest.mark.parametrize("engine", ["c", "pyarrow"])
+@pytest.mark.parametrize("column", ["COMMENTAIRE", None])
+def test_read_stripped_csv_matches_legacy_reader(engine, column):
+    if engine == "pyarrow":
+        pytest.importorskip("pyarrow")
+    legacy = pd.read_csv(
+        io.BytesIO(LEGACY_CSV), engine="python", dtype=str, keep_default_na=False, na_values=[""],
+        quotechar='"', doublequote=True, escapechar="\\",
+    )
+    if column:
+        legacy = legacy.drop(columns=column)
+    blocks = [LEGACY_CSV[i:i + 16] for i in range(0, len(LEGACY_CSV), 16)]
+    chunks = read_stripped_csv(
+        iter(blocks), "utf-8", engine=engine, chunksize=2, column=column,
+        dtype=str, keep_default_na=False, na_values=[""],
+    )
+    result = pd.concat(chunks, ignore_index=True)
+    pd.testing.assert_frame_equal(result, legacy, check_dtype=False)
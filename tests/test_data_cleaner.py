@@ -0,0 +1,55 @@
+import io
+
+import pandas as pd
+import pytest
+
+from app.csv_reader import CSVReader
+from app.data_cleaner import DataCleaner
+from benchmarks.feed_generator import FeedGenerator
+
+EDGE_CSV = (
+    "Date Appel,Heure Appel,Numero Telephone,Numero Court,Duree Appel,Duree Prise En Charge,"
+    "Duree Post Travail Agent,Indice,Raccrochage,Groupe,COMMENTAIRE\n"
+    "2024-09-02,08:00:01,+261 34 12 345 67,100,0,1,2,3,1, Accueil ,ok\n"
+    " 2024-09-03 ,23:59:59, 034-12 , 205 ,12,1,2,3,0,Équipe Nuit,\n"
+    ",10:00:00,abc,x,-3,1,2,3,1,,\n"
+    "pas une date,11:00:00,,,1e3,1,2,3,0,NA,\n"
+    "2024-12-30,,0,3.0, ,1,2,3,,Support,\n"
+    "2024-02-29,7:5:3,NULL,101,9,,,,1,Accueil,\n"
+)
+
+
+def read_legacy(data: bytes) -> pd.DataFrame:
+    """Lecture du chemin historique (moteur python, tout en texte)."""
+    return pd.read_csv(
+        io.BytesIO(data), dtype=str, keep_default_na=False, na_values=["", "NA", "NULL"],
+        engine="python", quotechar='"', doublequote=True, escapechar="\\",
+        on_bad_lines=lambda fields: None,
+    ).drop(columns="COMMENTAIRE")
+
+
+def test_clean_matches_legacy_on_edge_values():
+    raw = read_legacy(EDGE_CSV.encode("utf-8"))
+    pd.testing.assert_frame_equal(DataCleaner.clean(raw.copy()), DataCleaner.clean_legacy(raw))
+
+
+@pytest.mark.parametrize("seed", [1, 7])
+def test_clean_matches_legacy_on_generated_feed(seed):
+    raw = read_legacy(FeedGenerator(2000, encoding="utf-8", bad_rate=0.02, seed=seed).to_bytes())
+    pd.testing.assert_frame_equal(DataCleaner.clean(raw.copy()), DataCleaner.clean_legacy(raw))
+
+
+def test_clean_legacy_leaves_input_untouched():
+    raw = read_legacy(EDGE_CSV.encode("utf-8"))
+    before = raw.copy()
+    DataCleaner.clean_legacy(raw)
+    pd.testing.assert_frame_equal(raw, before)
+
+
+def test_schema_chunks_clean_like_legacy():
+    """Chunks lus au schéma par le tokeniseur : mêmes valeurs que le chemin historique."""
+    data = FeedGenerator(3000, encoding="utf-8", multiline_rate=0.05, seed=3).to_bytes()
+    legacy = DataCleaner.clean_legacy(read_legacy(data))
+    chunks = CSVReader.read_blocks([data[i:i + 4096] for i in range(0, len(data), 4096)], "utf-8", chunksize=700)
+    result = pd.concat([DataCleaner.clean(chunk) for chunk in chunks], ignore_index=True)
+    pd.testing.assert_frame_equal(result, legacy, check_dtype=False)
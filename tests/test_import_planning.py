@@ -0,0 +1,256 @@
+import hashlib
+import io
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import ingestion_service
+from app.services.ingestion_service import IngestionService
+from app.utils.fingerprint import ContentDigest, read_range
+
+HEADER = b"Date Appel,Heure Appel,Numero Telephone\r\n"
+BODY = b"".join(b"2024-09-02,08:%02d:00,034%07d\r\n" % (i % 60, i) for i in range(40))
+DATA = HEADER + BODY
+
+
+def sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def digest_of(*blocks) -> ContentDigest:
+    digest = ContentDigest()
+    for block in blocks:
+        digest.update(block)
+    return digest
+
+
+def opener(data: bytes):
+    return lambda: io.BytesIO(data)
+
+
+class FakeWriter:
+    """DBWriter réduit aux empreintes utilisées par le planificateur (imported_files, checkpoints)."""
+
+    def __init__(self, imports=None, checkpoint=None):
+        self.imports = imports or {}  # nom → contenu importé
+        self.checkpoint = checkpoint
+        self.logged, self.updated = [], []
+
+    def find_import(self, file_name):
+        data = self.imports.get(file_name)
+        if data is None:
+            return None
+        return SimpleNamespace(byte_length=len(data), content_hash=sha(data))
+
+    def has_size(self, byte_length):
+        return any(len(d) == byte_length for d in self.imports.values())
+
+    def find_by_content(self, content_hash, byte_length):
+        return next((n for n, d in self.imports.items() if sha(d) == content_hash and len(d) == byte_length), None)
+
+    def log_import(self, file_name, content_hash=None, byte_length=None, row_count=None):
+        self.logged.append((file_name, content_hash, byte_length, row_count))
+
+    def update_fingerprint(self, file_name, content_hash, byte_length):
+        self.updated.append((file_name, content_hash, byte_length))
+
+    def find_checkpoint(self, file_name):
+        return self.checkpoint
+
+
+class FakeSession:
+    def __init__(self):
+        self.resumed, self.checkpoints = None, []
+
+    def resume(self, checkpoint):
+        self.resumed = checkpoint
+
+    def checkpoint(self, byte_offset, prefix_hash):
+        self.checkpoints.append((byte_offset, prefix_hash))
+
+
+def plan(writer, file_name, data):
+    return IngestionService._plan_import(writer, file_name, len(data), opener(data))
+
+
+# --- ContentDigest -----------------------------------------------------------
+
+@pytest.mark.parametrize("block_size", [1, 7, len(HEADER) - 1, len(HEADER), 1024])
+def test_digest_does_not_depend_on_block_boundaries(block_size):
+    digest = digest_of(*(DATA[i:i + block_size] for i in range(0, len(DATA), block_size)))
+    assert digest.hexdigest() == sha(DATA)
+    assert digest.length == len(DATA)
+    assert digest.lines == DATA.count(b"\n")
+    assert digest.header == HEADER
+    assert digest.last_byte == b"\n"
+
+
+def test_digest_header_without_newline_and_empty_blocks():
+    digest = digest_of(b"", b"col1,", b"", b"col2")
+    assert digest.header == b"col1,col2"
+    assert digest.length == 9 and digest.lines == 0
+    assert digest.last_byte == b"2"
+    assert digest_of().hexdigest() == sha(b"")
+
+
+def test_digest_copy_is_independent():
+    digest = digest_of(HEADER)
+    clone = digest.copy()
+    clone.update(BODY)
+    assert digest.hexdigest() == sha(HEADER) and digest.length == len(HEADER)
+    assert clone.hexdigest() == sha(DATA) and clone.header == HEADER
+
+
+def test_digest_wrap_relays_blocks():
+    digest = ContentDigest()
+    assert list(digest.wrap([HEADER, BODY])) == [HEADER, BODY]
+    assert digest.hexdigest() == sha(DATA)
+
+
+# --- read_range ----------------------------------------------------------------
+
+@pytest.mark.parametrize("start, end", [(0, None), (0, len(DATA)), (5, 50), (len(HEADER), None), (10, 10),
+                                        (len(DATA) - 3, len(DATA) + 100)])
+def test_read_range(start, end):
+    blocks = list(read_range(io.BytesIO(DATA), start, end, block_size=16))
+    assert b"".join(blocks) == DATA[start:end]
+    assert all(0 < len(b) <= 16 for b in blocks)
+
+
+# --- Planification -------------------------------------------------------------
+
+def test_plan_new_file():
+    result, digest, offset = plan(FakeWriter({"autre.csv": b"x" * 10}), "new.csv", DATA)
+    assert (result, offset) == (None, 0)
+    assert digest.length == 0
+
+
+def test_plan_same_size_but_different_content_is_new():
+    other = DATA[:-3] + b"7\r\n"
+    assert other != DATA
+    result, digest, offset = plan(FakeWriter({"autre.csv": other}), "new.csv", DATA)
+    assert (result, offset) == (None, 0)
+
+
+def test_plan_exact_duplicate_under_another_name():
+    writer = FakeWriter({"original.csv": DATA})
+    result, digest, offset = plan(writer, "copie.csv", DATA)
+    assert result == {"status": "duplicate", "file": "copie.csv", "duplicate_of": "original.csv"}
+    assert digest is None and offset == 0
+    assert writer.logged == [("copie.csv", sha(DATA), len(DATA), 0)]
+
+
+@pytest.mark.parametrize("imported", [DATA, DATA + b"2024-09-02,09:00:00,0340000000\r\n"])
+def test_plan_same_name_not_longer_is_skipped(imported):
+    result, digest, offset = plan(FakeWriter({"f.csv": imported}), "f.csv", DATA)
+    assert result == {"status": "skipped", "file": "f.csv"}
+
+
+def test_plan_appended_file_resumes_after_imported_prefix():
+    prefix = HEADER + BODY[:200]
+    prefix = prefix[:prefix.rindex(b"\n") + 1]
+    result, digest, offset = plan(FakeWriter({"f.csv": prefix}), "f.csv", DATA)
+    assert result is None
+    assert offset == len(prefix)
+    assert digest.hexdigest() == sha(prefix) and digest.length == len(prefix)
+    assert digest.header == HEADER and digest.lines == prefix.count(b"\n")
+
+
+def test_plan_appended_file_identical_to_another_import():
+    prefix = DATA[:DATA.index(b"\n", len(HEADER)) + 1]
+    writer = FakeWriter({"f.csv": prefix, "complet.csv": DATA})
+    result, digest, offset = plan(writer, "f.csv", DATA)
+    assert result == {"status": "duplicate", "file": "f.csv", "duplicate_of": "complet.csv"}
+    assert writer.updated == [("f.csv", sha(DATA), len(DATA))]
+
+
+def test_plan_rewritten_prefix_is_refused():
+    imported = HEADER + BODY[:100].replace(b"034", b"032")
+    imported = imported[:imported.rindex(b"\n") + 1]
+    result, digest, offset = plan(FakeWriter({"f.csv": imported}), "f.csv", DATA)
+    assert result["status"] == "error"
+    assert digest is None and offset == 0
+
+
+def test_plan_prefix_not_ending_on_a_record_is_refused():
+    result, digest, offset = plan(FakeWriter({"f.csv": DATA[:len(HEADER) + 5]}), "f.csv", DATA)
+    assert result["status"] == "error"
+
+
+# --- Ingestion par segments et reprise ---------------------------------------
+
+def ingest(data, checkpoint=None, start=0, digest=None, segment_bytes=None, monkeypatch=None):
+    if segment_bytes is not None:
+        monkeypatch.setattr(ingestion_service, "INGEST_CHECKPOINT_BYTES", segment_bytes)
+    session, calls = FakeSession(), []
+
+    def copy_segment(blocks, encoding, line_offset):
+        calls.append((b"".join(blocks), line_offset))
+        return encoding
+
+    digest = digest or ContentDigest()
+    resumed_from, encoding = IngestionService._ingest_resumable(
+        FakeWriter(checkpoint=checkpoint), session, "f.csv", opener(data), digest, start, "utf-8",
+        copy_segment, block_size=64,
+    )
+    return resumed_from, session, calls, digest
+
+
+def test_ingest_single_segment(monkeypatch):
+    start, session, calls, digest = ingest(DATA, segment_bytes=0, monkeypatch=monkeypatch)
+    assert start == 0
+    assert calls == [(DATA, 0)]
+    assert session.checkpoints == [] and session.resumed is None
+    assert digest.hexdigest() == sha(DATA)
+
+
+def test_ingest_segments_checkpoint_the_copied_prefix(monkeypatch):
+    start, session, calls, digest = ingest(DATA, segment_bytes=300, monkeypatch=monkeypatch)
+    assert len(calls) > 2
+    # Premier segment tel quel, les suivants précédés de l'en-tête
+    assert calls[0][0].startswith(HEADER)
+    assert all(block.startswith(HEADER) and block.count(HEADER) == 1 for block, _ in calls[1:])
+    assert calls[0][0] + b"".join(block[len(HEADER):] for block, _ in calls[1:]) == DATA
+    # Un checkpoint après chaque segment sauf le dernier, sur une fin d'enregistrement
+    assert len(session.checkpoints) == len(calls) - 1
+    for offset, prefix_hash in session.checkpoints:
+        assert DATA[offset - 1:offset] == b"\n"
+        assert prefix_hash == sha(DATA[:offset])
+    # line_offset : lignes de données qui précèdent le segment
+    offsets = [0] + [offset for offset, _ in session.checkpoints]
+    assert [line for _, line in calls] == [max(DATA[:o].count(b"\n") - 1, 0) for o in offsets]
+    assert digest.hexdigest() == sha(DATA)
+
+
+def test_ingest_resumes_from_matching_checkpoint(monkeypatch):
+    offset = DATA.index(b"\n", len(HEADER) + 100) + 1
+    checkpoint = SimpleNamespace(byte_offset=offset, prefix_hash=sha(DATA[:offset]), row_count=3,
+                                 min_date=None, max_date=None)
+    start, session, calls, digest = ingest(DATA, checkpoint, segment_bytes=0, monkeypatch=monkeypatch)
+    assert start == offset
+    assert session.resumed is checkpoint
+    assert calls == [(HEADER + DATA[offset:], DATA[:offset].count(b"\n") - 1)]
+    assert digest.hexdigest() == sha(DATA)
+
+
+def test_ingest_refuses_checkpoint_with_another_prefix(monkeypatch):
+    offset = DATA.index(b"\n", len(HEADER) + 100) + 1
+    checkpoint = SimpleNamespace(byte_offset=offset, prefix_hash=sha(b"autre contenu"), row_count=3,
+                                 min_date=None, max_date=None)
+    with pytest.raises(ValueError, match="checkpoint"):
+        ingest(DATA, checkpoint, segment_bytes=0, monkeypatch=monkeypatch)
+
+
+def test_ingest_appended_bytes_after_planned_prefix(monkeypatch):
+    prefix = DATA[:DATA.index(b"\n", len(HEADER) + 100) + 1]
+    result, digest, offset = plan(FakeWriter({"f.csv": prefix}), "f.csv", DATA)
+    start, session, calls, digest = ingest(DATA, start=offset, digest=digest, segment_bytes=0,
+                                           monkeypatch=monkeypatch)
+    assert start == offset
+    assert calls == [(HEADER + DATA[offset:], prefix.count(b"\n") - 1)]
+    assert digest.hexdigest() == sha(DATA)
+
+
+def test_ingest_empty_file_raises(monkeypatch):
+    with pytest.raises(ValueError, match="vide"):
+        ingest(b"", segment_bytes=0, monkeypatch=monkeypatch)
@@ -0,0 +1,125 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from app import db_writer as db_writer_module
+from app.db_writer import ImportSession
+from app.partitions import _months
+
+
+class FakePartitions:
+    """partition_manager en mémoire : mois créés, et mois dont la création échoue."""
+
+    def __init__(self, failing=()):
+        self.known = set()
+        self.failing = set(failing)
+        self.calls = []
+
+    def is_partitioned(self):
+        return True
+
+    def months(self, low, high):
+        return _months(low, high)
+
+    def missing(self, low, high):
+        return [m for m in self.months(low, high) if m not in self.known]
+
+    def ensure_range(self, low, high):
+        self.calls.append((low, high))
+        for month in self.missing(low, high):
+            if month in self.failing:
+                break
+            self.known.add(month)
+
+
+class FakeConnection:
+    def cursor(self):
+        return None
+
+
+def chunk(start=None, hours=24, undated=0):
+    stamps = list(pd.date_range(start, periods=hours, freq="h")) if start else []
+    stamps += [pd.NaT] * undated
+    return pd.DataFrame({"datetime_appel": pd.Series(stamps, dtype="datetime64[ns]")})
+
+
+def month_of(stamp):
+    return stamp.date().replace(day=1)
+
+
+@pytest.fixture
+def partitions(monkeypatch):
+    partitions = FakePartitions()
+    monkeypatch.setattr(db_writer_module, "partition_manager", partitions)
+    return partitions
+
+
+@pytest.fixture
+def session(monkeypatch):
+    """Session dont chaque COPY est enregistré avec les mois connus à son ouverture."""
+    writer = SimpleNamespace(engine=SimpleNamespace(raw_connection=FakeConnection))
+    session = ImportSession(writer, "2024-09-01_VocalCom_Incoming.csv")
+    session.copies = []
+
+    def fake_copy(chunks):
+        frames = list(chunks)
+        if frames:
+            known = set(db_writer_module.partition_manager.known)
+            session.copies.append((frames, known))
+            session.rows += sum(len(df) for df in frames)
+        return sum(len(df) for df in frames)
+
+    monkeypatch.setattr(session, "_copy", fake_copy)
+    return session
+
+
+def test_single_month_uses_one_copy(partitions, session):
+    rows = session.copy_chunks([chunk("2024-09-01"), chunk("2024-09-10"), chunk("2024-09-20")])
+    assert rows == 72
+    assert len(session.copies) == 1
+    assert len(partitions.calls) == 1
+
+
+def test_new_month_in_a_later_chunk_gets_its_partition_before_its_copy(partitions, session):
+    chunks = [chunk("2024-09-01"), chunk("2024-09-30", hours=48), chunk("2024-11-05"), chunk("2024-09-15")]
+    assert session.copy_chunks(chunks) == 120
+    # Un COPY relancé par mois nouveau, le retour sur un mois connu n'en relance pas
+    assert [len(frames) for frames, _ in session.copies] == [1, 1, 2]
+    for frames, known in session.copies:
+        for df in frames:
+            assert {month_of(s) for s in df["datetime_appel"].dropna()} <= known
+
+
+def test_undated_first_chunk_does_not_block_partition_creation(partitions, session):
+    chunks = [chunk(undated=5), chunk("2024-09-01", undated=2), chunk("2024-10-01")]
+    assert session.copy_chunks(chunks) == 55
+    assert partitions.known == {pd.Timestamp("2024-09-01").date(), pd.Timestamp("2024-10-01").date()}
+    # Lignes sans date copiées en dernier, dans un COPY à part
+    last, _ = session.copies[-1]
+    assert len(last) == 1 and len(last[0]) == 7 and last[0]["datetime_appel"].isna().all()
+    for frames, _ in session.copies[:-1]:
+        assert all(df["datetime_appel"].notna().all() for df in frames)
+
+
+def test_no_partition_creation_once_default_is_written(partitions, session, monkeypatch):
+    monkeypatch.setattr(db_writer_module, "UNDATED_BUFFER_ROWS", 3)
+    session.copy_chunks([chunk("2024-09-01", undated=5), chunk("2024-10-01")])
+    # Partition DEFAULT verrouillée par la transaction : octobre attendra la validation
+    assert len(partitions.calls) == 1
+    assert session.rows == 53
+
+
+def test_failed_creation_is_not_retried_within_the_transaction(partitions, session):
+    partitions.failing.add(pd.Timestamp("2024-10-01").date())
+    session.copy_chunks([chunk("2024-09-30", hours=48), chunk("2024-12-01")])
+    # Octobre a échoué : ses lignes sont dans DEFAULT, décembre attendra la validation
+    assert len(partitions.calls) == 1
+    assert session.rows == 72
+
+
+def test_unpartitioned_table_is_left_alone(partitions, session, monkeypatch):
+    monkeypatch.setattr(partitions, "is_partitioned", lambda: False)
+    session.copy_chunks([chunk(undated=3), chunk("2024-09-01"), chunk("2024-12-01")])
+    assert partitions.calls == []
+    assert len(session.copies) == 1
@@ -0,0 +1,157 @@
+import json
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import query_service
+from app.services.query_service import QueryService, decode_cursor, encode_cursor
+
+COLUMNS = ["id", "datetime_appel", "groupe"]
+START = datetime(2024, 9, 2, 8, 0, 0)
+# Horodatages en double (même seconde) : l'id départage
+ROWS = [(i, START + timedelta(seconds=i // 3, microseconds=250 if i % 7 == 0 else 0), f"g{i % 2}")
+        for i in range(1, 23)]
+
+
+@pytest.mark.parametrize("timestamp, row_id", [
+    (datetime(2024, 9, 2, 8, 0, 0), 1),
+    (datetime(2024, 9, 2, 23, 59, 59, 999999), 2 ** 62),
+    (datetime(2024, 9, 2, 8, 0, 0, tzinfo=timezone.utc), 0),
+    (datetime(1999, 12, 31, 0, 0, 0, 1), 7),
+])
+def test_cursor_round_trip(timestamp, row_id):
+    cursor = encode_cursor(timestamp, row_id)
+    assert "=" not in cursor and "/" not in cursor and "+" not in cursor
+    assert decode_cursor(cursor) == (timestamp, row_id)
+
+
+@pytest.mark.parametrize("cursor", ["", "pas-un-curseur", encode_cursor(START, 1)[:-3], "W10", "WyJ4IiwgMV0"])
+def test_decode_cursor_rejects_garbage(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+class FakeCursor:
+    """Curseur serveur : applique la condition keyset, l'ordre et la limite de la requête."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.itersize = None
+        self.closed = False
+
+    def execute(self, sql, params):
+        descending = "DESC" in sql
+        rows = sorted(self.rows, key=lambda r: (r[1], r[0]), reverse=descending)
+        if "after_ts" in params:
+            after = (params["after_ts"], params["after_id"])
+            rows = [r for r in rows if ((r[1], r[0]) < after if descending else (r[1], r[0]) > after)]
+        self.result = rows[:params["limit"]]
+        self.description = [SimpleNamespace(name=c) for c in COLUMNS]
+
+    def fetchmany(self, size):
+        out, self.result = self.result[:size], self.result[size:]
+        return out
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.cursors = []
+        self.rows = rows
+        self.closed = False
+
+    def cursor(self, name=None):
+        self.cursors.append(FakeCursor(self.rows))
+        return self.cursors[-1]
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+
+    def raw_connection():
+        opened.append(FakeConnection(ROWS))
+        return opened[-1]
+
+    monkeypatch.setattr(query_service, "get_engine", lambda: SimpleNamespace(raw_connection=raw_connection))
+    monkeypatch.setattr(QueryService, "_columns", COLUMNS)
+    return opened
+
+
+def read_page(**kwargs):
+    lines = [json.loads(line) for line in b"".join(QueryService.stream_ndjson(**kwargs)).decode().splitlines()]
+    return lines[:-1], lines[-1]["_page"]
+
+
+@pytest.mark.parametrize("order", ["desc", "asc"])
+@pytest.mark.parametrize("limit, fetch_size", [(1, 1), (4, 2), (5, 3), (7, 50), (22, 5), (50, 4)])
+def test_pages_cover_every_row_exactly_once(connections, order, limit, fetch_size):
+    served, cursor, pages = [], None, 0
+    while True:
+        rows, page = read_page(limit=limit, fetch_size=fetch_size, order=order, cursor=cursor)
+        assert page["rows"] == len(rows) <= limit
+        served += rows
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+        assert len(rows) == limit
+        assert decode_cursor(cursor) == (datetime.fromisoformat(rows[-1]["datetime_appel"]), rows[-1]["id"])
+    expected = sorted(ROWS, key=lambda r: (r[1], r[0]), reverse=order == "desc")
+    assert [r["id"] for r in served] == [r[0] for r in expected]
+    assert pages == -(-len(ROWS) // limit)  # une page pleine en fin de résultat n'annonce pas de suite
+    assert all(c.closed for c in connections)
+
+
+def test_last_page_exactly_full_has_no_cursor_when_nothing_follows(connections):
+    rows, page = read_page(limit=len(ROWS))
+    assert page == {"rows": len(ROWS), "next_cursor": None}
+
+
+def test_empty_result_still_ends_with_page_line(connections, monkeypatch):
+    monkeypatch.setattr(query_service, "get_engine",
+                        lambda: SimpleNamespace(raw_connection=lambda: FakeConnection([])))
+    rows, page = read_page(limit=10)
+    assert rows == [] and page == {"rows": 0, "next_cursor": None}
+
+
+def test_projection_keeps_only_requested_columns(connections):
+    rows, page = read_page(limit=3, columns=["groupe"])
+    assert [list(r) for r in rows] == [["groupe"]] * 3
+    third = sorted(ROWS, key=lambda r: (r[1], r[0]), reverse=True)[2]
+    assert decode_cursor(page["next_cursor"]) == (third[1], third[0])
+
+
+def test_connection_is_borrowed_lazily(connections):
+    stream = QueryService.stream_ndjson(limit=5)
+    assert connections == []
+    next(stream)
+    stream.close()
+    assert len(connections) == 1 and connections[0].closed
+
+
+@pytest.mark.parametrize("kwargs", [{"limit": 0}, {"order": "sideways"}, {"columns": ["inconnue"]},
+                                    {"cursor": "pas-un-curseur"}])
+def test_invalid_arguments_fail_before_any_connection(connections, kwargs):
+    with pytest.raises(ValueError):
+        QueryService.stream_ndjson(**{"limit": 5, **kwargs})
+    assert connections == []
+
+
+def test_build_keyset_condition_breaks_ties_on_id(connections):
+    cursor = encode_cursor(START, 9)
+    sql, params, _ = QueryService.build(cursor=cursor, order="desc", limit=10)
+    assert "(datetime_appel, id) < (%(after_ts)s, %(after_id)s)" in sql
+    assert "ORDER BY datetime_appel DESC, id DESC" in sql
+    assert (params["after_ts"], params["after_id"], params["limit"]) == (START, 9, 11)
+    sql, params, _ = QueryService.build(cursor=cursor, order="asc", limit=10)
+    assert "(datetime_appel, id) > (%(after_ts)s, %(after_id)s)" in sql
@@ -0,0 +1,95 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import retry_service as retry_module
+from app.services.retry_service import RetryService
+
+
+class FakeRetryTable:
+    """ingest_retries en mémoire : juste ce que `schedule` lit et écrit."""
+
+    def __init__(self):
+        self.rows = {}
+
+    @contextmanager
+    def begin(self):
+        yield self
+
+    def execute(self, statement, params=None):
+        sql = " ".join(str(statement).split())
+        row = self.rows.setdefault(params["k"], {"attempts": 0, "state": None, "next_attempt_at": None})
+        if sql.startswith("INSERT INTO ingest_retries"):
+            row["attempts"] = row["attempts"] + 1 if row["state"] in ("pending", "running") else 1
+            row["state"] = "pending"
+            return SimpleNamespace(scalar=lambda: row["attempts"])
+        if "SET state = 'failed'" in sql:
+            row["state"], row["next_attempt_at"] = "failed", None
+        elif "SET next_attempt_at" in sql:
+            row["next_attempt_at"] = params["t"]
+        return None
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.jobs = {}
+
+    def add_job(self, func, trigger, run_date, args, id, **kwargs):
+        self.jobs[id] = run_date
+
+
+@pytest.fixture
+def table(monkeypatch):
+    table = FakeRetryTable()
+    monkeypatch.setattr(retry_module, "get_engine", lambda: table)
+    monkeypatch.setattr(retry_module, "init_schema", lambda: None)
+    return table
+
+
+def test_delay_without_jitter_doubles_up_to_the_cap(monkeypatch):
+    service = RetryService(max_attempts=10, base_delay=30, max_delay=600, jitter=0.2)
+    monkeypatch.setattr(retry_module.random, "random", lambda: 0.0)
+    assert [service.delay(n) for n in range(1, 8)] == [30, 60, 120, 240, 480, 600, 600]
+
+
+def test_delay_jitter_stays_within_bounds(monkeypatch):
+    service = RetryService(max_attempts=10, base_delay=30, max_delay=600, jitter=0.2)
+    monkeypatch.setattr(retry_module.random, "random", lambda: 0.999999)
+    assert [round(service.delay(n), 3) for n in (1, 2, 6)] == [24.0, 48.0, 480.0]
+    monkeypatch.undo()
+    for attempt in range(1, 8):
+        nominal = min(600, 30 * 2 ** (attempt - 1))
+        for _ in range(200):
+            assert nominal * 0.8 <= service.delay(attempt) <= nominal
+
+
+def test_schedule_stops_after_max_attempts(table, monkeypatch):
+    monkeypatch.setattr(retry_module.random, "random", lambda: 0.0)
+    service = RetryService(max_attempts=4, base_delay=10, max_delay=600, jitter=0.5)
+    scheduler = FakeScheduler()
+    service._scheduler = scheduler
+
+    results = []
+    for _ in range(4):
+        before = datetime.now()
+        results.append(service.schedule("sftp_file", "sftp_file:/a.csv", {"remote_path": "/a.csv"}, "timeout"))
+        if results[-1]["state"] == "pending":
+            delay = scheduler.jobs["retry:sftp_file:/a.csv"] - before
+            assert timedelta(seconds=10 * 2 ** (len(results) - 1)) <= delay < timedelta(
+                seconds=10 * 2 ** (len(results) - 1) + 1)
+
+    assert [(r["state"], r["attempts"]) for r in results] == [
+        ("pending", 1), ("pending", 2), ("pending", 3), ("failed", 4),
+    ]
+    assert results[-1]["next_attempt_at"] is None
+    assert table.rows["sftp_file:/a.csv"]["state"] == "failed"
+
+
+def test_schedule_after_failure_starts_over(table):
+    service = RetryService(max_attempts=2, base_delay=10, max_delay=600, jitter=0.0)
+    key = "sftp_file:/b.csv"
+    assert service.schedule("sftp_file", key, {}, "e")["attempts"] == 1
+    assert service.schedule("sftp_file", key, {}, "e")["state"] == "failed"
+    assert service.schedule("sftp_file", key, {}, "e")["attempts"] == 1